@@ -6,12 +6,12 @@ try:
 except NameError:
     unicode = basestring = str
     xrange = range
-import re
+import os, re
 
 import numpy as np
 from numpy.core.records import fromarrays
 
-from math import pi, cos
+from math import pi
 
 DEG_PER_HR = 360. / 24.           
 DEG_PER_MIN = DEG_PER_HR / 60.    
@@ -40,6 +40,28 @@ def _radec_to_xyz(ra_deg, dec_deg):
 
     return np.atleast_2d(xyz)
 
+def _distsq_xyz(xyz1, xyz2):
+    """ Squared distances between every pair of points in two (N, 3)
+    and (M, 3) arrays of xyz positions. Returns an (N, M) array.
+
+    The coordinate differences are squared directly (rather than
+    using 2 - 2 * xyz1.xyz2), so small distances are precise.
+    """
+    n, m = len(xyz1), len(xyz2)
+    d2 = np.zeros((n, m))
+    # work on blocks of rows small enough to stay in the CPU cache
+    nrow = max(1, 2**15 // max(m, 1))
+    d = np.empty((nrow, m))
+    xyz2 = xyz2.T.copy()
+    for i in xrange(0, n, nrow):
+        out = d2[i:i+nrow]
+        tmp = d[:len(out)]
+        for k in range(3):
+            np.subtract.outer(xyz1[i:i+nrow, k], xyz2[k], out=tmp)
+            tmp *= tmp
+            out += tmp
+    return d2
+
 def _distsq(ra1, dec1, ra2, dec2):
     """ Find the distance squared in xyz space between two RAs and
     Decs.
@@ -55,15 +77,7 @@ def _distsq(ra1, dec1, ra2, dec2):
     distance_squared: array of floats shape (N, M)
        If N or M is 1, that dimension is suppressed.
     """
-    xyz1 = _radec_to_xyz(ra1, dec1)
-    xyz2 = _radec_to_xyz(ra2, dec2)
-
-    n = xyz1.shape[0]
-    m = xyz2.shape[0]
-    d2 = np.empty((n, m))
-    for i in range(n):
-        d2[i,:] = ((xyz1[i,:] - xyz2)**2).sum(axis=1)
-
+    d2 = _distsq_xyz(_radec_to_xyz(ra1, dec1), _radec_to_xyz(ra2, dec2))
     d2 = d2.squeeze()
     if len(d2.shape) == 0:
         d2 = float(d2)
@@ -73,17 +87,23 @@ def _radians_to_distsq(radians):
     """ Convert to a squared xyz separation from an angle.
 
     The input is the angle in radians. The conversion is done on a
-    unit sphere using the cosine rule.
+    unit sphere, using the chord length 2 sin(angle / 2).
     """
-    return 2 * (1 - np.cos(radians))
+    return (2 * np.sin(0.5 * np.asarray(radians)))**2
 
 def _distsq_to_radians(distsq):
     """ Convert to an angle from a squared xyz separation.
 
     The output angle is in radians. The conversion is done on a unit
-    sphere using the cosine rule.
+    sphere using the chord length, 2 arcsin(chord / 2), which unlike
+    the cosine rule keeps its precision for small separations.
     """
-    return np.arccos(1 - 0.5 * distsq)
+    x = np.sqrt(np.atleast_1d(distsq))
+    x *= 0.5
+    np.minimum(x, 1., out=x)
+    np.arcsin(x, out=x)
+    x *= 2
+    return x[0] if np.ndim(distsq) == 0 else x
 
 def _check_ra_dec(ra, dec):
     """ Check 0 <= RA < 360 and -90 <= Dec <= 90.
@@ -125,24 +145,355 @@ def ang_sep(ra1, dec1, ra2, dec2):
     -------
     separation_in_degrees : array of floats, shape (N, M)
        If N or M is 1, that dimension is suppressed.
+
+    See Also
+    --------
+    ang_sep_blocks : for sets of coordinates too large to hold all
+      the separations in memory.
     """
     _check_ra_dec(ra1, dec1)
     _check_ra_dec(ra2, dec2)
     d2 = _distsq(ra1, dec1, ra2, dec2)
     return DEG_PER_RAD * _distsq_to_radians(d2)
 
+def _block_shape(n, m, maxsize):
+    """ Rows and columns per block for N x M blocks of at most
+    `maxsize` elements."""
+    ncol = int(max(1, min(m, maxsize)))
+    nrow = int(max(1, maxsize // ncol))
+    return nrow, ncol
+
+def ang_sep_blocks(ra1, dec1, ra2, dec2, maxsize=2**22):
+    """ The angular separations between two sets of coordinates, in
+    blocks.
+
+    This gives the same separations as `ang_sep`, but never holds
+    more than one (N, M) block in memory, so it can be used for very
+    large sets of coordinates.
+
+    Parameters
+    ----------
+    ra1, dec1 : arrays of floats, shape (N,)
+       First set of coordinates in degrees.
+    ra2, dec2 : arrays of floats, shape (M,)
+       Second set of coordinates in degrees.
+    maxsize : int (2**22)
+       Maximum number of elements in each block.
+
+    Yields
+    ------
+    i, j, sep : int, int, array of floats shape (n, m)
+       Separations in degrees between coordinates i to i+n in the
+       first set and j to j+m in the second set.
+
+    See Also
+    --------
+    ang_sep_nearest, ang_sep_within
+    """
+    ra1, dec1, ra2, dec2 = (np.atleast_1d(np.asarray(a, float)) for a in
+                            (ra1, dec1, ra2, dec2))
+    _check_ra_dec(ra1, dec1)
+    _check_ra_dec(ra2, dec2)
+    xyz1 = _radec_to_xyz(ra1, dec1)
+    xyz2 = _radec_to_xyz(ra2, dec2)
+    nrow, ncol = _block_shape(len(xyz1), len(xyz2), maxsize)
+    for i in xrange(0, len(xyz1), nrow):
+        for j in xrange(0, len(xyz2), ncol):
+            d2 = _distsq_xyz(xyz1[i:i+nrow], xyz2[j:j+ncol])
+            yield i, j, DEG_PER_RAD * _distsq_to_radians(d2)
+
+def ang_sep_nearest(ra1, dec1, ra2, dec2, maxsize=2**22):
+    """ Find the closest coordinate in a second set to each
+    coordinate in a first set, by checking every pair.
+
+    Parameters
+    ----------
+    ra1, dec1 : arrays of floats, shape (N,)
+       First set of coordinates in degrees.
+    ra2, dec2 : arrays of floats, shape (M,)
+       Second set of coordinates in degrees.
+    maxsize : int (2**22)
+       Maximum number of separations held in memory at once.
+
+    Returns
+    -------
+    ind, sep : arrays of shape (N,)
+       Index of the closest coordinate in the second set, and its
+       separation in degrees.
+
+    See Also
+    --------
+    ang_sep_blocks, match
+    """
+    n = np.size(ra1)
+    ind = np.zeros(n, int)
+    sep = np.empty(n)
+    sep.fill(np.inf)
+    for i, j, s in ang_sep_blocks(ra1, dec1, ra2, dec2, maxsize=maxsize):
+        jmin = s.argmin(axis=1)
+        smin = s[np.arange(len(s)), jmin]
+        better = smin < sep[i:i+len(s)]
+        ind[i:i+len(s)][better] = j + jmin[better]
+        sep[i:i+len(s)][better] = smin[better]
+    return ind, sep
+
+def ang_sep_within(ra1, dec1, ra2, dec2, radius):
+    """ Find all pairs of coordinates closer than a given separation.
+
+    Parameters
+    ----------
+    ra1, dec1 : arrays of floats, shape (N,)
+       First set of coordinates in degrees.
+    ra2, dec2 : arrays of floats, shape (M,)
+       Second set of coordinates in degrees.
+    radius : float
+       Maximum separation in degrees.
+
+    Returns
+    -------
+    i, j, sep : arrays, shape (P,)
+       The indices into the first and second sets of each pair and
+       their separation in degrees, sorted by i then j. This is the
+       sparse (COO) form of the separation matrix for pairs inside
+       `radius`; ``scipy.sparse.coo_matrix((sep, (i, j)), shape=(N,
+       M))`` makes a sparse matrix from it.
+
+    See Also
+    --------
+    ang_sep_blocks, SkyIndex
+    """
+    ra1 = np.atleast_1d(np.asarray(ra1, float))
+    dec1 = np.atleast_1d(np.asarray(dec1, float))
+    _check_ra_dec(ra1, dec1)
+    index = SkyIndex(ra2, dec2, height=radius)
+    out = list(index.pairs(ra1, dec1, radius))
+    if not out:
+        return np.zeros(0, int), np.zeros(0, int), np.zeros(0)
+    i, j, d2 = (np.concatenate(a) for a in zip(*out))
+    isort = np.lexsort((j, i))
+    return i[isort], j[isort], DEG_PER_RAD * _distsq_to_radians(d2[isort])
+
+def radec_to_xyz(ra, dec):
+    """ Unit vectors for RA and Dec coordinates.
+
+    These can be passed to `cone_select` and `annulus_select` to
+    avoid recalculating them when selecting from the same
+    coordinates many times.
+
+    Parameters
+    ----------
+    ra, dec : arrays of floats, shape (N,)
+      RA and Dec in degrees.
+
+    Returns
+    -------
+    xyz : array of floats, shape (N, 3)
+    """
+    return _radec_to_xyz(ra, dec)
+
+def _radius_to_distsq(radius):
+    """ Squared chord length for a radius in degrees, capped at 180
+    degrees."""
+    return _radians_to_distsq(
+        np.minimum(np.asarray(radius, float), 180.) * RAD_PER_DEG)
+
+def cone_select(ra, dec, ra0, dec0, radius, xyz=None):
+    """ Find the coordinates closer than `radius` to a position.
+
+    Parameters
+    ----------
+    ra, dec : arrays of floats, shape (N,)
+      Coordinates in degrees.
+    ra0, dec0 : floats
+      Centre of the cone in degrees.
+    radius : float
+      Cone radius in degrees.
+    xyz : array of floats, shape (N, 3), optional
+      Unit vectors for `ra`, `dec` from `radec_to_xyz`. If given, ra
+      and dec are ignored.
+
+    Returns
+    -------
+    c : array of bool, shape (N,)
+      True for coordinates inside the cone.
+
+    See Also
+    --------
+    annulus_select, box_select, cone_search
+    """
+    return annulus_select(ra, dec, ra0, dec0, 0, radius, xyz=xyz)
+
+def annulus_select(ra, dec, ra0, dec0, rmin, rmax, xyz=None):
+    """ Find the coordinates with rmin <= separation < rmax from a
+    position.
+
+    Parameters
+    ----------
+    ra, dec : arrays of floats, shape (N,)
+      Coordinates in degrees.
+    ra0, dec0 : floats
+      Centre of the annulus in degrees.
+    rmin, rmax : float
+      Inner and outer radii in degrees.
+    xyz : array of floats, shape (N, 3), optional
+      Unit vectors for `ra`, `dec` from `radec_to_xyz`. If given, ra
+      and dec are ignored.
+
+    Returns
+    -------
+    c : array of bool, shape (N,)
+      True for coordinates inside the annulus.
+
+    See Also
+    --------
+    cone_select, box_select, cone_search
+    """
+    if xyz is None:
+        _check_ra_dec(ra, dec)
+        xyz = _radec_to_xyz(ra, dec)
+    _check_ra_dec(ra0, dec0)
+    d2 = _distsq_xyz(xyz, _radec_to_xyz(ra0, dec0))[:, 0]
+    c = d2 < _radius_to_distsq(rmax)
+    if rmin > 0:
+        c &= d2 >= _radius_to_distsq(rmin)
+    return c
+
+def box_select(ra, dec, ra1, ra2, dec1, dec2):
+    """ Find the coordinates inside a box in RA and Dec.
+
+    Parameters
+    ----------
+    ra, dec : arrays of floats, shape (N,)
+      Coordinates in degrees.
+    ra1, ra2 : float
+      RA limits in degrees. If ra1 > ra2, the box crosses RA = 0, so
+      it includes RA >= ra1 and RA <= ra2.
+    dec1, dec2 : float
+      Dec limits in degrees.
+
+    Returns
+    -------
+    c : array of bool, shape (N,)
+      True for coordinates with ra1 <= RA <= ra2 and dec1 <= Dec <=
+      dec2.
+
+    See Also
+    --------
+    cone_select, annulus_select
+    """
+    ra = np.asarray(ra)
+    dec = np.asarray(dec)
+    if ra1 <= ra2:
+        c = (ra1 <= ra) & (ra <= ra2)
+    else:
+        c = (ra1 <= ra) | (ra <= ra2)
+    c &= (dec1 <= dec) & (dec <= dec2)
+    return c
+
+def cone_search(ra, dec, ra0, dec0, radius, rmin=0, index=None,
+                workers=1):
+    """ Find the coordinates inside cones (or annuli) around many
+    positions.
+
+    Parameters
+    ----------
+    ra, dec : arrays of floats, shape (N,)
+      Coordinates in degrees.
+    ra0, dec0 : arrays of floats, shape (M,)
+      Centres of the cones in degrees.
+    radius : float or array of floats, shape (M,)
+      Cone radii in degrees, which can be different for each cone.
+    rmin : float or array of floats, shape (M,)
+      Inner radii in degrees. If > 0, only coordinates with rmin <=
+      separation < radius are selected.
+    index : SkyIndex instance, optional
+      An index of `ra`, `dec`. If given, ra and dec are ignored.
+      Otherwise one is made.
+    workers : int (1)
+      Number of processes to use (see `SkyIndex.pairs`).
+
+    Returns
+    -------
+    indptr, ind : arrays of ints, shapes (M+1,) and (P,)
+      The indices of the coordinates inside cone i are
+      ``ind[indptr[i]:indptr[i+1]]``, in increasing order. This is
+      the compressed sparse row (CSR) format used by scipy.sparse.
+
+    See Also
+    --------
+    cone_select, SkyIndex.cone
+
+    Examples
+    --------
+    >>> indptr, ind = cone_search(ra, dec, qso_ra, qso_dec, 0.1)
+    >>> near_qso0 = ind[indptr[0]:indptr[1]]
+    """
+    ra0 = np.atleast_1d(np.asarray(ra0, float))
+    dec0 = np.atleast_1d(np.asarray(dec0, float))
+    _check_ra_dec(ra0, dec0)
+    m = len(ra0)
+    radius = np.minimum(np.asarray(radius, float), 180.) * np.ones(m)
+    rmin = np.asarray(rmin, float) * np.ones(m)
+    if index is None:
+        _check_ra_dec(ra, dec)
+        height = np.median(radius) if m else None
+        index = SkyIndex(ra, dec, height=height)
+
+    iq, ind = [], []
+    for i, j, d2 in index.pairs(ra0, dec0, radius, workers=workers):
+        c = d2 >= _radius_to_distsq(rmin[i])
+        iq.append(i[c])
+        ind.append(j[c])
+    indptr = np.zeros(m + 1, int)
+    if not iq:
+        return indptr, np.zeros(0, int)
+    iq = np.concatenate(iq)
+    ind = np.concatenate(ind)
+    isort = np.lexsort((ind, iq))
+    np.cumsum(np.bincount(iq, minlength=m), out=indptr[1:])
+    return indptr, ind[isort]
+
+def _seconds_precision(fmt):
+    """ The number of decimal places of the last (seconds) field of a
+    sexigesimal format string, or None if it isn't three %f fields.
+    """
+    fields = re.findall(r'%[-+ 0#]*\d*(\.\d*)?[fF]', fmt)
+    if len(fields) != 3:
+        return None
+    prec = fields[-1]
+    if not prec:
+        return 6
+    return int(prec[1:] or 0)
+
+def _split_sexigesimal(total, prec):
+    """ Split `total` in units of 10**-prec of the smallest unit into
+    the three sexigesimal fields. Seconds that round to 60 are
+    carried into the minutes, as in `ra_dec2s_array`."""
+    scale = 10**prec
+    a, rem = divmod(total, 3600 * scale)
+    b, rem = divmod(rem, 60 * scale)
+    return a, b, rem / scale
+
 def ra_dec2s(ra, raformat='%02.0f %02.0f %06.3f'):
     """ Converts a decimal RA to a sexigesimal string.
 
-    Uses the format given by the raformat keyword
+    Uses the format given by the raformat keyword. Seconds that round
+    to 60 are carried into the minutes (and hours).
     """
     ra = float(ra)
     if not (0.0 <= ra < 360.):
         raise ValueError("RA outside sensible limits: %s" % ra)
 
-    rah, temp = divmod(ra, DEG_PER_HR)
-    ram, temp = divmod(temp, DEG_PER_MIN)
-    ras = temp / DEG_PER_S
+    prec = _seconds_precision(raformat)
+    if prec is None:
+        rah, temp = divmod(ra, DEG_PER_HR)
+        ram, temp = divmod(temp, DEG_PER_MIN)
+        ras = temp / DEG_PER_S
+    else:
+        total = int(round(ra / DEG_PER_S * 10**prec))
+        # 24h rounds to 0h
+        total %= 24 * 3600 * 10**prec
+        rah, ram, ras = _split_sexigesimal(total, prec)
     s_ra = raformat % (rah, ram, ras)
 
     return s_ra
@@ -150,7 +501,8 @@ def ra_dec2s(ra, raformat='%02.0f %02.0f %06.3f'):
 def dec_dec2s(dec, decformat='%02.0f %02.0f %05.2f'):
     """ Converts a decimal Dec to a sexigesimal string.
 
-    Returns two strings, RA and Dec.
+    Uses the format given by the decformat keyword. Seconds that
+    round to 60 are carried into the minutes (and degrees).
     """
     dec = float(dec)
     if dec < 0.:
@@ -161,15 +513,105 @@ def dec_dec2s(dec, decformat='%02.0f %02.0f %05.2f'):
     if dec > 90.:
         raise ValueError("Dec outside sensible limits: %s" % dec)
 
-    decd, temp = divmod(dec, 1)
-    decm, temp = divmod(temp, DEG_PER_AMIN)
-    decs = temp / DEG_PER_ASEC
+    prec = _seconds_precision(decformat)
+    if prec is None:
+        decd, temp = divmod(dec, 1)
+        decm, temp = divmod(temp, DEG_PER_AMIN)
+        decs = temp / DEG_PER_ASEC
+    else:
+        total = int(round(dec / DEG_PER_ASEC * 10**prec))
+        decd, decm, decs = _split_sexigesimal(total, prec)
     if negdec:
         s_dec = '-' + decformat % (decd, decm, decs)
     else:  s_dec = '+' + decformat % (decd, decm, decs)
 
     return s_dec
 
+def _ascii_digits(x, ndigit):
+    """ ASCII codes of the zero-padded decimal digits of non-negative
+    integers `x`, as an array of shape (N, ndigit)."""
+    p = 10 ** np.arange(ndigit - 1, -1, -1, dtype=np.int64)
+    return (x[:, None] // p % 10 + 48).astype(np.uint8)
+
+def _join_ascii(pieces, n):
+    """ Join columns of ASCII codes and byte strings (the same for
+    every row) into an array of n strings."""
+    cols = []
+    for p in pieces:
+        if isinstance(p, bytes):
+            p = np.frombuffer(p, np.uint8)[None, :].repeat(n, axis=0)
+        cols.append(p)
+    a = np.ascontiguousarray(np.hstack(cols))
+    return a.view(str('S%i') % a.shape[1]).ravel().astype(str('U'))
+
+def _sexagesimal_digits(total, prec, sep):
+    """ Strings 'aa:bb:cc.ccc' for `total` in units of 10**-prec of
+    the smallest unit. Carries are handled by the integer division."""
+    scale = 10**prec
+    a, rem = divmod(total, 3600 * scale)
+    b, rem = divmod(rem, 60 * scale)
+    c, frac = divmod(rem, scale)
+    sep = sep.encode('ascii')
+    pieces = [_ascii_digits(a, 2), sep, _ascii_digits(b, 2), sep,
+              _ascii_digits(c, 2)]
+    if prec > 0:
+        pieces.extend([b'.', _ascii_digits(frac, prec)])
+    return pieces
+
+def ra_dec2s_array(ra, prec=3, sep=' '):
+    """ Convert decimal RAs to sexigesimal strings.
+
+    Parameters
+    ----------
+    ra : array of floats, shape (N,)
+      RA in degrees.
+    prec : int (3)
+      Number of decimal places for the seconds.
+    sep : str (' ')
+      Separator between hours, minutes and seconds.
+
+    Returns
+    -------
+    ra : array of str, shape (N,)
+      For example '10 24 27.015'. Seconds that round to 60 are
+      carried into the minutes (and hours).
+    """
+    ra = np.atleast_1d(np.asarray(ra, float))
+    c = ~((0 <= ra) & (ra < 360))
+    if c.any():
+        raise ValueError("RA outside sensible limits: %s" % ra[c][0])
+    total = np.round(ra / DEG_PER_S * 10**prec).astype(np.int64)
+    # 24h rounds to 0h
+    total %= 24 * 3600 * 10**prec
+    return _join_ascii(_sexagesimal_digits(total, prec, sep), len(ra))
+
+def dec_dec2s_array(dec, prec=2, sep=' '):
+    """ Convert decimal Decs to sexigesimal strings.
+
+    Parameters
+    ----------
+    dec : array of floats, shape (N,)
+      Dec in degrees.
+    prec : int (2)
+      Number of decimal places for the arcseconds.
+    sep : str (' ')
+      Separator between degrees, minutes and seconds.
+
+    Returns
+    -------
+    dec : array of str, shape (N,)
+      For example '-10 07 47.50'. Seconds that round to 60 are
+      carried into the minutes (and degrees).
+    """
+    dec = np.atleast_1d(np.asarray(dec, float))
+    c = ~(np.abs(dec) <= 90)
+    if c.any():
+        raise ValueError("Dec outside sensible limits: %s" % dec[c][0])
+    total = np.round(np.abs(dec) / DEG_PER_ASEC * 10**prec).astype(np.int64)
+    sign = np.where(dec < 0, ord('-'), ord('+')).astype(np.uint8)
+    pieces = [sign[:, None]] + _sexagesimal_digits(total, prec, sep)
+    return _join_ascii(pieces, len(dec))
+
 def dec2s(ra, dec):
     """ Convert an RA and Dec from degrees to sexigesimal.
 
@@ -182,13 +624,16 @@ def dec2s(ra, dec):
     -------
     ra, dec: str or arrays of str, shape (N,)
       The RA and Dec in 'hour:min:s' 'deg:min:s' format.
+
+    See Also
+    --------
+    ra_dec2s_array, dec_dec2s_array : for large arrays of
+      coordinates.
     """
-    try:
+    if np.ndim(ra) == 0 and np.ndim(dec) == 0:
         return ra_dec2s(ra), dec_dec2s(dec)
-    except TypeError:
-        pass
-    radec = [(ra_dec2s(r), dec_dec2s(d)) for r, d in zip(ra, dec)]
-    return tuple(zip(*radec))
+    return (tuple(ra_dec2s_array(ra).tolist()),
+            tuple(dec_dec2s_array(dec).tolist()))
 
 def ra_s2dec(ra):
     """ Converts a sexigesimal RA string to decimal.
@@ -238,6 +683,143 @@ def dec_s2dec(dec):
 
     return d_dec
 
+def _ascii_array(s):
+    """ The characters of an array of equal length strings as an
+    (N, nchar) array of ASCII codes, or None if that isn't possible.
+    """
+    if s.dtype.kind == 'S':
+        a = s.view(np.uint8)
+    elif s.dtype.kind == 'U':
+        a = s.view(np.uint32)
+        if (a > 127).any():
+            return None
+    else:
+        return None
+    a = a.reshape(len(s), -1).astype(np.uint8)
+    # shorter strings are padded with zeros
+    if a.shape[1] == 0 or (a[:, -1] == 0).any():
+        return None
+    return a
+
+def _parse_fixed(s):
+    """ Parse fixed-width strings like '+dd:mm:ss.sss' using their
+    ASCII codes. Returns None if the strings don't have this form."""
+    a = _ascii_array(s)
+    if a is None:
+        return None
+    if np.in1d(a[:, 0], np.frombuffer(b'+- ', np.uint8)).all():
+        a = a[:, 1:]
+    nchar = a.shape[1]
+    if nchar < 8 or nchar == 9:
+        return None
+    digit = (48 <= a) & (a <= 57)
+    idigit = [0, 1, 3, 4, 6, 7] + list(range(9, nchar))
+    if not digit[:, idigit].all() or digit[:, [2, 5]].any():
+        return None
+    if nchar > 8 and not (a[:, 8] == ord('.')).all():
+        return None
+    d = a.astype(np.int64) - 48
+    vals = np.empty((len(a), 3))
+    vals[:, 0] = 10 * d[:, 0] + d[:, 1]
+    vals[:, 1] = 10 * d[:, 3] + d[:, 4]
+    nfrac = max(nchar - 9, 0)
+    sec = 10 * d[:, 6] + d[:, 7]
+    for i in range(9, nchar):
+        sec = 10 * sec + d[:, i]
+    # dividing exact integers gives the same result as float()
+    vals[:, 2] = sec / 10.**nfrac
+    return vals
+
+def _parse_sexagesimal(s, seps):
+    """ Split sexigesimal strings into three columns of floats.
+
+    Parameters
+    ----------
+    s : array of str, shape (N,), or array shape (N, 3)
+      Strings with three fields separated by whitespace or any of
+      the characters in `seps`, or the fields already split into
+      columns.
+    seps : str
+
+    Returns
+    -------
+    vals : array of floats, shape (N, 3)
+      The absolute values of each field.
+    neg : array of bool, shape (N,)
+      True where the first field has a minus sign.
+    """
+    s = np.asarray(s)
+    if s.ndim == 2:
+        if s.shape[1] != 3:
+            raise ValueError('Need three columns, not %i' % s.shape[1])
+        vals = s.astype(float)
+    else:
+        s = np.atleast_1d(s)
+        vals = _parse_fixed(s)
+        if vals is None:
+            if s.dtype.kind == 'S':
+                s = s.astype(str('U'))
+            text = ' '.join(s.tolist()).translate(
+                dict((ord(c), ' ') for c in seps))
+            vals = np.array(text.split(), float)
+            if len(vals) != 3 * len(s):
+                raise ValueError('Each string must have three fields')
+            vals = vals.reshape(-1, 3)
+        else:
+            sign = _ascii_array(s)[:, 0]
+            vals[sign == ord('-'), 0] *= -1
+    # np.signbit catches '-00'
+    neg = np.signbit(vals[:, 0])
+    return np.abs(vals), neg
+
+def ra_s2dec_array(ra):
+    """ Convert sexigesimal RA strings to decimal degrees.
+
+    Parameters
+    ----------
+    ra : array of str, shape (N,), or array shape (N, 3)
+      The hours, minutes and seconds. Separators can be whitespace,
+      colons or h, m, s. Alternatively the hours, minutes and
+      seconds can be given as three columns. Fixed-width strings
+      like 'hh:mm:ss.sss' are parsed fastest.
+
+    Returns
+    -------
+    ra : array of floats, shape (N,)
+    """
+    vals, neg = _parse_sexagesimal(ra, ':hms')
+    rah, ram, ras = vals.T
+    c = neg | (rah > 24) | (ram > 60) | (ras > 60)
+    if c.any():
+        raise ValueError('RA is outside sensible limits. RA = %s' %
+                         np.asarray(ra)[c][0])
+    return DEG_PER_HR * rah + DEG_PER_MIN * ram + DEG_PER_S * ras
+
+def dec_s2dec_array(dec):
+    """ Convert sexigesimal Dec strings to decimal degrees.
+
+    Parameters
+    ----------
+    dec : array of str, shape (N,), or array shape (N, 3)
+      The degrees, arcmin and arcsec. Separators can be whitespace,
+      colons or d, m, s. Alternatively the degrees, minutes and
+      seconds can be given as three columns. Fixed-width strings
+      like '+dd:mm:ss.ss' are parsed fastest.
+
+    Returns
+    -------
+    dec : array of floats, shape (N,)
+    """
+    vals, neg = _parse_sexagesimal(dec, ':dms')
+    decd, decm, decs = vals.T
+    c = (decd > 90) | (decm >= 60) | (decs > 60)
+    if c.any():
+        raise ValueError('Dec is outside sensible limits: Dec = %s' %
+                         np.asarray(dec)[c][0])
+    d_dec = decd + DEG_PER_AMIN * decm + DEG_PER_ASEC * decs
+    d_dec[neg] *= -1
+    return d_dec
+
 def s2dec(ra, dec):
     """ Convert sexigesimal ra and dec strings (or list of ras and decs) to
     decimal degrees.
@@ -264,15 +846,428 @@ def s2dec(ra, dec):
     >>> list(zip(ra, dec))
     [(153.00520833333334, 1.0293472222222222),
     (153.52554166666667, 1.229727777777778)]
+
+    See Also
+    --------
+    ra_s2dec_array, dec_s2dec_array : for large arrays of
+      coordinates.
     """
 
     if isinstance(ra, basestring):
         return ra_s2dec(ra), dec_s2dec(dec)
 
-    radec = [(ra_s2dec(r), dec_s2dec(d)) for r, d in zip(ra, dec)]
-    return tuple(map(np.array, zip(*radec)))
+    return ra_s2dec_array(ra), dec_s2dec_array(dec)
+
+# Zones used to index coordinates are never smaller than this, in
+# degrees. This keeps the zone number * ZONE_STRIDE + RA sort keys
+# precise to better than 1e-7 degrees.
+MIN_ZONE_HEIGHT = 1e-3
+ZONE_STRIDE = 400.
+
+def _radec_zones(dec, height):
+    """ Index of the Dec zone of height `height` holding each Dec."""
+    return np.floor((np.asarray(dec, float) + 90) / height).astype(np.int64)
 
-def match(ra1, dec1, ra2, dec2, tol, allmatches=False):
+def _ra_halfwidth(dec, radius):
+    """ The largest difference in RA between a point at `dec` and
+    any point within `radius` of it, in degrees.
+
+    This is 180 if the circle contains a pole.
+    """
+    dec = np.asarray(dec, float)
+    radius = np.broadcast_to(np.asarray(radius, float), dec.shape)
+    alpha = np.empty(dec.shape)
+    alpha.fill(180.)
+    c = np.abs(dec) + radius < 90
+    r = radius[c] * RAD_PER_DEG
+    d = dec[c] * RAD_PER_DEG
+    x = np.sqrt(np.abs(np.cos(d - r) * np.cos(d + r)))
+    alpha[c] = DEG_PER_RAD * np.arctan(np.sin(r) / x)
+    # pad for rounding errors in the sort keys
+    return np.minimum(alpha + 1e-6, 180.)
+
+class SkyIndex(object):
+    """ An index of sky coordinates for fast repeated searches.
+
+    The sky is divided into strips in Dec (zones) of constant height,
+    and the coordinates are sorted by zone and then RA. Points within
+    a radius of a given position can then be found by binary
+    searches of the RA ranges in each zone overlapping the circle, so
+    no Python loops over coordinates are needed. This works at any
+    Dec, including the poles, and for ranges that cross RA = 0.
+
+    Build the index once for a large catalogue and use it for many
+    queries. It can be written to disk with `save` and read back,
+    memory-mapped, with `load`.
+
+    Parameters
+    ----------
+    ra, dec : arrays of floats, shape (N,)
+      Coordinates in degrees.
+    height : float, optional
+      Zone height in degrees. Searches are fastest for a height
+      similar to the typical search radius. Default 1 arcmin.
+
+    Examples
+    --------
+    >>> index = SkyIndex(ra, dec)
+    >>> m = index.match(ra1, dec1, 2.)
+    >>> ind = index.cone(150.1, 2.2, 0.1)
+    >>> n = index.count_in_radius(ra1, dec1, 10 * DEG_PER_AMIN)
+    """
+    _arrays = ('key', 'order', 'xyz')
+
+    def __init__(self, ra, dec, height=None):
+        ra = np.atleast_1d(np.asarray(ra, float))
+        dec = np.atleast_1d(np.asarray(dec, float))
+        _check_ra_dec(ra, dec)
+        if height is None:
+            height = DEG_PER_AMIN
+        self.height = max(height, MIN_ZONE_HEIGHT)
+        key = _radec_zones(dec, self.height) * ZONE_STRIDE + ra
+        self.order = key.argsort(kind='mergesort')
+        self.key = key[self.order]
+        self.xyz = _radec_to_xyz(ra[self.order], dec[self.order])
+
+    def __len__(self):
+        return len(self.key)
+
+    def __repr__(self):
+        return 'SkyIndex(%i coordinates, zone height %.3g arcsec)' % (
+            len(self), self.height * 3600)
+
+    def save(self, dirname):
+        """ Write the index to a directory of .npy files.
+
+        See Also
+        --------
+        load
+        """
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        for name in self._arrays:
+            np.save(os.path.join(dirname, name + '.npy'), getattr(self, name))
+        np.save(os.path.join(dirname, 'height.npy'), np.array(self.height))
+
+    @classmethod
+    def load(cls, dirname, mmap_mode='r'):
+        """ Read an index written by `save`.
+
+        Parameters
+        ----------
+        dirname : str
+        mmap_mode : {'r', None}
+          By default the arrays are memory-mapped, so only the parts
+          of the index that are searched are read from disk. Use
+          None to read everything into memory.
+        """
+        self = cls.__new__(cls)
+        for name in cls._arrays:
+            setattr(self, name, np.load(os.path.join(dirname, name + '.npy'),
+                                        mmap_mode=mmap_mode))
+        self.height = float(np.load(os.path.join(dirname, 'height.npy')))
+        return self
+
+    def _ranges(self, ra, dec, radius):
+        """ Ranges of indices (into the sorted coordinates) of all
+        points that could be within `radius` degrees of each
+        position. `radius` can be a float or an array with one value
+        per position.
+
+        Returns i1, i2 : arrays of ints, shape (n, m). The candidates
+        for position k are i1[k, l] <= j < i2[k, l] for each of the
+        m ranges. Unused ranges have i2 <= i1.
+        """
+        n = len(ra)
+        z1 = _radec_zones(np.maximum(dec - radius, -90), self.height)
+        z2 = _radec_zones(np.minimum(dec + radius, 90), self.height)
+        nzone = int((z2 - z1).max()) + 1
+        zones = z1[:, None] + np.arange(nzone)
+
+        # up to three RA ranges per zone: the main range and any
+        # part that wraps around RA = 0.
+        alpha = _ra_halfwidth(dec, radius)
+        lo = ra - alpha
+        hi = ra + alpha
+        full = alpha >= 180
+        ralo = np.empty((n, 3))
+        rahi = np.empty((n, 3))
+        ralo[:, 0] = np.where(full, 0, np.maximum(lo, 0))
+        rahi[:, 0] = np.where(full, 360, np.minimum(hi, 360))
+        c = ~full & (lo < 0)
+        ralo[:, 1] = np.where(c, lo + 360, 1)
+        rahi[:, 1] = np.where(c, 360, 0)
+        c = ~full & (hi > 360)
+        ralo[:, 2] = np.where(c, 0, 1)
+        rahi[:, 2] = np.where(c, hi - 360, 0)
+
+        # empty ranges have lo > hi
+        klo = zones[:, :, None] * ZONE_STRIDE + ralo[:, None, :]
+        khi = zones[:, :, None] * ZONE_STRIDE + rahi[:, None, :]
+        unused = zones > z2[:, None]
+        klo[unused] = 1
+        khi[unused] = 0
+        i1 = self.key.searchsorted(klo.ravel(), side='left')
+        i2 = self.key.searchsorted(khi.ravel(), side='right')
+        return i1.reshape(n, -1), i2.reshape(n, -1)
+
+    def _candidates(self, ra, dec, radius):
+        """ Indices (into the sorted coordinates) of all points that
+        could be within `radius` degrees of each position.
+
+        Returns iq, j : the position index and sorted point index for
+        each candidate pair.
+        """
+        i1, i2 = self._ranges(ra, dec, radius)
+        nrange = i1.shape[1]
+        i1 = i1.ravel()
+        count = np.maximum(i2.ravel() - i1, 0)
+        iq = np.repeat(np.arange(len(ra)).repeat(nrange), count)
+        # indices i1, i1 + 1, ..., i2 - 1 for each range
+        start = np.cumsum(count) - count
+        j = np.repeat(i1 - start, count) + np.arange(count.sum())
+        return iq, j
+
+    def _count_candidates(self, ra, dec, radius, chunksize=10000):
+        """ The number of candidate pairs `pairs` would check for each
+        position, found without making the pairs.
+
+        This is fastest if positions with similar radii are
+        together.
+        """
+        radius = np.broadcast_to(np.asarray(radius, float), ra.shape)
+        count = np.zeros(len(ra), np.int64)
+        if len(self) == 0:
+            return count
+        for i in xrange(0, len(ra), chunksize):
+            s = slice(i, i + chunksize)
+            i1, i2 = self._ranges(ra[s], dec[s], radius[s])
+            count[s] = np.maximum(i2 - i1, 0).sum(axis=1)
+        return count
+
+    def pairs(self, ra, dec, radius, chunksize=100000, workers=1):
+        """ Find all points within `radius` degrees of each position.
+
+        Parameters
+        ----------
+        ra, dec : arrays of floats, shape (M,)
+          Positions in degrees.
+        radius : float or array of floats, shape (M,)
+          Search radius in degrees, which can be different for each
+          position.
+        chunksize : int (100000)
+          Number of positions to search for at once. All the pairs
+          for a given position are returned in the same chunk.
+        workers : int (1)
+          Number of processes to use. If more than one, the
+          positions are split into stripes in Dec that are searched
+          in parallel, and chunks are not returned in order of
+          position. With the 'fork' start method the index is
+          shared with the worker processes; otherwise it is saved
+          to a temporary directory that each worker memory-maps.
+
+        Yields
+        ------
+        iq, ind, distsq : arrays, shape (P,)
+          For each pair closer than `radius`, the index of the
+          position, the index of the point in the original input
+          arrays, and the squared distance between them on a unit
+          sphere (see `_distsq`).
+        """
+        ra = np.atleast_1d(np.asarray(ra, float))
+        dec = np.atleast_1d(np.asarray(dec, float))
+        radius = np.asarray(radius, float)
+        if radius.ndim > 0 and radius.shape != ra.shape:
+            raise ValueError('radius must be a float or have one value '
+                             'per position')
+        if len(self) == 0:
+            return
+        if workers > 1:
+            for out in self._pairs_parallel(ra, dec, radius, chunksize,
+                                            workers):
+                yield out
+            return
+        distsq_max = _radians_to_distsq(radius * RAD_PER_DEG)
+        for i in xrange(0, len(ra), chunksize):
+            ra1 = ra[i:i+chunksize]
+            dec1 = dec[i:i+chunksize]
+            if radius.ndim > 0:
+                r = radius[i:i+chunksize]
+                iq, j = self._candidates(ra1, dec1, r)
+                d2max = distsq_max[i:i+chunksize][iq]
+            else:
+                iq, j = self._candidates(ra1, dec1, radius)
+                d2max = distsq_max
+            d = _radec_to_xyz(ra1, dec1)[iq] - self.xyz[j]
+            d2 = (d * d).sum(axis=1)
+            c = d2 < d2max
+            yield iq[c] + i, self.order[j[c]], d2[c]
+
+    def _pairs_parallel(self, ra, dec, radius, chunksize, workers):
+        """ Run `pairs` for stripes of positions in a process pool."""
+        import multiprocessing
+        from collections import deque
+        # stripes of positions adjacent in Dec, a few per worker, so
+        # each searches a compact part of the index
+        isort = dec.argsort(kind='mergesort')
+        size = max(1, min(chunksize, -(-len(ra) // (4 * workers))))
+        # the index is shared with the workers when they are forked,
+        # rather than copied to each one. Otherwise it is written to
+        # a temporary directory that each worker memory-maps.
+        tmpdir = None
+        if multiprocessing.get_start_method() == 'fork':
+            initargs = (self, None)
+        else:
+            import tempfile
+            tmpdir = tempfile.mkdtemp(prefix='skyindex')
+            self.save(tmpdir)
+            initargs = (None, tmpdir)
+        pool = multiprocessing.Pool(workers, _init_index_worker, initargs)
+        # keep only a few stripes in flight to limit memory use
+        pending = deque()
+        try:
+            for i in xrange(0, len(ra), size):
+                ind = isort[i:i+size]
+                r = radius[ind] if radius.ndim > 0 else radius
+                args = ra[ind], dec[ind], ind, r, chunksize
+                pending.append(pool.apply_async(_index_pairs_worker,
+                                                (args,)))
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+        finally:
+            pool.terminate()
+            pool.join()
+            if tmpdir is not None:
+                import shutil
+                shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def match(self, ra, dec, tol, workers=1):
+        """ Find the closest indexed coordinate to each position.
+
+        Parameters
+        ----------
+        ra, dec : arrays of floats, shape (M,)
+          Positions in degrees.
+        tol : float
+          Matching tolerance in arcsec.
+        workers : int (1)
+          Number of processes to use (see `pairs`).
+
+        Returns
+        -------
+        m : record array with fields ind, sep, shape (M,)
+          The index of the closest coordinate closer than `tol` and
+          its separation in arcsec, or -1 for both if there is no
+          match. This is the same as the output of `match`.
+        """
+        ra = np.atleast_1d(np.asarray(ra, float))
+        dec = np.atleast_1d(np.asarray(dec, float))
+        _check_ra_dec(ra, dec)
+        ind = np.empty(len(ra), np.int64)
+        ind.fill(-1)
+        sep = np.empty(len(ra))
+        sep.fill(-1.)
+        for iq, j, d2 in self.pairs(ra, dec, tol * DEG_PER_ASEC,
+                                    workers=workers):
+            iq, j, d2 = _sort_pairs(iq, j, d2)
+            # the closest match is the first pair for each position
+            first = np.ones(len(iq), bool)
+            first[1:] = iq[1:] != iq[:-1]
+            ind[iq[first]] = j[first]
+            sep[iq[first]] = DEG_PER_RAD * _distsq_to_radians(
+                d2[first]) * 3600.
+        return fromarrays([ind, sep], names=str('ind,sep'))
+
+    def match_all(self, ra, dec, tol, workers=1):
+        """ Find all indexed coordinates within a tolerance of each
+        position.
+
+        Parameters
+        ----------
+        ra, dec : arrays of floats, shape (M,)
+          Positions in degrees.
+        tol : float
+          Matching tolerance in arcsec.
+        workers : int (1)
+          Number of processes to use (see `pairs`).
+
+        Returns
+        -------
+        i, ind, sep : arrays, shape (P,)
+          For every matching pair, the index of the position, the
+          index of the matching coordinate and their separation in
+          arcsec. Pairs are sorted by `i` and then by separation.
+        """
+        ra = np.atleast_1d(np.asarray(ra, float))
+        dec = np.atleast_1d(np.asarray(dec, float))
+        _check_ra_dec(ra, dec)
+        radius = tol * DEG_PER_ASEC
+        out = list(self.pairs(ra, dec, radius, workers=workers))
+        if not out:
+            return np.zeros(0, int), np.zeros(0, int), np.zeros(0)
+        iq, j, d2 = _sort_pairs(*(np.concatenate(a) for a in zip(*out)))
+        return iq, j, DEG_PER_RAD * _distsq_to_radians(d2) * 3600.
+
+    def cone(self, ra, dec, radius):
+        """ Indices of all coordinates within `radius` degrees of a
+        single position, in increasing order.
+        """
+        _check_ra_dec(ra, dec)
+        ind = [j for iq, j, d2 in self.pairs(ra, dec, radius)]
+        return np.sort(np.concatenate(ind)) if ind else np.zeros(0, int)
+
+    def count_in_radius(self, ra, dec, radius, workers=1):
+        """ The number of coordinates within `radius` degrees of each
+        position.
+
+        Parameters
+        ----------
+        ra, dec : arrays of floats, shape (M,)
+          Positions in degrees.
+        radius : float
+          Radius in degrees.
+        workers : int (1)
+          Number of processes to use (see `pairs`).
+
+        Returns
+        -------
+        count : array of ints, shape (M,)
+        """
+        ra = np.atleast_1d(np.asarray(ra, float))
+        dec = np.atleast_1d(np.asarray(dec, float))
+        _check_ra_dec(ra, dec)
+        count = np.zeros(len(ra), int)
+        for iq, j, d2 in self.pairs(ra, dec, radius, workers=workers):
+            count += np.bincount(iq, minlength=len(ra))
+        return count
+
+# the SkyIndex searched by each worker process
+_WORKER_INDEX = None
+
+def _init_index_worker(index, dirname):
+    global _WORKER_INDEX
+    if index is None:
+        index = SkyIndex.load(dirname, mmap_mode='r')
+    _WORKER_INDEX = index
+
+def _index_pairs_worker(args):
+    """ All pairs for a stripe of positions, with position indices
+    `ind`. See `SkyIndex.pairs`."""
+    ra, dec, ind, radius, chunksize = args
+    out = list(_WORKER_INDEX.pairs(ra, dec, radius, chunksize=chunksize))
+    if not out:
+        return np.zeros(0, int), np.zeros(0, int), np.zeros(0)
+    iq, j, d2 = (np.concatenate(a) for a in zip(*out))
+    return ind[iq], j, d2
+
+def _sort_pairs(iq, ind, distsq):
+    """ Sort pairs by position index, then separation, then index."""
+    isort = np.lexsort((ind, distsq, iq))
+    return iq[isort], ind[isort], distsq[isort]
+
+def match(ra1, dec1, ra2, dec2, tol, allmatches=False, workers=1):
     """ Given two sets of numpy arrays of ra,dec and a tolerance tol,
     returns an array of indices and separations with the same length
     as the first input array.
@@ -285,84 +1280,41 @@ def match(ra1, dec1, ra2, dec2, tol, allmatches=False):
     return the index and separation of everything in the second array
     within the search tolerance, not just the closest match.
 
+    workers > 1 splits the first set of coordinates into stripes in
+    Dec that are matched in parallel by that many processes. The
+    results are the same as for a single process.
+
     See Also
     --------
     indmatch, unique_radec
 
     Notes
     -----
+    The second set of coordinates is indexed by Dec zone and RA (see
+    `SkyIndex`), so there are no loops over coordinates in Python,
+    and matches are correct at any Dec and across RA = 0. To match
+    many lists against the same coordinates, make a `SkyIndex` once
+    and use its `match` method.
+
     To get the indices of objects in ra2, dec2 without a match, use
 
     >>> imatch = match(ra1, dec1, ra2, dec2, 2.)
     >>> inomatch = numpy.setdiff1d(np.arange(len(ra2)), set(imatch))
     """
-    
-    ra1,ra2,dec1,dec2 = map(np.asarray, (ra1, ra2, dec1, dec2))
-
-    abs = np.abs
-
-    isorted = ra2.argsort()
-    sdec2 = dec2[isorted]
-    sra2 = ra2[isorted]
-
     LIM = tol * DEG_PER_ASEC
-
-    match = []
-    # use mean dec, assumes decs similar
-    decav = np.mean(sdec2.mean() + dec1.mean())
-    RA_LIM = LIM / cos(decav * RAD_PER_DEG)
-
-    for ra,dec in zip(ra1,dec1):
-        i1 = sra2.searchsorted(ra - RA_LIM)
-        i2 = i1 + sra2[i1:].searchsorted(ra + RA_LIM)
-        #print(i1,i2)
-        close = []
-        for j in xrange(i1,i2):
-            if abs(dec - sdec2[j]) > LIM:
-                continue
-            else:
-                # if ras and decs are within LIM arcsec, then
-                # calculate actual separation:
-                disq = ang_sep(ra, dec, sra2[j], sdec2[j])
-                close.append((disq, j))
-
-        close.sort()
-        if not allmatches:
-            # Choose the object with the closest separation inside the
-            # requested tolerance, if one was found.
-            if len(close) > 0:
-                min_dist, jmin = close[0]
-                if min_dist < LIM:
-                    match.append((isorted[jmin], min_dist))
-                    continue
-            # otherwise no match
-            match.append((-1,-1))
-        else:
-            # append all the matching objects
-            jclose = []
-            seps = []
-            for dist,j in close:
-                if dist < LIM:
-                    jclose.append(j)
-                    seps.append(dist)
-                else:
-                    break
-            match.append(fromarrays([isorted[jclose], seps],
-                                    dtype=[(str('ind'),str('i8')),
-                                           str(('sep'),str('f8'))
-                                           ]))
-
+    index = SkyIndex(ra2, dec2, height=LIM)
     if not allmatches:
-        # return both indices and separations in a recarray
-        temp = np.rec.fromrecords(match, names=str('ind,sep'))
-        # change to arcseconds
-        temp.sep *= 3600.
-        temp.sep[temp.sep < 0] = -1.
-        return temp
-    else:
-        return match
+        return index.match(ra1, dec1, tol, workers=workers)
+
+    dtype = [(str('ind'), str('i8')), (str('sep'), str('f8'))]
+    iq, j, sep = index.match_all(ra1, dec1, tol, workers=workers)
+    # separations in degrees
+    sep /= 3600.
+    edges = iq.searchsorted(np.arange(np.size(ra1) + 1))
+    return [fromarrays([j[i1:i2], sep[i1:i2]], dtype=dtype)
+            for i1, i2 in zip(edges[:-1], edges[1:])]
 
-def indmatch(ra1, dec1, ra2, dec2, tol):
+def indmatch(ra1, dec1, ra2, dec2, tol, workers=1):
     """ Finds objects in ra1, dec1 that have a matching object in
     ra2, dec2 within tol arcsec.
 
@@ -372,6 +1324,8 @@ def indmatch(ra1, dec1, ra2, dec2, tol):
       First list of coordinates in degrees.
     ra2, dec2 : arrays of floats, shape (M,)
       Second list of coordinates in degrees.
+    workers : int (1)
+      Number of processes to use (see `match`).
 
     Returns
     -------
@@ -383,19 +1337,110 @@ def indmatch(ra1, dec1, ra2, dec2, tol):
     --------
     match, unique_radec
     """
-    m = match(ra1, dec1, ra2, dec2, tol)
+    m = match(ra1, dec1, ra2, dec2, tol, workers=workers)
     c = m.ind > -1
     i1 = c.nonzero()[0]
     i2 = m.ind[c]
     return i1, i2
     
-def unique_radec(ra, dec, tol):
+def _connected_labels(n, i, j):
+    """ Label the connected components of a graph.
+
+    Uses a vectorised union-find: each edge hooks the root with the
+    larger label onto the smaller one, and then pointer jumping
+    flattens the trees, repeated until no edge joins two different
+    roots.
+
+    Parameters
+    ----------
+    n : int
+      Number of nodes.
+    i, j : arrays of ints, shape (P,)
+      The nodes joined by each edge.
+
+    Returns
+    -------
+    labels : array of ints, shape (n,)
+      The smallest node index in the component of each node.
+    """
+    labels = np.arange(n)
+    i = np.asarray(i, int)
+    j = np.asarray(j, int)
+    while True:
+        li = labels[i]
+        lj = labels[j]
+        c = li != lj
+        if not c.any():
+            break
+        # drop edges inside components that are already joined
+        i, j, li, lj = i[c], j[c], li[c], lj[c]
+        np.minimum.at(labels, np.maximum(li, lj), np.minimum(li, lj))
+        while True:
+            parent = labels[labels]
+            if (parent == labels).all():
+                break
+            labels = parent
+    return labels
+
+def group_radec(ra, dec, tol, workers=1):
+    """ Group coordinates with a friends-of-friends algorithm.
+
+    Two coordinates are in the same group if they are closer than
+    `tol`, or are linked by a chain of coordinates each closer than
+    `tol` to the next.
+
+    Parameters
+    ----------
+    ra, dec : arrays of floats, shape (N,)
+      Coordinates in degrees.
+    tol : float
+      Linking length in arcsec.
+    workers : int (1)
+      Number of processes used to find close pairs (see
+      `SkyIndex.pairs`).
+
+    Returns
+    -------
+    group : array of ints, shape (N,)
+      The group number of each coordinate. Groups are numbered in
+      order of their first member.
+    first : array of ints, shape (ngroup,)
+      The index of the first (lowest index) member of each group.
+
+    See Also
+    --------
+    unique_radec, SkyIndex
+
+    Examples
+    --------
+    >>> group, first = group_radec(ra, dec, 1.)
+    >>> members = np.flatnonzero(group == group[10])
+    """
+    ra = np.atleast_1d(np.asarray(ra, float))
+    dec = np.atleast_1d(np.asarray(dec, float))
+    LIM = tol * DEG_PER_ASEC
+    index = SkyIndex(ra, dec, height=LIM)
+    edges = []
+    for iq, j, d2 in index.pairs(ra, dec, LIM, workers=workers):
+        # each pair is found twice, and each point matches itself
+        c = iq < j
+        edges.append((iq[c], j[c]))
+    if edges:
+        i, j = (np.concatenate(e) for e in zip(*edges))
+    else:
+        i = j = np.zeros(0, int)
+    labels = _connected_labels(len(ra), i, j)
+    first, group = np.unique(labels, return_inverse=True)
+    return group, first
+
+def unique_radec(ra, dec, tol, workers=1):
     """ Find unique ras and decs in a list of coordinates.
 
     RA and Dec must be arrays of the same length, and in degrees.
 
     tol is the tolerance for matching in arcsec. Any coord separated by
-    less that this amount are assumed to be the same.
+    less that this amount are assumed to be the same, and so are any
+    coords linked by a chain of such close coords (see `group_radec`).
 
     Returns
     -------
@@ -407,40 +1452,11 @@ def unique_radec(ra, dec, tol):
 
     See Also
     --------
-    indmatch, match
-
-    The matching algorithm is confusing, but hopefully correct and not too
-    slow. Potential for improvement...
-    """
-    matches = match(ra, dec, ra, dec, tol, allmatches=True)
-    imatchflat = []
-    for m in matches:
-        imatchflat.extend(m.ind)
-
-    inomatch = np.setdiff1d(np.arange(len(ra)), list(set(imatchflat)))
-
-    assert len(inomatch) == 0
-    # Indices giving unique ra, decs
-    iunique = []
-    # Will be same length as iunique. Gives all indices in original
-    # coords that are matched to each unique coord.
-    iextras = []
-    assigned = set()
-    for j,m in enumerate(matches):
-        if not (j % 1000):
-            print(j)
-        # get the lowest index in this group
-        isort = sorted(m.ind)
-        ilow = isort[0]
-        if ilow not in assigned:
-            iunique.append(ilow)
-            assigned.add(ilow)
-            iextras.append([ilow])
-            # assign any extra indices to this unique coord.
-            for i in isort[1:]:
-                # check not already been assigned to another coord
-                if i not in assigned:
-                    iextras[-1].append(i)
-                    assigned.add(i)
-
-    return np.array(iunique), iextras
+    group_radec, indmatch, match
+    """
+    group, first = group_radec(ra, dec, tol, workers=workers)
+    if len(group) == 0:
+        return first, []
+    isort = group.argsort(kind='mergesort')
+    edges = np.flatnonzero(np.diff(group[isort])) + 1
+    return first, np.split(isort, edges)
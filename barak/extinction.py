@@ -67,11 +67,61 @@ from .utilities import between
 from .interp import interp_Akima
 import numpy as np
 
+from collections import OrderedDict
+import functools, hashlib, inspect
 import warnings
 
 # interpolation limits
 W0, W1 = 2850, 3700
 
+# Maximum number of extinction curves kept by the curve cache.
+CURVE_CACHE_SIZE = 64
+
+# least recently used extinction curves first
+_CURVE_CACHE = OrderedDict()
+
+def clear_curve_cache():
+    """ Remove all the extinction curves from the curve cache."""
+    _CURVE_CACHE.clear()
+
+def _cached_curve(func):
+    """ Decorator that caches extinction curves.
+
+    The curve (A(lambda)/A(V)) is cached using the function name, the
+    value of every argument apart from `EBmV`, and a hash of the
+    wavelengths. Calling the function again with the same
+    wavelengths then only needs the cheap E(B-V) scaling. At most
+    CURVE_CACHE_SIZE curves are kept, discarding the least recently
+    used.
+
+    The cached wa and AlamAv arrays are shared between calls, so they
+    are made read-only.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        # getcallargs (rather than signature) also works on Python 2
+        params = inspect.getcallargs(func, *args, **kwargs)
+        wa = np.array(params.pop('wa'))
+        EBmV = params.pop('EBmV')
+        h = hashlib.sha1(np.ascontiguousarray(wa, float).tobytes())
+        h.update(str(wa.shape).encode('utf-8'))
+        key = (func.__name__, tuple(sorted(params.items())), h.hexdigest())
+        try:
+            ec = _CURVE_CACHE.pop(key)
+        except KeyError:
+            ec = func(wa, EBmV=None, **params)
+            for attr in '_wa', '_AlamAv':
+                val = getattr(ec, attr)
+                if isinstance(val, np.ndarray):
+                    val.setflags(write=False)
+            while _CURVE_CACHE and len(_CURVE_CACHE) >= CURVE_CACHE_SIZE:
+                _CURVE_CACHE.popitem(last=False)
+        if CURVE_CACHE_SIZE > 0:
+            _CURVE_CACHE[key] = ec
+        return ExtinctionCurve(ec.wa, ec.Rv, ec.AlamAv, EBmV=EBmV,
+                               name=ec.name)
+    return wrapper
+
 class ExtinctionCurve(object):
     def __init__(self, wa, Rv, AlamAv,
                  name='ExtinctionCurve', EBmV=None):
@@ -132,6 +182,7 @@ class ExtinctionCurve(object):
     def name(self):
         return self._name
 
+@_cached_curve
 def starburst_Calzetti00(wa, Rv=4.05, EBmV=None):
     """ Dust extinction in starburst galaxies using the Calzetti
     relation.
@@ -226,6 +277,7 @@ def starburst_Calzetti00(wa, Rv=4.05, EBmV=None):
         return ExtinctionCurve(wa, Rv, AlamAv, EBmV=EBmV,
                                name='starburst_Calzetti00')
 
+@_cached_curve
 def MW_Cardelli89(wa, EBmV=None, Rv=3.1):
     """ Milky Way Extinction law from Cardelli et al. 1989.
 
@@ -361,6 +413,7 @@ def ElamV_FM(wa, c1, c2, c3, c4, x0, gamma):
 
     return ElamV
 
+@_cached_curve
 def LMC_Gordon03(wa, EBmV=None):
     """ LMC Extinction law from Gordon et al. 2003 LMC Average Sample.
 
@@ -404,6 +457,7 @@ def LMC_Gordon03(wa, EBmV=None):
         return ExtinctionCurve(wa, 3.41, AlamAv, EBmV=EBmV,
                                name='LMC_Gordon03')
 
+@_cached_curve
 def LMC2_Gordon03(wa, EBmV=None):
     """ LMC Extinction law from Gordon et al. 2003 LMC supershell
     sample.
@@ -447,6 +501,7 @@ def LMC2_Gordon03(wa, EBmV=None):
                                name='LMC2_Gordon03')
 
     
+@_cached_curve
 def SMC_Gordon03(wa, EBmV=None):
     """ SMC Extinction law from Gordon et al. 2003 SMC Bar Sample.
 
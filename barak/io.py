@@ -14,6 +14,7 @@ else:
 
 import json
 import os, gzip
+from itertools import islice
 import numpy as np
 from .utilities import adict, iscontainer
 
@@ -22,9 +23,83 @@ def loadtxt(filename, **kwargs):
     passed a unicode string in python 2.x."""
     return np.loadtxt(str(filename), **kwargs)
 
+def _raw_lines(fh):
+    """ Return a list of all the lines in a file object or iterable,
+    without trailing newlines."""
+    if hasattr(fh, 'read'):
+        text = fh.read()
+        if isinstance(text, bytes):
+            text = text.decode('utf-8')
+        return text.splitlines()
+    return [(r.decode('utf-8') if isinstance(r, bytes) else r).rstrip('\r\n')
+            for r in fh]
+
+def _data_lines(lines, comment):
+    """ Remove comments, leading whitespace and blank lines from a
+    list of lines."""
+    if comment is not None:
+        lines = [(r.split(comment)[0] if comment in r else r).lstrip()
+                 for r in lines]
+    else:
+        lines = [r.lstrip() for r in lines]
+    return [r for r in lines if r]
+
+def _split_columns(lines, sep):
+    """ Split lines of data into columns of strings.
+
+    Returns a list of columns, or None if the lines do not all have
+    the same number of items.
+    """
+    ncol = len(lines[0].split(sep))
+    # Split all the lines at once, with a marker item between each
+    # line that we use to check every line has the same number of
+    # items.
+    marker = '\x00'
+    s = (' ' if sep is None else sep)
+    text = (s + marker + s).join(lines)
+    if text.count(marker) != len(lines) - 1:
+        return None
+    items = text.split(sep)
+    if len(items) != (ncol + 1) * len(lines) - 1:
+        return None
+    if len(lines) > 1 and set(items[ncol::ncol + 1]) != set([marker]):
+        return None
+
+    return [items[i::ncol + 1] for i in range(ncol)]
+
+def _convert_column(col, func, promote=True):
+    """ Convert a column of strings using `func`.
+
+    If `func` is int or float, Numpy converts the whole column at
+    once, falling back to float and then str if the conversion fails
+    and `promote` is True (the same type promotion used by
+    `readtxt`). If `func` is None the column is left as strings.
+    Otherwise `func` is applied to each entry.
+    """
+    if func is int:
+        try:
+            return np.array(col, dtype=int)
+        except (ValueError, OverflowError):
+            if not promote:
+                raise ValueError('Could not convert column to int')
+            func = float
+    if func is float:
+        try:
+            return np.array(col, dtype=float)
+        except ValueError:
+            if not promote:
+                raise ValueError('Could not convert column to float')
+            func = None
+    if func is None:
+        return np.array([item.strip() for item in col])
+    try:
+        return np.array([func(item) for item in col])
+    except ValueError:
+        raise ValueError('Converter %s failed on column %s' % (func, col))
+
 def readtxt(fh, sep=None, usecols=None, comment='#', skip=0,
             arrays=True, names=None, readnames=False, converters=None,
-            mintype=int):
+            mintype=int, chunksize=None, dtype=None):
     """ Reads columns from a text file into arrays, converting to int,
     float or str where appropriate.
 
@@ -60,8 +135,28 @@ def readtxt(fh, sep=None, usecols=None, comment='#', skip=0,
         Functions to apply to each entry of a column. Each (key,value)
         pair gives the column index (key) and the function to be
         applied to each entry in that column (value).
+    chunksize : int (`None`)
+        If given, return an iterator that reads `chunksize` rows at a
+        time, yielding the same output as `readtxt` for each chunk of
+        rows. Every chunk has the same column types. Unless they are
+        given by `dtype`, these are found from the first chunk, so a
+        ValueError is raised if a later chunk does not fit them (for
+        example a column of integers that has a float value, or a
+        longer string, in a later chunk). Use `dtype`, or
+        ``mintype=float`` for numeric columns, to avoid this.
+    dtype : sequence of dtypes or dict, optional
+        The type of each column read, or a dict giving the types of
+        some columns by column index. String types should include a
+        width, e.g. 'U20'; a ValueError is raised for longer strings.
+
+    Returns either structured array or lists, or an iterator over
+    these if `chunksize` is given.
 
-    Returns either structured array or lists.
+    Notes
+    -----
+    If every row has the same number of items, each column is
+    converted in a single step by Numpy. Otherwise the rows are
+    converted one item at a time, which is much slower.
 
     Examples
     --------
@@ -69,14 +164,237 @@ def readtxt(fh, sep=None, usecols=None, comment='#', skip=0,
     >>> ninthcol, fifthcol = readtxt('filename', sep=',', usecols=(8,4)])
     >>> firstcol = readtxt('filename', comment='%', usecols=[0])
     >>> recarray = readtxt('filename', sep=',', usecols=(1,3), names='x,y'])
+    >>> for rec in readtxt('filename', names='x,y,z', chunksize=10000):
+    ...     process(rec[rec.x > 0])
+    """
+    if mintype not in (int, float):
+        raise ValueError('Unknown minimum type %s' % mintype)
+
+    if chunksize is not None:
+        if chunksize < 1:
+            raise ValueError('chunksize must be > 0')
+        return _readtxt_chunks(fh, sep, usecols, comment, skip, arrays,
+                               names, readnames, converters, mintype,
+                               int(chunksize), dtype)
+
+    needclose = False
+    if isinstance(fh, basestring):
+        if fh.endswith('.gz'):
+            import gzip
+            fh = gzip.open(fh)
+        else:
+            fh = open(fh)
+        needclose = True
+
+    if names and isinstance(names, basestring):
+        names = [n.strip() for n in str(names).split(',')]
+    elif names:
+        names = [str(n) for n in names]
+
+    lines = _data_lines(_raw_lines(fh), comment)[skip:]
+
+    if needclose:
+        fh.close()
+
+    if readnames and lines:
+        names = [r.strip() for r in lines[0].split(sep)]
+        lines = lines[1:]
+
+    dtypes, converters = _dtype_converters(dtype, usecols, converters)
+    out = _columns_from_lines(lines, sep, usecols, converters, mintype, names)
+    out = _apply_dtypes(out, dtypes, usecols)
+    return _output_columns(out, arrays, names)
+
+# functions that parse strings to each kind of dtype
+_KIND_FUNCS = dict(i=int, u=int, f=float, U=None, S=None)
+
+def _dtype_converters(dtype, usecols, converters):
+    """ Find the dtype of each column from readtxt's `dtype`
+    keyword, and converters that parse those columns.
+
+    Returns a dictionary of dtypes and the converters, both keyed by
+    column index.
     """
+    if dtype is None:
+        return {}, converters
+    if isinstance(dtype, dict):
+        dtypes = dict((i, np.dtype(dt)) for i, dt in dtype.items())
+    else:
+        ind = range(len(dtype)) if usecols is None else usecols
+        dtypes = dict(zip(ind, [np.dtype(dt) for dt in dtype]))
+    funcs = dict(converters or {})
+    for i, dt in dtypes.items():
+        if dt.kind not in _KIND_FUNCS:
+            raise ValueError('Unsupported dtype %s' % dt)
+        if i not in funcs:
+            funcs[i] = _KIND_FUNCS[dt.kind]
+    return dtypes, funcs
+
+def _apply_dtypes(out, dtypes, usecols):
+    """ Convert columns to the dtypes given by readtxt's `dtype`
+    keyword. """
+    ind = range(len(out)) if usecols is None else usecols
+    return [_match_dtype(c, dtypes[i], cast=True) if i in dtypes else c
+            for i, c in zip(ind, out)]
+
+def _columns_from_lines(lines, sep, usecols, converters, mintype, names,
+                        promote=True):
+    """ Convert lines of data to a list of column arrays. """
+    cols = (_split_columns(lines, sep) if lines else None)
+    if cols is not None:
+        return _columns_from_items(cols, usecols, converters, mintype, names,
+                                   promote=promote)
+    # ragged or empty rows
+    if converters is not None:
+        # None means leave as a string (see _convert_column)
+        converters = dict((i, (lambda x: str(x).strip()) if f is None else f)
+                          for i, f in converters.items())
+    rows = [r.split(sep) for r in lines]
+    return _columns_from_rows(rows, usecols, converters, mintype, names)
+
+def _output_columns(out, arrays, names):
+    """ Return a list of column arrays in the form given by readtxt's
+    `arrays` and `names` keywords."""
+    if arrays:
+        if names is not None:
+            out = np.rec.fromarrays(out, names=names)
+    else:
+        out = [c.tolist() for c in out]
+
+    if len(out) == 1 and names is None:
+        return out[0]
+    else:
+        return out
+
+def _readtxt_chunks(fh, sep, usecols, comment, skip, arrays, names,
+                    readnames, converters, mintype, chunksize, dtype):
+    """ Generator that reads `chunksize` rows at a time for readtxt.
+    """
+    if isinstance(fh, basestring):
+        if fh.endswith('.gz'):
+            fh = gzip.open(fh)
+        else:
+            fh = open(fh)
+        needclose = True
+    else:
+        needclose = False
+        fh = iter(fh)
+
+    if names and isinstance(names, basestring):
+        names = [n.strip() for n in str(names).split(',')]
+    elif names:
+        names = [str(n) for n in names]
+
+    header = []
+    def chunks():
+        # yield lists of exactly chunksize data lines (except perhaps
+        # the last), after removing skipped rows and the header.
+        toskip = skip
+        lines = []
+        while True:
+            raw = list(islice(fh, chunksize))
+            new = _data_lines(_raw_lines(raw), comment)
+            if toskip:
+                n = min(toskip, len(new))
+                new = new[n:]
+                toskip -= n
+            if readnames and not header and new:
+                header.append(new.pop(0))
+            lines.extend(new)
+            while len(lines) >= chunksize:
+                yield lines[:chunksize]
+                lines = lines[chunksize:]
+            if not raw:
+                break
+        if lines:
+            yield lines
+
+    explicit, converters = _dtype_converters(dtype, usecols, converters)
+    dtypes = funcs = None
+    nrows = 0
+    try:
+        for lines in chunks():
+            if header and dtypes is None:
+                names = [r.strip() for r in header[0].split(sep)]
+            if dtypes is None:
+                out = _columns_from_lines(lines, sep, usecols, converters,
+                                          mintype, names)
+                out = _apply_dtypes(out, explicit, usecols)
+                dtypes = [c.dtype for c in out]
+                # converters that give the same types as the first chunk
+                ind = (range(len(out)) if usecols is None else usecols)
+                funcs = {}
+                for i, dt in zip(ind, dtypes):
+                    if converters is not None and i in converters:
+                        funcs[i] = converters[i]
+                    else:
+                        funcs[i] = _KIND_FUNCS[dt.kind]
+            else:
+                try:
+                    out = _columns_from_lines(lines, sep, usecols, funcs,
+                                              mintype, names, promote=False)
+                    out = [_match_dtype(c, dt, cast=i in explicit)
+                           for i, c, dt in zip(ind, out, dtypes)]
+                except ValueError as e:
+                    raise ValueError(
+                        '%s in the chunk starting at data row %i. Column types '
+                        'are set by the first chunk, use `dtype` to set them '
+                        'explicitly' % (e, nrows + 1))
+            nrows += len(lines)
+            yield _output_columns(out, arrays, names)
+    finally:
+        if needclose:
+            fh.close()
+
+def _match_dtype(col, dtype, cast=False):
+    """ Convert a column array to `dtype`, raising a ValueError if
+    this would lose information.
+
+    Strings must fit in the width of a string `dtype`. Numbers are
+    only converted to types that can hold every value (e.g. int to
+    float) unless `cast` is True.
+    """
+    if col.dtype == dtype:
+        return col
+    if dtype.kind in 'US':
+        if col.dtype.kind not in 'US':
+            col = col.astype(str)
+        width = dtype.itemsize // (4 if dtype.kind == 'U' else 1)
+        if width and len(col) and np.char.str_len(col).max() > width:
+            raise ValueError('Strings longer than %s' % dtype)
+        return col.astype(dtype if width else col.dtype)
+    if cast or np.can_cast(col.dtype, dtype, casting='safe'):
+        return col.astype(dtype)
+    raise ValueError('Could not convert column from %s to %s' % (
+        col.dtype, dtype))
+
+def _columns_from_items(cols, usecols, converters, mintype, names,
+                        promote=True):
+    """ Convert columns of strings to a list of arrays. """
+    funcs = [mintype] * len(cols)
+    if converters is not None:
+        for i in converters:
+            funcs[i] = converters[i]
+    if usecols is None:
+        usecols = range(len(cols))
+    elif max(usecols) >= len(cols):
+        raise IndexError('Columns indices: %s, but only %i entries in '
+                         'each row!' % (usecols, len(cols)))
+    if names:
+        assert len(usecols) == len(names), '%i, %i' % (
+            len(names), len(usecols))
+
+    return [_convert_column(cols[i], funcs[i], promote=promote)
+            for i in usecols]
+
+def _columns_from_rows(rows, usecols, converters, mintype, names):
+    """ Convert rows one at a time to a list of column arrays,
+    truncating to the number of items on the shortest row. """
     if mintype == float:
         typedict = {float : lambda x: str(x).strip()}
-    elif mintype == int:
+    else:
         typedict = {int : float,
                     float : lambda x: str(x).strip()}
-    else:
-        raise ValueError('Unknown minimum type %s' % mintype)
 
     def convert(row, funcs):
         # convert each item in a row to int, float or str.
@@ -95,41 +413,8 @@ def readtxt(fh, sep=None, usecols=None, comment='#', skip=0,
                     break
         return row,funcs
 
-    needclose = False
-    if isinstance(fh, basestring):
-        if fh.endswith('.gz'):
-            import gzip
-            fh = gzip.open(fh)
-        else:
-            fh = open(fh)
-        needclose = True
-
-    data = iter(fh)
-
-    if comment is not None:
-        len_comment = len(comment)
-
-    if names and isinstance(names, basestring):
-        names = [n.strip() for n in str(names).split(',')]
-    elif names:
-        names = map(str, names)
-        
-    skipped = 0
     out = []
-    # main loop to read data
-    for irow, row in enumerate(data):
-        if comment is not None:
-            row = row.split(comment)[0]
-        row = row.lstrip()
-        if not row:  continue
-        if skipped < skip:
-            skipped += 1
-            continue
-        row = row.split(sep)
-        if readnames:
-            names = [r.strip() for r in row]
-            readnames = False
-            continue
+    for irow, row in enumerate(rows):
         if not out:
             # first row with data, so initialise converters
             funcs = [mintype] * len(row)
@@ -157,22 +442,8 @@ def readtxt(fh, sep=None, usecols=None, comment='#', skip=0,
                 len(names), irow+1, row)
         out.append(row)
 
-    if needclose:
-        fh.close()
-
     # rows to columns, truncating to number of words on shortest line.
-    if arrays:
-        if names is not None:
-            out = np.rec.fromrecords(out, names=names)
-        else:
-            out = [np.array(c) for c in zip(*out)]
-    else:
-        out = [list(c) for c in zip(*out)]
-
-    if len(out) == 1 and names is None:
-        return out[0]
-    else:
-        return out
+    return [np.array(c) for c in zip(*out)]
 
 
 def writetxt(fh, cols, sep=' ', names=None, header=None, overwrite=False,
@@ -470,7 +741,52 @@ def parse_config(filename, defaults={}):
     fh.close()
     return cfg
 
-def readsex(filename, catnum=None):
+def _sex_header(lines):
+    """ Column names and (zero-based) column indices from the header
+    lines of a SExtractor ASCII_HEAD catalogue.
+
+    Only the first element of vector columns (such as FLUX_APER) is
+    given, as SExtractor only lists its first column number.
+    """
+    number, names = list(zip(*[row.split()[1:3] for row in lines]))
+    indcol = [int(c)-1 for c in number]
+    if len(names) - len(set(names)):
+        dup = [n for n in set(names) if names.count(n) > 1]
+        raise ValueError('fields with same names: %s' % dup)
+    return list(names), indcol
+
+def _is_int_token(token):
+    return token.lstrip('+-').isdigit()
+
+def _sex_data(filename, first, names, indcol):
+    """ Read the data block of a SExtractor ASCII catalogue with
+    numpy's bulk text parser.
+
+    `first` is the first data row. Columns are integers if their
+    value in this row is written as an integer and all their values
+    are whole numbers, otherwise floats, as for `readtxt`. Returns
+    None if the block can't be parsed this way (for example, if it
+    contains non-numeric values).
+    """
+    first = first.split()
+    if not first:
+        return np.rec.fromarrays([np.zeros(0) for n in names],
+                                 names=[str(n) for n in names])
+    if max(indcol) >= len(first):
+        return None
+    try:
+        vals = np.loadtxt(filename, comments='#', usecols=indcol, ndmin=2)
+    except ValueError:
+        return None
+    cols = []
+    for i,c in zip(indcol, vals.T):
+        if _is_int_token(first[i]) and (c == np.round(c)).all() and \
+               (np.abs(c) < 2**53).all():
+            c = c.astype(np.int64)
+        cols.append(c)
+    return np.rec.fromarrays(cols, names=[str(n) for n in names])
+
+def readsex(filename, catnum=None, cache=False):
     """ Read a sextractor catalogue into a Numpy record array.
 
     Parameters
@@ -480,49 +796,101 @@ def readsex(filename, catnum=None):
     catnum : int, optional
       If the Sextractor file is in LDAC_FITS format and contains more
       than one catalogue, this option specifies the catalogue number.
+    cache : bool (False)
+      If True, an ASCII catalogue is saved after it is read as a
+      numpy file, `filename` + '.npy', and later calls read that file
+      instead, unless the catalogue has been modified since.
 
     Returns
     -------
     s : numpy record array
       Record array with field names the same as those in the
       sextractor catalogue.
+
+    Notes
+    -----
+    LDAC_FITS catalogues are memory-mapped, so columns are only read
+    from disk when they are used.
     """
-    fh = open(filename)
-    # get the header
-    row = fh.next()
-    while not row.strip():
-        row = fh.next()
-    if row[8] == '=':
-        fh.close()
+    fh = open(filename, 'rb')
+    start = fh.read(80)
+    fh.close()
+    if start.startswith(b'SIMPLE') and start[8:9] == b'=':
         # assume a fits file
         try:
             import pyfits
         except ImportError:
             import astropy.io.fits as pyfits
-        fh = pyfits.open(filename)
-        if len(fh) > 3 and catnum is None:
+        fh = pyfits.open(filename, memmap=True)
+        nhdu = len(fh)
+        fh.close()
+        if nhdu > 3 and catnum is None:
             raise ValueError("specify catalogue number")
-        elif catnum is not None:
-            return pyfits.getdata(filename, catnum*2).view(np.recarray)
-        else:
-            return pyfits.getdata(filename, 2).view(np.recarray)
+        ext = 2 if catnum is None else catnum*2
+        return pyfits.getdata(filename, ext, memmap=True).view(np.recarray)
+
+    npyname = filename + '.npy'
+    if cache and os.path.exists(npyname) and \
+           os.path.getmtime(npyname) >= os.path.getmtime(filename):
+        return np.load(npyname).view(np.recarray)
+
+    # get the header
     hd = []
-    while row.startswith('#'):
-        if row[1:].strip():
-            hd.append(row)
-        row = fh.next()
+    fh = open(filename)
+    first = ''
+    for row in fh:
+        if row.startswith('#'):
+            if row[1:].strip():
+                hd.append(row)
+        elif hd or row.strip():
+            first = row
+            break
     fh.close()
-    # get column numbers and names
-    number, names = zip(*[row.split() for row in hd])[1:3]
-    indcol = [int(c)-1 for c in number]
-    if len(names) - len(set(names)):
-        dup = [n for n in set(names) if names.count(n) > 1]
-        raise ValueError('fields with same names: %s' % dup)
+    names, indcol = _sex_header(hd)
+
     # read in the data
-    return readtxt(filename, names=names, usecols=indcol)
+    s = _sex_data(filename, first, names, indcol)
+    if s is None:
+        s = readtxt(filename, names=names, usecols=indcol)
+    if cache:
+        # write to a temporary file first, so other processes never
+        # read a partly-written file
+        tmpname = npyname + '.%i.tmp.npy' % os.getpid()
+        np.save(tmpname, s)
+        os.rename(tmpname, npyname)
+    return s
+
+DS9_HEADER = ('global font="helvetica 10 normal" select=1 highlite=1 '
+              'edit=0 move=1 delete=1 include=1 fixed=0 source')
+
+def _format_rows(fmt, cols, chunksize):
+    """ Yield lists of `fmt` % row for each row in columns `cols`, a
+    chunk of rows at a time.
+
+    Each column is a (function, length) pair, where the function
+    takes a slice and returns a list of values for the rows in that
+    slice. Only one chunk of values is formatted and held in memory
+    at a time.
+    """
+    n = cols[0][1] if cols else 0
+    for i in xrange(0, n, chunksize):
+        sl = slice(i, min(i + chunksize, n))
+        rows = zip(*[func(sl) for func, _ in cols])
+        yield [fmt % row for row in rows]
+
+def _str_column(a):
+    """ A column for `_format_rows` giving str() of each value."""
+    a = np.asarray(a)
+    return (lambda sl: a[sl].astype(str('U')).tolist()), len(a)
+
+def _value_column(a):
+    """ A column for `_format_rows` giving the values as Python
+    scalars."""
+    a = np.asarray(a)
+    return (lambda sl: a[sl].tolist()), len(a)
 
 def sex_to_DS9reg(filename, s, colour='green', tag='all', withtext=False,
-                  use_WORLD=False):
+                  use_WORLD=False, maglim=None, bounds=None, chunksize=100000):
     """Write a DS9 region file from SExtractor output.
 
     Parameters
@@ -542,14 +910,21 @@ def sex_to_DS9reg(filename, s, colour='green', tag='all', withtext=False,
     use_WORLD : bool (False)
       If True, use WORLD coordinates (typically RA/Dec) instead of
       IMAGE coordinates.
+    maglim : float or (float, float), optional
+      Only write objects with MAG_AUTO brighter than this, or between
+      these two limits.
+    bounds : (float, float, float, float), optional
+      Only write objects with xmin <= x <= xmax and ymin <= y <= ymax
+      for bounds (xmin, xmax, ymin, ymax), in the coordinates used
+      for the regions.
+    chunksize : int (100000)
+      Number of regions formatted and written at once.
     """
 
     names = set(s.dtype.names)
-    regions = ['global font="helvetica 10 normal" select=1 highlite=1 '
-               'edit=0 move=1 delete=1 include=1 fixed=0 source']
     fmt = 'ellipse(%s %s %s %s %s) # text={%s} color=%s tag={%s}'
     if not use_WORLD:
-        regions.append('image')
+        system = 'image'
         fields = ['X_IMAGE', 'Y_IMAGE']
         if not ('X_IMAGE' in names and 'Y_IMAGE' in names):
             fields = ['XWIN_IMAGE', 'YWIN_IMAGE']
@@ -560,9 +935,10 @@ def sex_to_DS9reg(filename, s, colour='green', tag='all', withtext=False,
         ellipse_vals = ['A_IMAGE','B_IMAGE','THETA_IMAGE']
         ellipsewin_vals = ['AWIN_IMAGE','BWIN_IMAGE','THETAWIN_IMAGE']
     else:
-        regions.append('J2000')
+        system = 'J2000'
         fields = ['X_WORLD', 'Y_WORLD']
         ellipse_vals = ['A_WORLD','B_WORLD','THETA_WORLD']
+        ellipsewin_vals = ['AWIN_WORLD','BWIN_WORLD','THETAWIN_WORLD']
         
     if all((n in names) for n in ellipse_vals):
         fields = list(fields) +  ellipse_vals
@@ -572,26 +948,53 @@ def sex_to_DS9reg(filename, s, colour='green', tag='all', withtext=False,
         # we don't have any ellipticity info, just write points.
         fmt = 'point(%s %s) # point=circle text={%s} color=%s tag={%s}'
 
-    for i,rec in enumerate(s):
-        vals = [rec[f] for f in fields]
-        if withtext:
-            if 'MAG_AUTO' in names:
-                text = '%i %.2f' % (i+1, rec['MAG_AUTO'])
-            else:
-                text = i+1
+    # select objects before formatting anything
+    ind = np.arange(len(s))
+    if maglim is not None:
+        mag = s['MAG_AUTO']
+        if np.ndim(maglim) == 0:
+            ind = ind[mag[ind] < maglim]
         else:
-            text = ''
-        if use_WORLD:
-            vals[-1] = -vals[-1]
-        vals.extend([text, colour, tag])
-        regions.append(fmt % tuple(vals))
+            ind = ind[(maglim[0] <= mag[ind]) & (mag[ind] < maglim[1])]
+    if bounds is not None:
+        x = s[fields[0]][ind]
+        y = s[fields[1]][ind]
+        ind = ind[(bounds[0] <= x) & (x <= bounds[1]) &
+                  (bounds[2] <= y) & (y <= bounds[3])]
+
+    cols = []
+    for f in fields:
+        val = s[f][ind]
+        if use_WORLD and f.startswith('THETA'):
+            val = -val
+        cols.append(_str_column(val))
+    # the text, colour and tag go straight into the format string
+    const = dict((k, v.replace('%', '%%')) for k, v in
+                 (('colour', colour), ('tag', tag)))
+    if withtext:
+        if 'MAG_AUTO' in names:
+            text = '%i %.2f'
+            cols.extend([_value_column(ind + 1),
+                         _value_column(s['MAG_AUTO'][ind])])
+        else:
+            text = '%i'
+            cols.append(_value_column(ind + 1))
+    else:
+        text = ''
+    fmt = '\n' + fmt % (tuple(['%s'] * len(fields)) +
+                        (text, const['colour'], const['tag']))
 
     fh = open(filename,'w')
-    fh.write('\n'.join(regions))
-    fh.close()
+    try:
+        fh.write(DS9_HEADER + '\n' + system)
+        for lines in _format_rows(fmt, cols, chunksize):
+            fh.write(''.join(lines))
+    finally:
+        fh.close()
 
 def write_DS9reg(x, y, filename=None, coord='IMAGE', ptype='x', size=20,
-                 c='green', tag='all', width=1, text=None):
+                 c='green', tag='all', width=1, text=None, chunksize=100000,
+                 stream=False):
     """Write a region file for ds9 for a  list of coordinates.
 
     Parameters
@@ -614,35 +1017,59 @@ def write_DS9reg(x, y, filename=None, coord='IMAGE', ptype='x', size=20,
     tag : str ('all')
       DS9 tag.
     width : int (1)
+    chunksize : int (100000)
+      Number of regions formatted and written at once.
+    stream : bool (False)
+      If True and `filename` is given, the regions are written to
+      the file in chunks without keeping them all in memory, and
+      nothing is returned.
+
+    Returns
+    -------
+    header, regions : lists of str
+      The region file lines (unless `stream` is True).
+
+    Notes
+    -----
+    ptype, size, width, text, c and tag may be given either as one
+    value for all points, or a value for each point.
     """
-    header = ['global font="helvetica 10 normal" select=1 highlite=1 '
-               'edit=0 move=1 delete=1 include=1 fixed=0 source\n']
+    header = [DS9_HEADER + '\n']
     header.append(coord + '\n')
 
-    if not iscontainer(ptype):
-        ptype = [ptype] * len(x)
-    if not iscontainer(size):
-        size = [size] * len(x)
-    if not iscontainer(width):
-        width = [width] * len(x)
-    if not iscontainer(text):
-        if isinstance(text, basestring):
-            text = [text]* len(x)
+    x = np.asarray(x, float)
+    y = np.asarray(y, float)
+    if text is None or not (iscontainer(text) or
+                            isinstance(text, basestring)):
+        text = np.arange(len(x))
+    # per-point values are formatted for each row, single values go
+    # straight into the format string.
+    fmt = ['point(%12.8f,%12.8f) # point=']
+    cols = [_value_column(x), _value_column(y)]
+    for prefix, val in (('', ptype), (' ', size), (' width=', width),
+                        (' text={', text), ('} color=', c), (' tag={', tag)):
+        fmt.append(prefix)
+        if iscontainer(val):
+            fmt.append('%s')
+            cols.append(_str_column(val))
         else:
-            text = list(range(len(x)))
-    if not iscontainer(c):
-        c = [c] * len(x)
-    if not iscontainer(tag):
-        tag = [tag] * len(x)
+            fmt.append(unicode(val).replace('%', '%%'))
+    fmt.append('}\n')
+    fmt = ''.join(fmt)
 
-    regions = []
-    fmt = ('point(%12.8f,%12.8f) # \
-point=%s %s width=%s text={%s} color=%s tag={%s}\n')
-    for i in xrange(len(x)):
-        vals = (x[i], y[i], ptype[i], size[i], width[i], text[i],
-                c[i], tag[i])
-        regions.append(fmt % vals)
+    if stream and filename is not None:
+        fh = open(filename,'w')
+        try:
+            fh.writelines(header)
+            for lines in _format_rows(fmt, cols, chunksize):
+                fh.write(''.join(lines))
+        finally:
+            fh.close()
+        return
 
+    regions = []
+    for lines in _format_rows(fmt, cols, chunksize):
+        regions.extend(lines)
     if filename is not None:
         fh = open(filename,'w')
         fh.writelines(header + regions)
@@ -0,0 +1,329 @@
+""" Count pairs of objects in bins of projected separation and
+velocity difference.
+
+This is used to measure the clustering of galaxies around absorbers
+(or QSO sightlines), or of galaxies around each other. For each pair
+the transverse separation r_perp is found from the angular separation
+and the distance to the first object of the pair, and the velocity
+difference is found from the redshifts of the two objects.
+
+Pairs are found with a `barak.coord.SkyIndex` of the second
+catalogue, in chunks of objects from the first catalogue, so large
+catalogues (~10^6 objects) can be used without comparing every pair.
+
+Errors can be estimated by counting pairs separately for each of a
+set of regions (for example, each QSO sightline or field), and then
+using `jackknife` or `bootstrap` to resample the regions.
+
+Examples
+--------
+>>> from astropy.cosmology import FlatLambdaCDM
+>>> cosmo = FlatLambdaCDM(H0=70, Om0=0.3)
+>>> rbins = np.logspace(-2, 1, 16)       # Mpc
+>>> vbins = [-500, 500]                  # km/s
+>>> n = pair_counts(ra_abs, dec_abs, z_abs, ra_gal, dec_gal, z_gal,
+...                 rbins, vbins, cosmo, region=isightline)
+>>> nj = jackknife(n)
+>>> err = jackknife_std(nj)
+"""
+from __future__ import division, print_function, unicode_literals
+try:
+    unicode
+except NameError:
+    unicode = basestring = str
+    xrange = range
+
+from .coord import SkyIndex, DEG_PER_RAD, _check_ra_dec, _distsq_to_radians
+from .sed import vel_from_wa
+
+import numpy as np
+
+# redshift spacing of the grid used to interpolate distances
+DZ_GRID = 1e-3
+# maximum number of candidate pairs checked at once
+MAXPAIRS = 2**21
+
+def _distance(z, cosmo, comoving=False):
+    """ Distance in Mpc that converts angles to transverse
+    separations at each redshift.
+
+    This is the angular diameter distance for proper separations, or
+    the transverse comoving distance for comoving separations. It is
+    interpolated from a grid in redshift with spacing `DZ_GRID`, as
+    calculating it for every redshift can be slow.
+    """
+    z = np.asarray(z, float)
+    if len(z) == 0:
+        return np.zeros(0)
+    zmin, zmax = z.min(), z.max()
+    zgrid = np.linspace(zmin, zmax, int((zmax - zmin) / DZ_GRID) + 2)
+    if comoving:
+        d = cosmo.comoving_transverse_distance(zgrid)
+    else:
+        d = cosmo.angular_diameter_distance(zgrid)
+    return np.interp(z, zgrid, d.to_value('Mpc'))
+
+def velocity_difference(z1, z2):
+    """ The velocity in km/s of redshift `z2` relative to redshift
+    `z1`.
+
+    This is c (z2 - z1) / (1 + z1).
+    """
+    z1 = np.asarray(z1, float)
+    return vel_from_wa(1 + np.asarray(z2, float), 1., z1)
+
+def iter_pairs(ra1, dec1, z1, ra2, dec2, z2, rmax, dvmax, cosmo,
+               comoving=False, exclude_self=False, index=None,
+               chunksize=10000, workers=1):
+    """ Find all pairs closer than a transverse separation and
+    velocity difference, yielding them in chunks.
+
+    Parameters
+    ----------
+    ra1, dec1, z1 : arrays of floats, shape (N,)
+      Coordinates in degrees and redshifts of the first objects
+      (e.g. absorbers). Redshifts must be > 0, otherwise a
+      ValueError is raised.
+    ra2, dec2, z2 : arrays of floats, shape (M,)
+      Coordinates in degrees and redshifts of the second objects
+      (e.g. galaxies).
+    rmax : float
+      Maximum transverse separation in Mpc.
+    dvmax : float
+      Maximum absolute velocity difference in km/s (inclusive).
+    cosmo : astropy.cosmology instance
+      The cosmology used to find transverse separations.
+    comoving : bool (False)
+      If True, find comoving transverse separations rather than
+      proper separations.
+    exclude_self : bool (False)
+      Exclude pairs with the same index in both catalogues. Use this
+      when the two catalogues are the same.
+    index : barak.coord.SkyIndex instance, optional
+      An index of `ra2`, `dec2`. If not given, one is made.
+    chunksize : int (10000)
+      Maximum number of first objects searched at once. Fewer are
+      searched at once if they would have more than `MAXPAIRS`
+      candidate pairs.
+    workers : int (1)
+      Number of processes used to search the index.
+
+    Yields
+    ------
+    i, j, rp, dv : arrays, shape (P,)
+      For each pair, the index of the first object, the index of
+      the second object, their transverse separation in Mpc at the
+      redshift of the first object, and the velocity of the second
+      object relative to the first in km/s (see
+      `velocity_difference`). Pairs are not returned in any
+      particular order.
+    """
+    ra1 = np.atleast_1d(np.asarray(ra1, float))
+    dec1 = np.atleast_1d(np.asarray(dec1, float))
+    z1 = np.atleast_1d(np.asarray(z1, float))
+    ra2 = np.atleast_1d(np.asarray(ra2, float))
+    dec2 = np.atleast_1d(np.asarray(dec2, float))
+    z2 = np.atleast_1d(np.asarray(z2, float))
+    _check_ra_dec(ra1, dec1)
+    _check_ra_dec(ra2, dec2)
+    if not (len(ra1) == len(z1) and len(ra2) == len(z2)):
+        raise ValueError('Each catalogue must have the same number of '
+                         'coordinates and redshifts')
+    if not np.all(z1 > 0):
+        raise ValueError('The redshifts of the first objects must be > 0')
+    if len(ra1) == 0 or len(z2) == 0:
+        return
+
+    dist1 = _distance(z1, cosmo, comoving=comoving)
+    # maximum angular separation of a pair for each first object,
+    # in degrees.
+    theta = np.minimum(DEG_PER_RAD * rmax / dist1, 180.)
+    if index is None:
+        index = SkyIndex(ra2, dec2, height=np.median(theta))
+
+    # Search for objects with similar radii together, in chunks
+    # with at most MAXPAIRS candidate pairs to check, so memory use
+    # doesn't depend on the search radius or the density of objects.
+    order = theta.argsort(kind='mergesort')
+    ncand = index._count_candidates(ra1[order], dec1[order], theta[order])
+    cumcand = np.cumsum(ncand)
+    k = 0
+    while k < len(order):
+        start = cumcand[k - 1] if k > 0 else 0
+        kend = cumcand.searchsorted(start + MAXPAIRS, side='right')
+        kend = max(k + 1, min(k + chunksize, kend))
+        ind1 = order[k:kend]
+        k = kend
+        for iq, j, d2 in index.pairs(ra1[ind1], dec1[ind1], theta[ind1],
+                                     chunksize=len(ind1), workers=workers):
+            i = ind1[iq]
+            dv = velocity_difference(z1[i], z2[j])
+            c = np.abs(dv) <= dvmax
+            if exclude_self:
+                c &= i != j
+            i, j, dv = i[c], j[c], dv[c]
+            rp = _distsq_to_radians(d2[c]) * dist1[i]
+            c = rp < rmax
+            yield i[c], j[c], rp[c], dv[c]
+
+def pair_counts(ra1, dec1, z1, ra2, dec2, z2, rbins, vbins, cosmo,
+                comoving=False, region=None, nregion=None,
+                exclude_self=False, index=None, chunksize=10000,
+                workers=1):
+    """ Count pairs in bins of transverse separation and velocity
+    difference.
+
+    Parameters
+    ----------
+    ra1, dec1, z1 : arrays of floats, shape (N,)
+      Coordinates in degrees and redshifts of the first objects
+      (e.g. absorbers). Redshifts must be > 0.
+    ra2, dec2, z2 : arrays of floats, shape (M,)
+      Coordinates in degrees and redshifts of the second objects
+      (e.g. galaxies).
+    rbins : array of floats, shape (nr + 1,)
+      Bin edges for the transverse separation in Mpc, at the
+      redshift of the first object of each pair.
+    vbins : array of floats, shape (nv + 1,)
+      Bin edges for the velocity of the second object relative to
+      the first in km/s. Velocities can be negative; use symmetric
+      bins such as [-500, 500] to count pairs within 500 km/s.
+    cosmo : astropy.cosmology instance
+      The cosmology used to find transverse separations.
+    comoving : bool (False)
+      If True, use comoving transverse separations rather than
+      proper separations.
+    region : array of ints, shape (N,), optional
+      A region number from 0 to `nregion` - 1 for each first object
+      (e.g. the sightline or field it is in). If given, pairs are
+      counted separately for each region.
+    nregion : int, optional
+      The number of regions. By default this is region.max() + 1.
+    exclude_self : bool (False)
+      Exclude pairs with the same index in both catalogues. Use this
+      when the two catalogues are the same.
+    index : barak.coord.SkyIndex instance, optional
+      An index of `ra2`, `dec2`. If not given, one is made.
+    chunksize : int (10000)
+      Maximum number of first objects searched at once.
+    workers : int (1)
+      Number of processes used to search the index.
+
+    Returns
+    -------
+    counts : array of ints, shape (nr, nv) or (nregion, nr, nv)
+      The number of pairs in each bin. Bins include their lower
+      edge and exclude their upper edge. If `region` is given, this
+      is the number of pairs in each bin for each region.
+
+    See Also
+    --------
+    iter_pairs, jackknife, bootstrap
+    """
+    rbins = np.asarray(rbins, float)
+    vbins = np.asarray(vbins, float)
+    nr = len(rbins) - 1
+    nv = len(vbins) - 1
+    if nr < 1 or nv < 1:
+        raise ValueError('rbins and vbins need at least two edges')
+    if region is not None:
+        region = np.asarray(region, int)
+        if nregion is None:
+            nregion = region.max() + 1 if len(region) else 0
+    nbin = nr * nv if region is None else nregion * nr * nv
+    counts = np.zeros(nbin, int)
+
+    dvmax = np.abs(vbins[[0, -1]]).max()
+    for i, j, rp, dv in iter_pairs(
+            ra1, dec1, z1, ra2, dec2, z2, rbins[-1], dvmax, cosmo,
+            comoving=comoving, exclude_self=exclude_self, index=index,
+            chunksize=chunksize, workers=workers):
+        ir = rbins.searchsorted(rp, side='right') - 1
+        iv = vbins.searchsorted(dv, side='right') - 1
+        c = (ir >= 0) & (ir < nr) & (iv >= 0) & (iv < nv)
+        ibin = ir[c] * nv + iv[c]
+        if region is not None:
+            ibin += region[i[c]] * (nr * nv)
+        counts += np.bincount(ibin, minlength=nbin)
+
+    if region is None:
+        return counts.reshape(nr, nv)
+    return counts.reshape(nregion, nr, nv)
+
+def jackknife(counts):
+    """ Jackknife resamples of counts in regions.
+
+    Parameters
+    ----------
+    counts : array, shape (nregion, ...)
+      Counts (or any other quantity that is summed over regions) for
+      each region, such as the output of `pair_counts` with regions.
+
+    Returns
+    -------
+    samples : array, shape (nregion, ...)
+      The total over all regions except region i, for each region i.
+
+    See Also
+    --------
+    jackknife_std, bootstrap
+    """
+    counts = np.asarray(counts)
+    return counts.sum(axis=0) - counts
+
+def jackknife_std(samples):
+    """ The jackknife estimate of the standard deviation of a
+    quantity.
+
+    Parameters
+    ----------
+    samples : array, shape (nregion, ...)
+      The quantity calculated from each jackknife sample (see
+      `jackknife`).
+
+    Returns
+    -------
+    std : array, shape (...)
+      sqrt((n - 1) / n * sum((x - mean(x))**2)), where n is the
+      number of jackknife samples.
+    """
+    samples = np.asarray(samples, float)
+    n = len(samples)
+    return np.sqrt((n - 1) / n *
+                   ((samples - samples.mean(axis=0))**2).sum(axis=0))
+
+def bootstrap(counts, nboot=100, seed=None):
+    """ Bootstrap resamples of counts in regions.
+
+    Regions are drawn with replacement, and the counts summed over
+    the drawn regions.
+
+    Parameters
+    ----------
+    counts : array, shape (nregion, ...)
+      Counts (or any other quantity that is summed over regions) for
+      each region, such as the output of `pair_counts` with regions.
+    nboot : int (100)
+      Number of bootstrap samples.
+    seed : int or numpy.random.Generator, optional
+      Seed for the random number generator.
+
+    Returns
+    -------
+    samples : array, shape (nboot, ...)
+      The total over the drawn regions for each sample. The standard
+      deviation of a quantity calculated from these samples
+      estimates its error.
+
+    See Also
+    --------
+    jackknife
+    """
+    counts = np.asarray(counts)
+    n = len(counts)
+    rng = np.random.default_rng(seed)
+    # number of times each region is drawn in each sample
+    w = np.zeros((nboot, n), int)
+    for k in xrange(nboot):
+        w[k] = np.bincount(rng.integers(n, size=n), minlength=n)
+    return np.tensordot(w, counts, axes=(1, 0))
@@ -0,0 +1,287 @@
+""" Template-fitting photometric redshifts.
+
+The fluxes of a set of SED templates are found on a grid of redshift
+and E(B-V) with `barak.sed.make_mag_table`. For each object the
+chi-squared and best-fitting normalisation of every model are then
+found analytically, for many objects at once, giving the best-fitting
+model and a redshift probability distribution.
+
+Fluxes are in units of the flux of a zero magnitude source in the
+magnitude system of the table (maggies for AB magnitudes), so a
+magnitude m has flux 10**(-0.4 m). Use `mag_to_flux` to convert
+magnitudes and their errors.
+
+Examples
+--------
+>>> from barak.sed import get_bands, get_SEDs, make_mag_table
+>>> bands = get_bands('SDSS', 'u,g,r,i,z')
+>>> table = make_mag_table(get_SEDs('LBG'), bands, np.arange(0, 4, 0.01))
+>>> pz = PhotoZ(table)
+>>> flux, err = mag_to_flux(mags, magerrs)
+>>> res = pz.fit(flux, err)
+>>> res.z, res.pdf
+"""
+from __future__ import division, print_function, unicode_literals
+try:
+    unicode
+except NameError:
+    unicode = basestring = str
+    xrange = range
+
+from .utilities import adict
+from .sed import trapz_weights
+
+import numpy as np
+
+# maximum number of (object, model) pairs in each chunk
+MAXSIZE = 2000000
+
+def mag_to_flux(mag, magerr=None):
+    """ Convert magnitudes and errors to fluxes and errors.
+
+    Parameters
+    ----------
+    mag : array of floats
+    magerr : array of floats, optional
+
+    Returns
+    -------
+    flux : array of floats
+      Flux, 10**(-0.4 * mag).
+    err : array of floats
+      Flux errors (only returned if `magerr` is given), using the
+      linear approximation err = 0.4 ln(10) flux magerr.
+    """
+    flux = 10**(-0.4 * np.asarray(mag, float))
+    if magerr is None:
+        return flux
+    err = 0.4 * np.log(10) * flux * np.asarray(magerr, float)
+    return flux, err
+
+def _fit_chunk(models, models2, shape, zgrid, zweights, flux, err,
+               return_pdf):
+    """ Fit the models to a chunk of objects. See `PhotoZ.fit`."""
+    flux = np.atleast_2d(np.asarray(flux, float))
+    err = np.atleast_2d(np.asarray(err, float))
+    good = np.isfinite(flux) & np.isfinite(err) & (err > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        w = np.where(good, 1. / err**2, 0.)
+    f = np.where(good, flux, 0.)
+    wf = w * f
+    sff = (wf * f).sum(1)
+    sfm = np.dot(wf, models.T)
+    smm = np.dot(w, models2.T)
+    # best normalisation, forced to be non-negative. Models with no
+    # flux in any measured band have zero normalisation. Operations
+    # are done in place where possible, as these arrays are large.
+    norm = np.divide(sfm, smm, out=np.zeros_like(sfm), where=smm > 0)
+    np.maximum(norm, 0, out=norm)
+    # chi2 = sff - 2 a sfm + a**2 smm reduces to this for a = sfm/smm
+    # or a = 0
+    chi2 = np.multiply(norm, sfm, out=smm)
+    np.subtract(sff[:, None], chi2, out=chi2)
+    np.maximum(chi2, 0, out=chi2)
+
+    n = len(flux)
+    ibest = chi2.argmin(1)
+    r = np.arange(n)
+    chi2min = chi2[r, ibest]
+    ised, iebmv, iz = np.unravel_index(ibest, shape)
+    out = adict(chi2=chi2min, norm=norm[r, ibest], ised=ised, iEBmV=iebmv,
+                iz=iz, ngood=good.sum(1))
+
+    # marginalise over templates and E(B-V)
+    like = np.subtract(chi2, chi2min[:, None], out=sfm)
+    like *= -0.5
+    np.exp(like, out=like)
+    pdf = like.reshape(n, shape[0] * shape[1], shape[2]).sum(1)
+    pdf /= np.dot(pdf, zweights)[:, None]
+    out['zmean'] = np.dot(pdf, zweights * zgrid)
+    var = np.dot(pdf, zweights * zgrid**2) - out.zmean**2
+    out['zstd'] = np.sqrt(np.clip(var, 0, None))
+    if return_pdf:
+        out['pdf'] = pdf
+    return out
+
+# the models used by each worker process
+_WORKER_ARGS = None
+
+def _init_worker(*args):
+    global _WORKER_ARGS
+    _WORKER_ARGS = args
+
+def _fit_chunk_worker(args):
+    flux, err, return_pdf = args
+    # adict instances can't be pickled
+    return dict(_fit_chunk(*(_WORKER_ARGS + (flux, err, return_pdf))))
+
+class PhotoZ(object):
+    """ Photometric redshifts from fitting a grid of template fluxes.
+
+    Parameters
+    ----------
+    table : barak.sed.MagTable instance
+      Model fluxes for each SED, E(B-V) and redshift, made by
+      `barak.sed.make_mag_table`.
+
+    Attributes
+    ----------
+    table : MagTable instance
+    z : array of floats, shape (nz,)
+      The redshift grid.
+    models : array of floats, shape (nSED*nEBmV*nz, nband)
+      Model fluxes, with the redshift index changing fastest.
+    """
+    def __init__(self, table):
+        self.table = table
+        self.z = table.z
+        self.shape = table.flux.shape[:3]
+        self.models = np.ascontiguousarray(
+            table.flux.reshape(-1, table.flux.shape[-1]), dtype=float)
+        self.models[~np.isfinite(self.models)] = 0
+        self.models2 = self.models**2
+        # weights to integrate over redshift; a single redshift has
+        # all the probability
+        self.zweights = (trapz_weights(self.z) if len(self.z) > 1
+                         else np.ones(1))
+
+    def __repr__(self):
+        return 'PhotoZ(%r)' % self.table
+
+    def _chunksize(self, chunksize):
+        if chunksize is None:
+            chunksize = max(1, int(MAXSIZE // len(self.models)))
+        return chunksize
+
+    def iter_fit(self, flux, err, chunksize=None, workers=1,
+                 return_pdf=True):
+        """ Fit objects in chunks, yielding the results for each chunk.
+
+        The arguments are the same as for `fit`. Only a few chunks
+        are held in memory at once, so this can be used for very
+        large catalogues, or when the redshift probability
+        distributions of all objects would not fit in memory.
+
+        Yields
+        ------
+        i, res : int, adict
+          Index of the first object in the chunk, and the fit results
+          for the chunk as returned by `fit`.
+        """
+        flux = np.asarray(flux)
+        err = np.asarray(err)
+        if flux.shape != err.shape:
+            raise ValueError('flux and err must have the same shape')
+        if flux.shape[-1] != self.models.shape[1]:
+            raise ValueError('Expected fluxes in %i bands' %
+                             self.models.shape[1])
+        flux = flux.reshape(-1, flux.shape[-1])
+        err = err.reshape(-1, err.shape[-1])
+        chunksize = self._chunksize(chunksize)
+        starts = range(0, len(flux), chunksize)
+        args = (self.models, self.models2, self.shape, self.z,
+                self.zweights)
+        if workers == 1:
+            for i in starts:
+                res = _fit_chunk(*(args + (flux[i:i+chunksize],
+                                           err[i:i+chunksize],
+                                           return_pdf)))
+                yield i, self._finish(res)
+            return
+
+        import multiprocessing
+        from collections import deque
+        pool = multiprocessing.Pool(workers, _init_worker, args)
+        # only keep a few chunks queued at once to limit memory use
+        pending = deque()
+        try:
+            for i in starts:
+                task = (flux[i:i+chunksize], err[i:i+chunksize], return_pdf)
+                pending.append(
+                    (i, pool.apply_async(_fit_chunk_worker, (task,))))
+                if len(pending) >= 2 * workers:
+                    j, res = pending.popleft()
+                    yield j, self._finish(adict(res.get()))
+            while pending:
+                j, res = pending.popleft()
+                yield j, self._finish(adict(res.get()))
+        finally:
+            pool.terminate()
+
+    def _finish(self, res):
+        """ Add the best-fitting parameter values to the results."""
+        res['z'] = self.z[res.iz]
+        res['EBmV'] = self.table.EBmV[res.iEBmV]
+        bad = res.ngood == 0
+        if bad.any():
+            for key in ('chi2', 'norm', 'z', 'EBmV', 'zmean', 'zstd'):
+                res[key] = np.where(bad, np.nan, res[key])
+            for key in ('ised', 'iEBmV', 'iz'):
+                res[key][bad] = -1
+            if 'pdf' in res:
+                res.pdf[bad] = np.nan
+        return res
+
+    def fit(self, flux, err, chunksize=None, workers=1, return_pdf=True):
+        """ Find the best-fitting model and redshift probabilities.
+
+        For each object the normalisation of each model that
+        minimises chi-squared is found analytically, allowing only
+        positive normalisations. The redshift probability
+        distribution is proportional to exp(-chi2/2), summed over
+        SEDs and E(B-V), with a flat prior.
+
+        Parameters
+        ----------
+        flux, err : arrays of floats, shape (nobj, nband)
+          Fluxes and 1 sigma errors in each band, in the same units
+          as the table fluxes. Bands with a non-finite flux or error,
+          or an error <= 0 are ignored.
+        chunksize : int, optional
+          Number of objects fitted at once. By default this is
+          chosen to keep the memory used for each chunk below ~100
+          Mb.
+        workers : int (1)
+          Number of processes to use.
+        return_pdf : bool (True)
+          Whether to return the redshift probability distributions.
+
+        Returns
+        -------
+        res : adict
+          With keys
+
+          - z, EBmV: best-fitting redshift and E(B-V)
+          - ised, iEBmV, iz: best-fitting SED, E(B-V) and redshift
+            indices
+          - norm: best-fitting normalisation
+          - chi2: minimum chi-squared
+          - ngood: number of bands used in the fit
+          - zmean, zstd: mean and standard deviation of the redshift
+            probability distribution
+          - pdf: redshift probability density at each redshift in
+            the grid, shape (nobj, nz)
+
+          Objects with no usable bands have NaN values and indices
+          of -1.
+        """
+        flux = np.asarray(flux)
+        out = None
+        for i,res in self.iter_fit(flux, err, chunksize=chunksize,
+                                   workers=workers, return_pdf=return_pdf):
+            if out is None:
+                n = int(np.prod(flux.shape[:-1]))
+                out = adict((key, np.empty((n,) + val.shape[1:], val.dtype))
+                            for key,val in res.items())
+            for key in res:
+                out[key][i:i+len(res[key])] = res[key]
+        if out is None:
+            # no objects, so return empty arrays
+            empty = np.zeros((0, self.models.shape[1]))
+            out = self._finish(_fit_chunk(
+                self.models, self.models2, self.shape, self.z,
+                self.zweights, empty, empty, return_pdf))
+        if flux.ndim == 1:
+            for key in out:
+                out[key] = out[key][0]
+        return out
@@ -7,6 +7,10 @@ Inspired by the SED module in astLib by Matt Hilton
 - AB: Flat spectrum SED, used for calculation of magnitudes on the AB system.
 - SUN: The SED of the Sun.
 
+These, and the TEMPLATES and PASSBANDS dictionaries, are only created
+when they are first used, so importing this module is fast. This needs
+module-level __getattr__ (Python 3.7 or later); with older versions,
+including Python 2, they are created when the module is imported.
 """
 from __future__ import division, print_function, unicode_literals
 try:
@@ -22,9 +26,7 @@ from .utilities import get_data_path
 import numpy as np
 from numpy.random import randn
 
-import matplotlib.pyplot as pl
-
-import os, math
+import os, sys, math
 import warnings
 
 DATAPATH = get_data_path()
@@ -32,19 +34,25 @@ PATH_PASSBAND = DATAPATH + '/passbands/'
 PATH_EXTINCT = DATAPATH + '/atmos_extinction/'
 PATH_TEMPLATE = DATAPATH + '/templates/'
 
+# directory listings made by _listfiles, keyed by directory
+_LISTFILES_CACHE = {}
+
 def _listfiles(topdir):
-    names = [n for n in os.listdir(topdir) if os.path.isdir(topdir + n)]
-    files = dict([(n, []) for n in names])
-    for name in sorted(names):
-        for n in sorted(os.listdir(topdir + name)):
-            if n != 'README' and not os.path.isdir(topdir + name + '/'+ n) and \
-                   not n.startswith('effic') and \
-                   not n.endswith('.py') and not n.endswith('.pdf'):
-                files[name].append(n)
-    return files
-
-TEMPLATES = _listfiles(PATH_TEMPLATE)
-PASSBANDS = _listfiles(PATH_PASSBAND)
+    """ Return a dictionary of the files in each subdirectory of
+    `topdir`. The directories are only scanned once. """
+    if topdir not in _LISTFILES_CACHE:
+        names = [n for n in os.listdir(topdir) if os.path.isdir(topdir + n)]
+        files = dict([(n, []) for n in names])
+        for name in sorted(names):
+            for n in sorted(os.listdir(topdir + name)):
+                if n != 'README' and \
+                       not os.path.isdir(topdir + name + '/'+ n) and \
+                       not n.startswith('effic') and \
+                       not n.endswith('.py') and not n.endswith('.pdf'):
+                    files[name].append(n)
+        _LISTFILES_CACHE[topdir] = files
+    # return a copy so callers can't change the cached listing
+    return dict((k, list(v)) for k,v in _LISTFILES_CACHE[topdir].items())
 
 def get_bands(instr=None, names=None, ccd=None):
     """ Get one or more passbands by giving the instrument and
@@ -69,7 +77,7 @@ def get_bands(instr=None, names=None, ccd=None):
         else:
             return Passband(instr + '/' + names)
     elif names is None:
-        names = PASSBANDS[instr]
+        names = _listfiles(PATH_PASSBAND)[instr]
 
     return [Passband(instr + '/' + n, ccd=ccd) for n in names]
 
@@ -92,11 +100,75 @@ def get_SEDs(kind=None, names=None):
         else:
             return SED(kind + '/' + names)
     elif names is None:
-        names = TEMPLATES[kind]
+        names = _listfiles(PATH_TEMPLATE)[kind]
 
     return [SED(kind + '/' + n) for n in names]
 
 
+# Processed passbands, keyed by _passband_key()
+_PASSBAND_CACHE = {}
+
+# If True, processed passbands are also saved to (and read from) the
+# directory given by barak.utilities.get_cache_path(), so they only
+# need to be processed once across processes.
+PASSBAND_DISK_CACHE = False
+
+# change this if the passband processing changes, so old cached
+# passbands are not used.
+_PASSBAND_CACHE_VERSION = 1
+
+def _passband_key(*filenames):
+    """ A string identifying a processed passband, made from the
+    names and modification times of the files used to make it."""
+    import hashlib
+    items = ['%i' % _PASSBAND_CACHE_VERSION]
+    for name in filenames:
+        if name is None:
+            items.append('None')
+        else:
+            st = os.stat(name)
+            items.append('%s %r %i' % (os.path.abspath(name), st.st_mtime,
+                                       st.st_size))
+    return hashlib.sha1('\n'.join(items).encode('utf-8')).hexdigest()
+
+def _passband_cache_file(key):
+    from .utilities import get_cache_path
+    return get_cache_path() + 'passband_%s.npz' % key
+
+def _read_passband_cache(key):
+    """ Read a processed passband from the disk cache, or return None
+    if it isn't there."""
+    filename = _passband_cache_file(key)
+    if not os.path.exists(filename):
+        return None
+    d = np.load(filename)
+    state = {}
+    for attr in 'wa', 'tr', 'ntr':
+        state[attr] = d[attr]
+    for attr in 'atmos', 'effic':
+        state[attr] = (d[attr] if attr in d.files else None)
+    state['effective_wa'] = float(d['effective_wa'])
+    state['flux'] = dict(Vega=float(d['flux_Vega']), AB=float(d['flux_AB']))
+    _PASSBAND_CACHE[key] = state
+    return state
+
+def _write_passband_cache(key, state):
+    """ Save a processed passband to the disk cache."""
+    filename = _passband_cache_file(key)
+    kwargs = dict(wa=state['wa'], tr=state['tr'], ntr=state['ntr'],
+                  effective_wa=state['effective_wa'],
+                  flux_Vega=state['flux']['Vega'],
+                  flux_AB=state['flux']['AB'])
+    for attr in 'atmos', 'effic':
+        if state[attr] is not None:
+            kwargs[attr] = state[attr]
+    # write to a temporary file first so other processes never read a
+    # partly-written file.
+    tmpname = filename + '.%i.tmp.npz' % os.getpid()
+    np.savez(tmpname, **kwargs)
+    os.rename(tmpname, filename)
+
+
 class Passband(object):
     """This class describes a filter transmission curve. Passband
     objects are created by loading data from from text files
@@ -112,6 +184,10 @@ class Passband(object):
 
     The available passbands are in PASSBANDS.
 
+    Processed passbands are cached, so creating the same passband
+    again is fast. Set the module variable PASSBAND_DISK_CACHE to True
+    to also cache them on disk (see `barak.utilities.get_cache_path`).
+
     Attributes
     ----------
     wa : array of floats
@@ -132,19 +208,6 @@ class Passband(object):
             filepath = PATH_PASSBAND + filename
         else:
             filepath = filename
-        if filepath.endswith('.fits'):
-            try:
-                import pyfits
-            except ImportError:
-                import astropy.io.fits as pyfits
-            rec = pyfits.getdata(filepath, 1)
-            self.wa, self.tr = rec.wa, rec.tr
-        else:
-            self.wa, self.tr = loadtxt(filepath, usecols=(0,1), unpack=True)
-        # check wavelengths are sorted lowest -> highest
-        isort = self.wa.argsort()
-        self.wa = self.wa[isort]
-        self.tr = self.tr[isort]
 
         # get the name of the filter/passband file and the name of the
         # directory in which it lives (the instrument).
@@ -161,22 +224,49 @@ class Passband(object):
             warnings.warn('No cdd ("red" or "blue") given, assuming red.')
             ccd = 'red'
 
-        self.atmos = self.effic = None
+        efficpath = atmospath = None
         if ccd is not None:
-            # apply ccd/optics efficiency
-            name = PATH_PASSBAND + instr + '/effic_%s.txt' % ccd
-            wa, effic = loadtxt(name, usecols=(0,1), unpack=1)
-            self.effic = np.interp(self.wa, wa, effic)
-            self.tr *= self.effic
-
+            efficpath = PATH_PASSBAND + instr + '/effic_%s.txt' % ccd
         extinctmap = dict(LBC='kpno_atmos.dat', FORS='paranal_atmos.dat',
                           HawkI='paranal_atmos.dat',
                           KPNO_Mosaic='kpno_atmos.dat',
                           CTIO_Mosaic='ctio_atmos.dat')
-
         if instr in extinctmap:
+            atmospath = PATH_EXTINCT + extinctmap[instr]
+
+        # use an already processed passband if we can
+        key = _passband_key(filepath, efficpath, atmospath)
+        state = _PASSBAND_CACHE.get(key)
+        if state is None and PASSBAND_DISK_CACHE:
+            state = _read_passband_cache(key)
+        if state is not None:
+            self._set_state(state)
+            return
+
+        if filepath.endswith('.fits'):
+            try:
+                import pyfits
+            except ImportError:
+                import astropy.io.fits as pyfits
+            rec = pyfits.getdata(filepath, 1)
+            self.wa, self.tr = rec.wa, rec.tr
+        else:
+            self.wa, self.tr = loadtxt(filepath, usecols=(0,1), unpack=True)
+        # check wavelengths are sorted lowest -> highest
+        isort = self.wa.argsort()
+        self.wa = self.wa[isort]
+        self.tr = self.tr[isort]
+
+        self.atmos = self.effic = None
+        if efficpath is not None:
+            # apply ccd/optics efficiency
+            wa, effic = loadtxt(efficpath, usecols=(0,1), unpack=1)
+            self.effic = np.interp(self.wa, wa, effic)
+            self.tr *= self.effic
+
+        if atmospath is not None:
             # apply atmospheric extinction
-            wa, emag = loadtxt(PATH_EXTINCT + extinctmap[instr], unpack=1)
+            wa, emag = loadtxt(atmospath, unpack=1)
             self.atmos = np.interp(self.wa, wa, 10**(-0.4 * emag))
             self.tr *= self.atmos
 
@@ -217,8 +307,38 @@ class Passband(object):
         # find the AB and Vega magnitudes in this band for calculating
         # magnitudes.
         self.flux = {}
-        self.flux['Vega'] = VEGA.calc_flux(self)
-        self.flux['AB'] = AB.calc_flux(self)
+        self.flux['Vega'] = _reference_sed('VEGA').calc_flux(self)
+        self.flux['AB'] = _reference_sed('AB').calc_flux(self)
+
+        state = self._get_state()
+        _PASSBAND_CACHE[key] = state
+        if PASSBAND_DISK_CACHE:
+            _write_passband_cache(key, state)
+
+    # attributes kept in the passband caches
+    _cached_attributes = ('wa', 'tr', 'ntr', 'atmos', 'effic',
+                          'effective_wa', 'flux')
+
+    def _get_state(self):
+        state = {}
+        for attr in self._cached_attributes:
+            val = getattr(self, attr)
+            if isinstance(val, np.ndarray):
+                val = val.copy()
+            elif isinstance(val, dict):
+                val = dict(val)
+            state[attr] = val
+        return state
+
+    def _set_state(self, state):
+        # copy so that changing this passband doesn't change the cache
+        for attr in self._cached_attributes:
+            val = state[attr]
+            if isinstance(val, np.ndarray):
+                val = val.copy()
+            elif isinstance(val, dict):
+                val = dict(val)
+            setattr(self, attr, val)
 
     def __repr__(self):
         return 'Passband "%s"' % self.name
@@ -228,6 +348,7 @@ class Passband(object):
         transmission. This may or may not include ccd efficiency,
         losses from the atmosphere and telescope optics.
         """
+        import matplotlib.pyplot as pl
         tr = self.tr
         if ymax is not None:
             tr = self.tr / self.tr.max() * ymax
@@ -312,6 +433,7 @@ class SED(object):
         return fl
 
     def plot(self, log=False, ymax=None, **kwargs):
+        import matplotlib.pyplot as pl
         fl = self.fl
         if ymax is not None:
             fl = self.fl / self.fl.max() * ymax
@@ -399,11 +521,9 @@ class SED(object):
 
         Note that the distance modulus is not added.
 
-        mag_sigma : float
-          Add a gaussian random deviate to the magnitude, with sigma
-          given by this value.
-
         `system` is either 'Vega' or 'AB'
+
+        See `PhotometricNoise` to add noise to magnitudes.
         """
         f1 = self.calc_flux(band)
 
@@ -422,9 +542,7 @@ class SED(object):
 
         system is either 'Vega' or 'AB'.
 
-        mag_sigma : float
-          Add a gaussian random deviate to each magnitude, with sigma
-          given by this value.
+        See `PhotometricNoise` to add noise to magnitudes.
         """
         mag1 = self.calc_mag(band1, system=system)
         mag2 = self.calc_mag(band2, system=system)
@@ -444,22 +562,591 @@ class SED(object):
 
         See the extinction module for more information.
         """
-        import extinction as ext
-        ecurve = dict(MW= ext.MW_Cardelli89             ,
-                      SMC=ext.SMC_Gordon03              ,
-                      LMC=ext.LMC_Gordon03              ,
-                      starburst=ext.starburst_Calzetti00
-                      )
-
         sed = self.copy()
         sed.z0fl[:] = sed.z0fl_noextinct
-        tau = ecurve[ext_type](self.z0wa, EBmV=EBmV).tau
+        tau = _extinction_curve(ext_type)(self.z0wa, EBmV=EBmV).tau
         sed.z0fl *= np.exp(-tau)
         sed.EBmV = EBmV
 
         sed.redshift_to(sed.z)
         return sed
 
+    def _extinction_AlamAv(self, ext_type):
+        """ A(lambda)/A(V) and R(V) for an extinction curve at the
+        z = 0 wavelengths, cached for each curve."""
+        cache = self.__dict__.setdefault('_AlamAv_cache', {})
+        if ext_type in cache:
+            wa, AlamAv, Rv = cache[ext_type]
+            if wa is self.z0wa:
+                return AlamAv, Rv
+        ec = _extinction_curve(ext_type)(self.z0wa)
+        cache[ext_type] = self.z0wa, ec.AlamAv, ec.Rv
+        return ec.AlamAv, ec.Rv
+
+    def reddened_fluxes(self, ext_type, EBmV, wa=None):
+        """ Fluxes of the SED for many values of E(B-V).
+
+        This gives the same fluxes as `apply_extinction` for each
+        E(B-V), without making new SED instances. The extinction
+        curve is only calculated once for each `ext_type`.
+
+        Parameters
+        ----------
+        ext_type : str
+          Extinction law, one of 'MW', 'SMC', 'LMC' or 'starburst'.
+        EBmV : array of floats, shape (nEBmV,)
+          E(B-V) values, applied in the SED rest frame.
+        wa : array of floats, shape (npix,), optional
+          Wavelengths at which to return the fluxes. By default the
+          SED wavelengths (at the current redshift) are used.
+
+        Returns
+        -------
+        fl : array of floats, shape (nEBmV, npix)
+          Fluxes (erg/s/cm^2/Ang) at the current redshift.
+
+        Examples
+        --------
+        >>> phot = BatchPhotometry(get_bands('SDSS', 'u,g,r'), sed.wa)
+        >>> EBmV = np.linspace(0, 0.5, 51)
+        >>> mags = phot.mags(sed.reddened_fluxes('SMC', EBmV))
+        """
+        from .extinction import tau_from_AlamAv
+        AlamAv, Rv = self._extinction_AlamAv(ext_type)
+        EBmV = np.atleast_1d(np.asarray(EBmV, float))
+        tau = tau_from_AlamAv(AlamAv[None, :], EBmV[:, None] * Rv)
+        fl = self.z0fl_noextinct * np.exp(-tau)
+        # redshift in the same way as redshift_to
+        fl /= 1 + self.z
+        if wa is not None:
+            wa0 = self.z0wa * (1 + self.z)
+            fl = np.array([np.interp(wa, wa0, f) for f in fl])
+        return fl
+
+def trapz_weights(x):
+    """ Weights for integrating with the trapezium rule.
+
+    Parameters
+    ----------
+    x : array of floats, shape (N,)
+      Sample points.
+
+    Returns
+    -------
+    w : array of floats, shape (N,)
+      Weights such that ``np.trapz(y, x) == np.dot(w, y)`` for any y
+      sampled at x, so many integrals over the same x can be found
+      with one matrix product.
+    """
+    w = np.zeros(len(x))
+    if len(x) > 1:
+        dx = np.diff(x)
+        w[:-1] += 0.5 * dx
+        w[1:] += 0.5 * dx
+    return w
+
+class BatchPhotometry(object):
+    """ Synthetic photometry for many SEDs in many passbands at once.
+
+    The passbands are interpolated once onto a common wavelength
+    grid to make a (nband, npix) weight matrix. Fluxes for any
+    number of SEDs sampled on that grid are then found with a single
+    matrix product. The results are the same as `SED.calc_flux` and
+    `SED.calc_mag` for SEDs sampled on the same grid, provided the
+    grid samples the passbands at least as finely as their own
+    wavelength tables.
+
+    Parameters
+    ----------
+    bands : list of Passband instances, shape (nband,)
+    wa : array of floats, shape (npix,)
+      Wavelength grid (Angstroms, increasing) for the SED fluxes. It
+      must cover every passband.
+
+    Attributes
+    ----------
+    bands : list of Passband
+    wa : array of floats, shape (npix,)
+    weights : array of floats, shape (nband, npix)
+      Passband weights, normalised so that the mean flux in each
+      band is ``np.dot(weights, fl)``.
+
+    Examples
+    --------
+    >>> bands = get_bands('SDSS', 'u,g,r,i,z')
+    >>> wa = make_constant_dv_wa_scale(2500, 12000, 50)
+    >>> phot = BatchPhotometry(bands, wa)
+    >>> seds = get_SEDs('pickles')
+    >>> mags = phot.mags(phot.resample(seds))  # shape (nSED, 5)
+    """
+    def __init__(self, bands, wa):
+        if isinstance(bands, Passband):
+            bands = [bands]
+        self.bands = list(bands)
+        self.wa = np.asarray(wa, float)
+        self.weights = np.zeros((len(self.bands), len(self.wa)))
+        for k,band in enumerate(self.bands):
+            if self.wa[0] > band.wa[0] or self.wa[-1] < band.wa[-1]:
+                raise ValueError('Wavelength grid does not cover %s' % band)
+            # same weighting as SED.calc_flux
+            i,j = self.wa.searchsorted([band.wa[0], band.wa[-1]])
+            wa = self.wa[i:j]
+            w = np.interp(wa, band.wa, band.tr) * wa * trapz_weights(wa)
+            self.weights[k, i:j] = w / w.sum()
+
+        self.refflux = dict((system, np.array([b.flux[system] for b in
+                                               self.bands]))
+                            for system in ('AB', 'Vega'))
+
+    def __repr__(self):
+        return 'BatchPhotometry(%s bands, %i pixels)' % (
+            len(self.bands), len(self.wa))
+
+    def resample(self, seds):
+        """ Interpolate SEDs onto the wavelength grid.
+
+        Parameters
+        ----------
+        seds : list of SED instances, shape (nSED,)
+
+        Returns
+        -------
+        fl : array of floats, shape (nSED, npix)
+        """
+        if isinstance(seds, SED):
+            seds = [seds]
+        fl = np.empty((len(seds), len(self.wa)))
+        for i,sed in enumerate(seds):
+            fl[i] = np.interp(self.wa, sed.wa, sed.fl)
+        return fl
+
+    def fluxes(self, fl):
+        """ Find the mean flux in each passband.
+
+        Parameters
+        ----------
+        fl : array of floats, shape (..., npix)
+          SED fluxes (erg/s/cm^2/Ang) on the wavelength grid. Any
+          number of leading dimensions is allowed.
+
+        Returns
+        -------
+        flux : array of floats, shape (..., nband)
+          Mean flux (erg/s/cm^2/Ang) in each band.
+        """
+        fl = np.asarray(fl, float)
+        if fl.shape[-1] != len(self.wa):
+            raise ValueError('Last axis of fl must have length %i' %
+                             len(self.wa))
+        return np.dot(fl, self.weights.T)
+
+    def mags(self, fl, system='AB'):
+        """ Find magnitudes in each passband.
+
+        Parameters
+        ----------
+        fl : array of floats, shape (..., npix)
+          SED fluxes (erg/s/cm^2/Ang) on the wavelength grid.
+        system : {'AB', 'Vega'}
+          Magnitude system.
+
+        Returns
+        -------
+        mag : array of floats, shape (..., nband)
+          Magnitudes. These are inf where the flux is not positive.
+        """
+        return self.mags_from_fluxes(self.fluxes(fl), system=system)
+
+    def mags_from_fluxes(self, flux, system='AB'):
+        """ Convert band fluxes from `fluxes` to magnitudes.
+        """
+        if system not in self.refflux:
+            raise ValueError("system must be 'AB' or 'Vega'")
+        flux = np.asarray(flux, float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mag = -2.5 * np.log10(flux / self.refflux[system])
+        mag[~(flux > 0)] = np.inf
+        if system == 'Vega':
+            # Vega has V=0.026 (see SED.calc_mag)
+            mag += 0.026
+        return mag
+
+def _extinction_curve(ext_type):
+    """ Return the extinction curve function for one of the names
+    accepted by `SED.apply_extinction`."""
+    from . import extinction as ext
+    ecurve = dict(MW=ext.MW_Cardelli89,
+                  SMC=ext.SMC_Gordon03,
+                  LMC=ext.LMC_Gordon03,
+                  starburst=ext.starburst_Calzetti00)
+    try:
+        return ecurve[ext_type]
+    except KeyError:
+        raise ValueError('Unknown extinction type %r, must be one of %s' % (
+            ext_type, ', '.join(sorted(ecurve))))
+
+class MagTable(object):
+    """ Magnitudes of SED templates on a grid of redshifts.
+
+    Made by `make_mag_table`.
+
+    Attributes
+    ----------
+    flux : array of floats, shape (nSED, nEBmV, nz, nband)
+      Mean flux in each band divided by the flux of the reference
+      (AB or Vega) SED in that band.
+    mags : array of floats, shape (nSED, nEBmV, nz, nband)
+      Magnitudes (inf where the flux is not positive).
+    z : array of floats, shape (nz,)
+      Redshift grid, increasing.
+    EBmV : array of floats, shape (nEBmV,)
+      E(B-V) values for the extinction applied to each SED.
+    ext_type : str or None
+      The extinction curve used (see `SED.apply_extinction`).
+    labels : list of str, shape (nSED,)
+      SED labels.
+    bandnames : list of str, shape (nband,)
+      Passband names.
+    system : str
+      Magnitude system, 'AB' or 'Vega'.
+    """
+    def __init__(self, flux, z, EBmV, ext_type, labels, bandnames, system):
+        self.flux = flux
+        self.z = z
+        self.EBmV = EBmV
+        self.ext_type = ext_type
+        self.labels = list(labels)
+        self.bandnames = list(bandnames)
+        self.system = system
+
+    def __repr__(self):
+        return ('MagTable(%i SEDs, %i E(B-V), %i redshifts %.3g-%.3g, '
+                '%i bands, %s)' % (
+                    len(self.labels), len(self.EBmV), len(self.z),
+                    self.z[0], self.z[-1], len(self.bandnames), self.system))
+
+    @property
+    def mags(self):
+        return self._flux_to_mag(self.flux)
+
+    def _flux_to_mag(self, flux):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mag = -2.5 * np.log10(flux)
+        mag[~(flux > 0)] = np.inf
+        if self.system == 'Vega':
+            # see SED.calc_mag
+            mag += 0.026
+        return mag
+
+    def interp_flux(self, z):
+        """ Linearly interpolate the fluxes to redshift(s) `z`.
+
+        Parameters
+        ----------
+        z : float or array of floats, shape (M,)
+          Redshifts inside the range of the grid.
+
+        Returns
+        -------
+        flux : array of floats, shape (nSED, nEBmV, [M,] nband)
+        """
+        z = np.asarray(z, float)
+        scalar = (z.ndim == 0)
+        z = np.atleast_1d(z)
+        if (z < self.z[0]).any() or (z > self.z[-1]).any():
+            raise ValueError('Redshift outside the range %g-%g' % (
+                self.z[0], self.z[-1]))
+        if len(self.z) == 1:
+            flux = self.flux[:, :, [0] * len(z)]
+        else:
+            i = np.clip(self.z.searchsorted(z) - 1, 0, len(self.z) - 2)
+            f = (z - self.z[i]) / (self.z[i+1] - self.z[i])
+            f = f[:, None]
+            flux = (1 - f) * self.flux[:, :, i] + f * self.flux[:, :, i+1]
+        if scalar:
+            flux = flux[:, :, 0]
+        return flux
+
+    def interp_mag(self, z):
+        """ Magnitudes at redshift(s) `z`, interpolated in flux.
+
+        Returns an array of shape (nSED, nEBmV, [M,] nband). See
+        `interp_flux`.
+        """
+        return self._flux_to_mag(self.interp_flux(z))
+
+    def colour(self, band1, band2, z=None):
+        """ Colour band1 - band2, given as band indices or names.
+
+        If `z` is None the colour at each redshift in the grid is
+        returned, otherwise the colour interpolated to `z`.
+        """
+        if not isinstance(band1, (int, np.integer)):
+            band1 = self.bandnames.index(band1)
+        if not isinstance(band2, (int, np.integer)):
+            band2 = self.bandnames.index(band2)
+        mags = (self.mags if z is None else self.interp_mag(z))
+        return mags[..., band1] - mags[..., band2]
+
+    def save(self, filename):
+        """ Save the table to a numpy .npz file."""
+        np.savez(filename, flux=self.flux, z=self.z, EBmV=self.EBmV,
+                 ext_type=np.array('' if self.ext_type is None
+                                   else self.ext_type),
+                 labels=np.array(self.labels),
+                 bandnames=np.array(self.bandnames),
+                 system=np.array(self.system))
+
+    @classmethod
+    def load(cls, filename):
+        """ Read a table written by `save`."""
+        d = np.load(filename)
+        ext_type = str(d['ext_type'])
+        return cls(d['flux'], d['z'], d['EBmV'], ext_type or None,
+                   [str(n) for n in d['labels']],
+                   [str(n) for n in d['bandnames']], str(d['system']))
+
+def _mag_table_key(seds, bands, z, EBmV, ext_type, system, dv):
+    """ A hash identifying the inputs to make_mag_table."""
+    import hashlib
+    h = hashlib.sha1()
+    for sed in seds:
+        h.update(np.ascontiguousarray(sed.z0wa, float).tobytes())
+        h.update(np.ascontiguousarray(sed.z0fl, float).tobytes())
+    for band in bands:
+        h.update(np.ascontiguousarray(band.wa, float).tobytes())
+        h.update(np.ascontiguousarray(band.tr, float).tobytes())
+        h.update(np.array(band.flux[system], float).tobytes())
+    h.update(np.ascontiguousarray(z, float).tobytes())
+    h.update(np.ascontiguousarray(EBmV, float).tobytes())
+    h.update(('%s %s %r' % (ext_type, system, float(dv))).encode('utf-8'))
+    return h.hexdigest()
+
+def make_mag_table(seds, bands, z, EBmV=None, ext_type=None, system='AB',
+                   dv=20., cache=True, cachedir=None, verbose=False):
+    """ Find the magnitudes of SEDs in passbands on a redshift grid.
+
+    The redshifted SED fluxes are evaluated directly on a common
+    wavelength grid and the band fluxes found with
+    `BatchPhotometry`, so this is much faster than calling
+    `SED.redshift_to` and `SED.calc_mag` for each redshift. The
+    table can be cached on disk, keyed by a hash of the inputs, so
+    it is only calculated once.
+
+    Parameters
+    ----------
+    seds : list of SED instances, shape (nSED,)
+      Templates, at z = 0.
+    bands : list of Passband instances, shape (nband,)
+    z : array of floats, shape (nz,)
+      Increasing redshift grid.
+    EBmV : array of floats, shape (nEBmV,), optional
+      E(B-V) values for rest-frame extinction applied to each SED
+      (see `SED.apply_extinction`). Must be given with `ext_type`.
+    ext_type : str, optional
+      The extinction curve, 'MW', 'SMC', 'LMC' or 'starburst'.
+    system : {'AB', 'Vega'}
+    dv : float (20)
+      Pixel width in km/s of the common wavelength grid.
+    cache : bool (True)
+      If True, read the table from the cache directory if it was
+      made before, otherwise make it and save it there.
+    cachedir : str, optional
+      Directory for cached tables. Default is given by
+      `barak.utilities.get_cache_path`.
+    verbose : bool (False)
+
+    Returns
+    -------
+    table : MagTable instance
+      ``table.mags`` has shape (nSED, nEBmV, nz, nband), where nEBmV
+      is 1 if no extinction is applied.
+
+    Examples
+    --------
+    >>> bands = get_bands('SDSS', 'u,g,r,i,z')
+    >>> seds = get_SEDs('LBG')
+    >>> table = make_mag_table(seds, bands, np.arange(0, 4, 0.01))
+    >>> umg = table.colour('SDSS/u', 'SDSS/g', z=[2.5, 3.1])
+    """
+    if isinstance(seds, SED):
+        seds = [seds]
+    if isinstance(bands, Passband):
+        bands = [bands]
+    z = np.atleast_1d(np.asarray(z, float))
+    if (np.diff(z) <= 0).any():
+        raise ValueError('z must be increasing')
+    if (EBmV is None) != (ext_type is None):
+        raise ValueError('Both or neither of EBmV and ext_type must be given')
+    EBmV = np.atleast_1d(np.asarray(0. if EBmV is None else EBmV, float))
+    if system not in ('AB', 'Vega'):
+        raise ValueError("system must be 'AB' or 'Vega'")
+
+    if cache:
+        from .utilities import get_cache_path
+        if cachedir is None:
+            cachedir = get_cache_path()
+        key = _mag_table_key(seds, bands, z, EBmV, ext_type, system, dv)
+        filename = os.path.join(cachedir, 'magtable_%s.npz' % key)
+        if os.path.exists(filename):
+            if verbose:
+                print('Reading cached table %s' % filename)
+            return MagTable.load(filename)
+
+    wmin = min(b.wa[0] for b in bands)
+    wmax = max(b.wa[-1] for b in bands)
+    wa = make_constant_dv_wa_scale(wmin, wmax * (1 + 2*dv/c_kms), dv)
+    phot = BatchPhotometry(bands, wa)
+
+    if ext_type is not None:
+        from .extinction import tau_from_AlamAv
+    flux = np.empty((len(seds), len(EBmV), len(z), len(bands)))
+    # redshift in chunks to limit memory use
+    nchunk = max(1, int(2e6 // len(wa)))
+    for i,sed in enumerate(seds):
+        if verbose:
+            print('%i of %i: %s' % (i+1, len(seds), sed.label))
+        wa0 = sed.z0wa
+        if ext_type is not None:
+            AlamAv, Rv = sed._extinction_AlamAv(ext_type)
+        for j,ebmv in enumerate(EBmV):
+            fl0 = sed.z0fl
+            if ext_type is not None and ebmv != 0:
+                fl0 = fl0 * np.exp(-tau_from_AlamAv(AlamAv, ebmv * Rv))
+            for k in range(0, len(z), nchunk):
+                zp1 = 1 + z[k:k+nchunk, None]
+                # flux of the SED at z, conserving the total flux as
+                # in SED.redshift_to
+                fl = np.interp(wa / zp1, wa0, fl0) / zp1
+                flux[i, j, k:k+nchunk] = phot.fluxes(fl)
+
+    flux /= phot.refflux[system]
+    table = MagTable(flux, z, EBmV, ext_type, [s.label for s in seds],
+                     [b.name for b in bands], system)
+    if cache:
+        # write to a temporary file first, so other processes never
+        # read a partly-written table
+        tmpname = filename + '.%i.tmp.npz' % os.getpid()
+        table.save(tmpname)
+        os.rename(tmpname, filename)
+    return table
+
+class PhotometricNoise(object):
+    """ Monte Carlo realisations of noisy photometry.
+
+    Gaussian noise is added to the flux in each band, with a
+    standard deviation given by the depth in that band. Fluxes are in
+    units of the flux of a zero magnitude source (maggies for AB
+    magnitudes), so a magnitude m has flux 10**(-0.4 m).
+
+    Parameters
+    ----------
+    depths : array of floats, shape (nband,) or (nobj, nband)
+      Limiting magnitude in each band at `nsigma` significance.
+    nsigma : float (5)
+      Significance of the limiting magnitudes.
+    seed : int or numpy.random.Generator, optional
+      Seed for the random number generator.
+
+    Attributes
+    ----------
+    sigma : array of floats, shape (nband,) or (nobj, nband)
+      The 1 sigma flux error in each band.
+    rng : numpy.random.Generator
+      Random number generator used for the noise.
+
+    Examples
+    --------
+    >>> noise = PhotometricNoise([24.5, 25.0, 24.8], nsigma=5, seed=1)
+    >>> mags = np.array([[23.1, 22.5, 22.4], [24.0, 23.9, 23.7]])
+    >>> obs, err = noise.realise(mags, 1000)       # shape (1000, 2, 3)
+    >>> for obs, err in noise.iter_realise(mags, 10**6, chunksize=10**4):
+    ...     detected = (obs[..., 1] < 24).mean(0)
+    """
+    def __init__(self, depths, nsigma=5., seed=None):
+        self.depths = np.asarray(depths, float)
+        self.nsigma = float(nsigma)
+        self.sigma = 10**(-0.4 * self.depths) / self.nsigma
+        self.rng = np.random.default_rng(seed)
+
+    def __repr__(self):
+        return 'PhotometricNoise(depths=%s, nsigma=%g)' % (
+            self.depths.tolist(), self.nsigma)
+
+    def realise_flux(self, mags, nreal):
+        """ Draw noisy fluxes.
+
+        Parameters
+        ----------
+        mags : array of floats, shape (nobj, nband)
+          True magnitudes. Use inf for zero flux.
+        nreal : int
+          Number of realisations for each object.
+
+        Returns
+        -------
+        flux : array of floats, shape (nreal, nobj, nband)
+          Noisy fluxes.
+        sigma : array of floats, shape (nobj, nband)
+          1 sigma flux errors.
+        """
+        mags = np.atleast_2d(np.asarray(mags, float))
+        flux = 10**(-0.4 * mags)
+        sigma = np.broadcast_to(self.sigma, mags.shape)
+        dev = self.rng.standard_normal((int(nreal),) + mags.shape)
+        dev *= sigma
+        dev += flux
+        return dev, sigma
+
+    def realise(self, mags, nreal):
+        """ Draw noisy magnitudes.
+
+        Parameters
+        ----------
+        mags : array of floats, shape (nobj, nband)
+          True magnitudes. Use inf for zero flux.
+        nreal : int
+          Number of realisations for each object.
+
+        Returns
+        -------
+        mags, errors : arrays of floats, shape (nreal, nobj, nband)
+          Noisy magnitudes and their 1 sigma errors. Both are inf
+          where the noisy flux is not positive.
+        """
+        flux, sigma = self.realise_flux(mags, nreal)
+        return _flux_to_mag_err(flux, sigma)
+
+    def iter_realise(self, mags, nreal, chunksize=10000, flux=False):
+        """ Draw noisy magnitudes in chunks to limit memory use.
+
+        Yields the same values as `realise` (or `realise_flux` if
+        `flux` is True) split into chunks of at most `chunksize`
+        realisations along the first axis. With the same seed, the
+        chunks joined together are identical to a single call.
+        """
+        nreal = int(nreal)
+        for i in range(0, nreal, chunksize):
+            n = min(chunksize, nreal - i)
+            if flux:
+                yield self.realise_flux(mags, n)
+            else:
+                yield self.realise(mags, n)
+
+def _flux_to_mag_err(flux, sigma):
+    """ Convert fluxes (in units of a zero magnitude source) and 1
+    sigma errors to magnitudes and magnitude errors."""
+    good = flux > 0
+    mag = np.empty_like(flux)
+    mag.fill(np.inf)
+    err = np.empty_like(flux)
+    err.fill(np.inf)
+    f = flux[good]
+    mag[good] = -2.5 * np.log10(f)
+    sigma = np.broadcast_to(sigma, flux.shape)[good]
+    err[good] = 2.5 / np.log(10) * sigma / f
+    return mag, err
+
 def mag2flux(ABmag, band):
     """ Converts given AB magnitude into flux in the given band, in
     erg/s/cm^2/Angstrom.
@@ -531,6 +1218,29 @@ def flambda_to_fnu(wa, f_lambda):
     return (wa * 1e-8)**2 * f_lambda * 1e8 / c
 
 
+# QSO templates read by _qso_template_data()
+_QSO_TEMPLATES = {}
+
+def _qso_template_data(name):
+    """ Return the rest wavelength and flux arrays for a QSO template
+    ('sdss' or 'uv'). Each template is only read once."""
+    if name not in _QSO_TEMPLATES:
+        filename = dict(sdss='templates/qso/dr1QSOspec.fits',
+                        uv='templates/qso/Shull_composite.fits')[name]
+        T = readtabfits(DATAPATH + filename)
+        _QSO_TEMPLATES[name] = np.asarray(T.wa), np.asarray(T.fl)
+    return _QSO_TEMPLATES[name]
+
+def _interp_template(wa, z, name):
+    """ Interpolate a QSO template at redshift(s) z onto wa."""
+    twa, tfl = _qso_template_data(name)
+    z = np.asarray(z, float)
+    if z.ndim == 0:
+        return np.interp(wa, twa * (1 + z), tfl)
+    wa = np.asarray(wa, float)
+    wrest = wa / (1 + z[:, None])
+    return np.interp(wrest.ravel(), twa, tfl).reshape(wrest.shape)
+
 def qso_template(wa, z):
     """ Return a composite QSO spectrum at redshift z.
 
@@ -542,15 +1252,18 @@ def qso_template(wa, z):
     ----------
     wa : array_like, shape (N,)
       Wavelength array in Angstroms
-    z : float
-      Redshift.
+    z : float or array of floats, shape (M,)
+      Redshift, or an array of redshifts.
     
     Returns
     -------
-    f_lambda : ndarray, shape (N,)
-      The QSO spectrum in F_lambda (the normalisation is arbitrary).
+    f_lambda : ndarray, shape (N,) or (M, N)
+      The QSO spectrum in F_lambda (the normalisation is arbitrary),
+      or one spectrum for each redshift if `z` is an array.
     """
     wa = np.array(wa, copy=False)
+    if np.ndim(z) > 0:
+        return _qso_template_block(wa, np.asarray(z, float))
     wrest = wa / (1+z)
     i = wrest.searchsorted(1680)
     if i == len(wrest):
@@ -566,29 +1279,44 @@ def qso_template(wa, z):
 
     return fl
 
+def _qso_template_block(wa, z):
+    """ qso_template for an array of redshifts, shape (nz, npix)."""
+    npix = len(wa)
+    # index of 1680 Angstroms (rest) for each redshift
+    i = wa.searchsorted(1680 * (1 + z))
+    uv = qso_template_uv(wa, z)
+    sdss = qso_template_sdss(wa, z)
+    rows = np.arange(len(z))
+    j = np.minimum(i, npix - 1)
+    mixed = (i > 0) & (i < npix)
+    fl = np.where(np.arange(npix) < i[:, None],
+                  uv / np.where(mixed, uv[rows, j], 1)[:, None],
+                  sdss / np.where(mixed, sdss[rows, j], 1)[:, None])
+    return fl
+
 def qso_template_sdss(wa, z):
     """ Return a composite visible QSO spectrum at redshift z.
 
     The SDSS composite spectrum as a function of F_lambda is returned
-    at each wavelength wa. wa must be in Angstroms.
+    at each wavelength wa. wa must be in Angstroms. If `z` is an
+    array, an array of shape (len(z), len(wa)) is returned.
 
     Only good between 700 and 8000 Angstroms (rest frame).
     """
-    T = readtabfits(DATAPATH + '/templates/qso/dr1QSOspec.fits')
-    return np.interp(wa, T.wa*(1+z), T.fl)
+    return _interp_template(wa, z, 'sdss')
 
 def qso_template_uv(wa, z):
     """ Return a composite UV QSO spectrum at redshift z.
 
-    Wavelengths must be in Angstroms.
+    Wavelengths must be in Angstroms. If `z` is an array, an array of
+    shape (len(z), len(wa)) is returned.
 
     This is a smoothed version of the HST/COS EUV+FUV AGN composite
     spectrum shown in Figure 5 of Shull, Stevans, and Danforth 2012.
 
     Only good between 550 and 1730 Angstroms (rest frame)
     """
-    T = readtabfits(DATAPATH + 'templates/qso/Shull_composite.fits')
-    return np.interp(wa, T.wa*(1 + z), T.fl)
+    return _interp_template(wa, z, 'uv')
 
 
 def make_constant_dv_wa_scale(wmin, wmax, dv):
@@ -638,16 +1366,44 @@ def vel_from_wa(wa, wa0, redshift=0):
     obswa = wa0 * (1 + redshift)
     return (wa / obswa - 1) * c_kms
 
-# Data
-VEGA = SED('reference/Vega_bohlin2006')
-SUN = SED('reference/sun_stis')
-
-# AB SED has constant flux density (f_nu) 3631 Jy, see
-# http://www.sdss.org/dr5/algorithms/fluxcal.html
-
-fnu = 3631 * Jy   # erg/s/cm^2/Hz
-wa = np.logspace(1, 10, 1e5)   # Ang
-AB = SED(wa=wa, fl=fnu_to_flambda(wa, fnu))
-
-# don't clutter the namespace
-del wa, fnu
+# Reference SEDs, made when first needed by _reference_sed()
+_REFERENCE_SEDS = {}
+
+def _reference_sed(name):
+    """ Return one of the reference SEDs VEGA, SUN or AB."""
+    if name not in _REFERENCE_SEDS:
+        if name == 'VEGA':
+            sed = SED('reference/Vega_bohlin2006')
+        elif name == 'SUN':
+            sed = SED('reference/sun_stis')
+        elif name == 'AB':
+            # AB SED has constant flux density (f_nu) 3631 Jy, see
+            # http://www.sdss.org/dr5/algorithms/fluxcal.html
+            fnu = 3631 * Jy   # erg/s/cm^2/Hz
+            wa = np.logspace(1, 10, 100000)   # Ang
+            sed = SED(wa=wa, fl=fnu_to_flambda(wa, fnu))
+        else:
+            raise ValueError('Unknown reference SED %r' % name)
+        _REFERENCE_SEDS[name] = sed
+    return _REFERENCE_SEDS[name]
+
+def __getattr__(name):
+    # Create the module-level data (VEGA, SUN, AB, TEMPLATES,
+    # PASSBANDS) on first access.
+    if name in ('VEGA', 'SUN', 'AB'):
+        val = _reference_sed(name)
+    elif name == 'TEMPLATES':
+        val = _listfiles(PATH_TEMPLATE)
+    elif name == 'PASSBANDS':
+        val = _listfiles(PATH_PASSBAND)
+    else:
+        raise AttributeError('module %r has no attribute %r' % (
+            __name__, name))
+    globals()[name] = val
+    return val
+
+if sys.version_info < (3, 7):
+    # Module __getattr__ (PEP 562) is ignored, so create the data now.
+    for _name in ('VEGA', 'SUN', 'AB', 'TEMPLATES', 'PASSBANDS'):
+        __getattr__(_name)
+    del _name
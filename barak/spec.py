@@ -32,8 +32,16 @@ from .stats import remove_outliers
 DATAPATH = get_data_path()
 
 debug = False
-def getwave(hd):
-    """ Given a fits header, get the wavelength solution.
+def _wave_solution(hd):
+    """ Find the wavelength solution in a fits header without making
+    the wavelength array.
+
+    Returns
+    -------
+    wstart, dw, npts, dv
+      Arguments for `make_wa_scale`. If the scale is log-linear
+      `wstart` and `dw` are log10(Angstroms) and dv is the pixel
+      width in km/s, otherwise dv is None.
     """
     dv = None
     dw = get_cdelt(hd)
@@ -48,9 +56,16 @@ def getwave(hd):
         #wstart = 10**wstart
         #dv = c_kms * (1. - 1. / 10. ** -dw)
         dv = dw * c_kms * np.log(10.)
-        print('constant dv = %.3f km/s (assume CRVAL1 in log(Angstroms))' % dv)
 
     npts = hd[str('NAXIS1')]
+    return wstart, dw, npts, dv
+
+def getwave(hd):
+    """ Given a fits header, get the wavelength solution.
+    """
+    wstart, dw, npts, dv = _wave_solution(hd)
+    if dv is not None:
+        print('constant dv = %.3f km/s (assume CRVAL1 in log(Angstroms))' % dv)
     return make_wa_scale(wstart, dw, npts, constantdv=dv)
 
 def get_cdelt(hd):
@@ -144,6 +159,129 @@ def make_wa_scale(wstart, dw, npts, constantdv=False, verbose=False):
         wa = wstart + np.arange(npts, dtype=float) * dw
     return wa
 
+class WaveGrid(object):
+    """ A linear or log-linear wavelength scale described by its
+    first value, step size and number of pixels.
+
+    This gives the same wavelengths as `make_wa_scale`, but
+    index <-> wavelength conversions take constant time and the full
+    wavelength array is only made when it is needed (for example by
+    ``np.asarray(grid)``).
+
+    Parameters
+    ----------
+    start : float
+      Wavelength of the first pixel in Angstroms, or log10 of the
+      wavelength if `kind` is 'loglinear'.
+    step : float
+      Width of each pixel in Angstroms, or log10(Angstroms) if
+      `kind` is 'loglinear'.
+    npts : int
+      Number of pixels.
+    kind : {'linear', 'loglinear'}
+      Kind of wavelength scale.
+
+    Examples
+    --------
+    >>> grid = WaveGrid(4000, 0.5, 1000)
+    >>> i, j = grid.searchsorted([4100, 4200])
+    >>> wa = np.asarray(grid)
+    """
+    __slots__ = ('start', 'step', 'npts', 'kind')
+
+    def __init__(self, start, step, npts, kind='linear'):
+        if kind not in ('linear', 'loglinear'):
+            raise ValueError('Unknown kind of wavelength scale %r' % kind)
+        self.start = float(start)
+        self.step = float(step)
+        self.npts = int(npts)
+        self.kind = kind
+
+    @classmethod
+    def from_header(cls, hd):
+        """ Make a grid from the wavelength solution in a fits header.
+        """
+        wstart, dw, npts, dv = _wave_solution(hd)
+        return cls(wstart, dw, npts,
+                   kind=('loglinear' if dv is not None else 'linear'))
+
+    def __repr__(self):
+        return 'WaveGrid(%r, %r, %r, kind=%r)' % (
+            self.start, self.step, self.npts, self.kind)
+
+    def __len__(self):
+        return self.npts
+
+    def __array__(self, dtype=None, copy=None):
+        wa = self.wavelength(np.arange(self.npts, dtype=float))
+        if dtype is not None:
+            wa = wa.astype(dtype)
+        return wa
+
+    def __getitem__(self, item):
+        if isinstance(item, (int, np.integer)):
+            if item < 0:
+                item += self.npts
+            if not 0 <= item < self.npts:
+                raise IndexError('index %i out of range' % item)
+            return self.wavelength(float(item))
+        return self.wavelength(
+            np.arange(self.npts, dtype=float)[item])
+
+    @property
+    def dw(self):
+        """ Pixel width (log10(Angstroms) for a log-linear scale)."""
+        return self.step
+
+    @property
+    def dv(self):
+        """ Pixel width in km/s for a log-linear scale, otherwise None.
+        """
+        if self.kind == 'loglinear':
+            return c_kms * (1. - 1. / 10. ** self.step)
+        return None
+
+    def wavelength(self, i):
+        """ Wavelength of pixel index `i` (may be fractional)."""
+        x = self.start + np.asarray(i, float) * self.step
+        if self.kind == 'loglinear':
+            x = 10**x
+        return x
+
+    def index(self, wa):
+        """ Fractional pixel index of wavelength `wa`."""
+        wa = np.asarray(wa, float)
+        if self.kind == 'loglinear':
+            wa = np.log10(wa)
+        return (wa - self.start) / self.step
+
+    def searchsorted(self, wa, side='left'):
+        """ Equivalent to ``np.asarray(grid).searchsorted(wa, side)``,
+        but takes constant time."""
+        wa = np.asarray(wa, float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            x = self.index(wa)
+        if self.kind == 'loglinear':
+            x = np.where(wa <= 0, -1, x)
+        x = np.where(np.isnan(wa), self.npts, x)
+        # estimate, then correct any rounding error by comparing with
+        # the exact pixel wavelengths.
+        ind = np.clip(np.ceil(x), 0, self.npts).astype(int)
+        if side == 'left':
+            below = lambda w, i: w <= self.wavelength(i)
+        elif side == 'right':
+            below = lambda w, i: w < self.wavelength(i)
+        else:
+            raise ValueError('side must be "left" or "right"')
+        for _ in range(2):
+            dec = (ind > 0) & below(wa, ind - 1)
+            ind = np.where(dec, ind - 1, ind)
+            inc = (ind < self.npts) & ~below(wa, np.minimum(ind, self.npts - 1))
+            ind = np.where(inc, ind + 1, ind)
+        if ind.ndim == 0:
+            return int(ind)
+        return ind
+
 class Spectrum(object):
     """ A class to hold information about a spectrum.
     
@@ -165,6 +303,10 @@ class Spectrum(object):
       Instrumental FWHM in km/s
     filename : str
       Filename of spectrum
+    grid : WaveGrid or None
+      The wavelength scale, if it was generated from keywords (or
+      given as `grid`). The `wa` array is then only made when it is
+      first used.
 
     Notes
     -----
@@ -197,7 +339,7 @@ class Spectrum(object):
                  dw=None, dv=None, wstart=None, wend=None, npts=None,
                  CRVAL=None, CRPIX=None, CDELT=None,
                  wa=None, fl=None, er=None, co=None,
-                 fwhm=None, filename=None):
+                 fwhm=None, filename=None, grid=None):
         """ Create the wavelength scale and initialise attributes."""
         if fl is not None:
             fl = np.asarray(fl)
@@ -230,7 +372,11 @@ class Spectrum(object):
                 wstart = 10**wstart
                 dv = c_kms * (1. - 1. / 10. ** -dw)
 
-        if wa is not None:
+        if grid is not None:
+            npts = len(grid)
+            dw, dv = grid.dw, grid.dv
+            makescale = False
+        elif wa is not None:
             wa = np.asarray(wa, float)
             npts = len(wa)
             makescale = False
@@ -253,8 +399,9 @@ class Spectrum(object):
 
         if makescale:
             if debug: print('making wav scale,', wstart, dw, npts, bool(dv))
-            wa = make_wa_scale(wstart, dw, npts, constantdv=bool(dv))
-        else:
+            grid = WaveGrid(wstart, dw, npts,
+                            kind=('loglinear' if dv else 'linear'))
+        elif grid is None:
             # check whether wavelength scale is linear or log-linear
             # (constant velocity)
             diff = wa[1:] - wa[:-1]
@@ -278,7 +425,26 @@ class Spectrum(object):
         self.dw = dw
         self.dv = dv
         self.filename = filename
-        self.wa = wa
+        self.grid = grid
+        self._wa = wa
+
+    @property
+    def wa(self):
+        if self._wa is None:
+            self._wa = np.asarray(self.grid)
+        return self._wa
+
+    @wa.setter
+    def wa(self, val):
+        self._wa = val
+        self.grid = None
+
+    def __setstate__(self, state):
+        # spectra pickled before wa became a property
+        if 'wa' in state:
+            state['_wa'] = state.pop('wa')
+            state.setdefault('grid', None)
+        self.__dict__.update(state)
 
     def __repr__(self):
         return 'Spectrum(wa, fl, er, co, dw, dv, fwhm, filename)'
@@ -315,7 +481,10 @@ class Spectrum(object):
          mean flux, RMS of flux, mean error, SNR:
             SNR = (mean flux / RMS)
         """
-        i,j = self.wa.searchsorted([wa1, wa2])
+        if self.grid is not None:
+            i,j = self.grid.searchsorted([wa1, wa2])
+        else:
+            i,j = self.wa.searchsorted([wa1, wa2])
         fl = self.fl[i:j]
         er = self.er[i:j]
         good = (er > 0) & ~np.isnan(fl)
@@ -339,6 +508,23 @@ class Spectrum(object):
     def rebin_simple(self, n):
         """ Class method version of spec.rebin_simple()."""
         return rebin_simple(self.wa, self.fl, self.er, self.co, n)
+
+    def slice(self, wmin, wmax):
+        """ Return the part of the spectrum with wmin <= wa <= wmax
+        as a `LightSpectrum`.
+
+        The arrays in the new spectrum are views of this spectrum's
+        arrays, so no data is copied.
+        """
+        if self.dv is not None:
+            grid = 'loglinear', self.dw, c_kms * (1. - 1. / 10. ** self.dw)
+        elif self.dw is not None:
+            grid = 'linear', self.dw, None
+        else:
+            grid = None
+        sp = LightSpectrum(self.wa, self.fl, er=self.er, co=self.co,
+                           fwhm=self.fwhm, filename=self.filename, grid=grid)
+        return sp.slice(wmin, wmax)
     
     def write(self, filename, header=None, overwrite=False):
         """ Writes out a spectrum, as ascii - wavelength, flux, error,
@@ -404,6 +590,122 @@ class Spectrum(object):
         if self.filename is None:
             self.filename = filename
 
+class LightSpectrum(object):
+    """ A lightweight spectrum, for making many small spectra cheaply.
+
+    Unlike `Spectrum`, the input arrays are not copied or modified
+    (so infinite and non-positive error values are not replaced by
+    NaN), the error and continuum arrays are only allocated when
+    they are first used, and the kind of wavelength scale is only
+    found when `dw`, `dv` or `kind` are needed.
+
+    Attributes
+    ----------
+    wa : array of floats, shape(N,)
+      Wavelength values, in increasing order.
+    fl : array of floats, shape(N,)
+      Flux.
+    er : array of floats, shape(N,)
+      Error (NaN if not given).
+    co : array of floats, shape(N,)
+      Continuum (NaN if not given).
+    kind : str
+      Wavelength scale, one of 'linear', 'loglinear' or 'irregular'.
+    dw : float
+      Wavelength difference between adjacent pixel centres
+      (log10(Angstroms) for a log-linear scale).
+    dv : float
+      Velocity difference (km/s) for a log-linear scale.
+    fwhm : float
+      Instrumental FWHM in km/s
+    filename : str
+      Filename of spectrum
+
+    Examples
+    --------
+    >>> sp = read('spectrum.fits')
+    >>> cutouts = [sp.slice(w - 5, w + 5) for w in wabsorbers]
+    """
+    __slots__ = ('wa', 'fl', '_er', '_co', '_grid', 'fwhm', 'filename')
+
+    def __init__(self, wa, fl, er=None, co=None, fwhm=None, filename=None,
+                 grid=None):
+        self.wa = np.asarray(wa)
+        self.fl = np.asarray(fl)
+        self._er = (None if er is None else np.asarray(er))
+        self._co = (None if co is None else np.asarray(co))
+        # (kind, dw, dv) from _classify_wa, found when needed.
+        self._grid = grid
+        self.fwhm = fwhm
+        self.filename = filename
+
+    def __repr__(self):
+        return 'LightSpectrum(wa, fl, er, co, dw, dv, fwhm, filename)'
+
+    def __len__(self):
+        return len(self.wa)
+
+    def _nanarray(self):
+        return np.empty(len(self.wa)) * np.nan
+
+    @property
+    def er(self):
+        if self._er is None:
+            self._er = self._nanarray()
+        return self._er
+
+    @er.setter
+    def er(self, val):
+        self._er = (None if val is None else np.asarray(val))
+
+    @property
+    def co(self):
+        if self._co is None:
+            self._co = self._nanarray()
+        return self._co
+
+    @co.setter
+    def co(self, val):
+        self._co = (None if val is None else np.asarray(val))
+
+    def _get_grid(self):
+        if self._grid is None:
+            self._grid = _classify_wa(self.wa)
+        return self._grid
+
+    @property
+    def kind(self):
+        return self._get_grid()[0]
+
+    @property
+    def dw(self):
+        return self._get_grid()[1]
+
+    @property
+    def dv(self):
+        return self._get_grid()[2]
+
+    def slice(self, wmin, wmax):
+        """ Return the part of the spectrum with wmin <= wa <= wmax.
+
+        The arrays in the new spectrum are views of this spectrum's
+        arrays, so no data is copied. Changing values in one changes
+        them in the other.
+        """
+        i, j = self.wa.searchsorted([wmin, wmax], side='left')
+        if j < len(self.wa) and self.wa[j] == wmax:
+            j += 1
+        s = slice(i, j)
+        grid = self._grid
+        if grid is not None and grid[0] == 'irregular':
+            # a part of an irregular grid may be regular
+            grid = None
+        return LightSpectrum(
+            self.wa[s], self.fl[s],
+            er=(None if self._er is None else self._er[s]),
+            co=(None if self._co is None else self._co[s]),
+            fwhm=self.fwhm, filename=self.filename, grid=grid)
+
 def read(filename, comment='#', debug=False):
     """
     Reads in QSO spectrum given a filename.  Returns a Spectrum class
@@ -604,6 +906,428 @@ def read(filename, comment='#', debug=False):
                     CRVAL=hd[str('CRVAL1')], CRPIX=crpix)
     #raise Exception('Unknown file format')
 
+# Fields stored for each spectrum by make_index().
+INDEX_DTYPE = [(str('filename'), str('U%i')),
+               (str('format'), str('U5')),
+               (str('wmin'), float),
+               (str('wmax'), float),
+               (str('npts'), int),
+               (str('kind'), str('U9')),
+               (str('dw'), float),
+               (str('dv'), float),
+               (str('snr'), float),
+               (str('instrument'), str('U20')),
+               (str('size'), int),
+               (str('mtime'), float)]
+
+# Header cards checked (in order) for a signal-to-noise estimate.
+SNR_KEYS = 'SNR', 'S_N', 'SN_MEDIAN', 'SN_MED', 'SPEC_SN'
+
+def _is_fits(filename):
+    """ Guess whether a (possibly gzipped) file is a fits file from
+    its first line. Uses the same test as `read`."""
+    if filename.endswith('.gz'):
+        import gzip
+        fh = gzip.open(filename, 'rb')
+    else:
+        fh = open(filename, 'rb')
+    test = fh.read(20)
+    fh.close()
+    return len(test) > 8 and test[8:9] == b'='
+
+def _classify_wa(wa):
+    """ Find whether a wavelength array is linear or log-linear.
+
+    Returns
+    -------
+    kind, dw, dv
+      kind is 'linear', 'loglinear' or 'irregular'. dw is the pixel
+      width in Angstroms ('linear') or log10(Angstroms)
+      ('loglinear'). dv is the pixel width in km/s for a log-linear
+      scale. Unknown values are None.
+    """
+    if len(wa) < 2:
+        return 'irregular', None, None
+    diff = wa[1:] - wa[:-1]
+    if np.allclose(diff, diff[0]):
+        return 'linear', np.median(diff), None
+    diff = np.log10(wa[1:]) - np.log10(wa[:-1])
+    if np.allclose(diff, diff[0]):
+        dw = np.median(diff)
+        return 'loglinear', dw, c_kms * (1. - 1. / 10. ** dw)
+    return 'irregular', None, None
+
+def _index_fits(filename):
+    """ Find the wavelength coverage of a fits spectrum, reading
+    only the header where possible."""
+    f = fits.open(filename)
+    try:
+        hd = f[0].header
+        info = dict(format='fits', kind='irregular', dw=None, dv=None)
+        instrument = ''
+        for key in 'INSTRUME', 'TELESCOP':
+            if str(key) in hd:
+                instrument = str(hd[str(key)]).strip()
+                break
+        info['instrument'] = instrument
+        info['snr'] = np.nan
+        for key in SNR_KEYS:
+            if str(key) in hd:
+                try:
+                    info['snr'] = float(hd[str(key)])
+                except (ValueError, TypeError):
+                    continue
+                break
+
+        wa = None
+        if hd.get(str('NAXIS'), 0) > 0 and get_cdelt(hd) is not None:
+            wstart, dw, npts, dv = _wave_solution(hd)
+            if dv is not None:
+                dv = c_kms * (1. - 1. / 10. ** dw)
+                w0, w1 = 10**wstart, 10**(wstart + (npts - 1) * dw)
+                info.update(kind='loglinear', dw=dw, dv=dv)
+            else:
+                w0, w1 = wstart, wstart + (npts - 1) * dw
+                info.update(kind='linear', dw=dw)
+            info.update(wmin=min(w0, w1), wmax=max(w0, w1), npts=npts)
+            return info
+        elif str('COEFF0') in hd and str('COEFF1') in hd:
+            # SDSS-style log-linear solution
+            wstart, dw = hd[str('COEFF0')], hd[str('COEFF1')]
+            npts = hd[str('NAXIS1')]
+            info.update(kind='loglinear', dw=dw,
+                        dv=c_kms * (1. - 1. / 10. ** dw), npts=npts,
+                        wmin=10**wstart, wmax=10**(wstart + (npts - 1) * dw))
+            return info
+
+        # No wavelength solution in the header, so we need to read
+        # the wavelength column (but not any other data).
+        if len(f) > 1 and f[1].data is not None:
+            names = f[1].data.dtype.names
+            for name in 'wa', 'wavelength', 'loglam':
+                if name in names:
+                    wa = np.asarray(f[1].data[str(name)], float)
+                    if name == 'loglam':
+                        wa = 10**wa
+                    break
+        if wa is None and f[0].data is not None and f[0].data.ndim == 2:
+            # Songaila-style, first row is the wavelength
+            wa = np.asarray(f[0].data[0], float)
+        if wa is None:
+            raise ValueError('Unknown file format')
+        wa = wa.ravel()
+        kind, dw, dv = _classify_wa(wa)
+        info.update(kind=kind, dw=dw, dv=dv, npts=len(wa),
+                    wmin=np.min(wa), wmax=np.max(wa))
+        return info
+    finally:
+        f.close()
+
+# number of data lines parsed at each end of an ascii spectrum by
+# _index_ascii, and the number of bytes read to find the last lines.
+INDEX_NLINE = 20
+INDEX_TAILSIZE = 2**16
+
+def _open_ascii(filename):
+    if filename.endswith('.gz'):
+        import gzip
+        return gzip.open(filename, 'rb')
+    return open(filename, 'rb')
+
+def _is_data_line(row, i, comment):
+    """ Whether a line (stripped of leading space) in an ascii
+    spectrum is data, rather than blank, a comment or a RESVEL
+    header."""
+    return not (not row or row.startswith(comment) or
+                (i == 0 and row[:6].upper() == b'RESVEL'))
+
+def _read_tail(fh, nbytes):
+    """ Read at least the last `nbytes` from the current position in
+    a file, without reading the rest where possible.
+
+    Returns the bytes read and their position in the file.
+    """
+    start = fh.tell()
+    try:
+        fh.seek(0, 2)
+    except (ValueError, OSError):
+        # compressed files can't seek from the end, so read through
+        # them in blocks, keeping the last two.
+        blocks = [b'', b'']
+        pos = start
+        while True:
+            block = fh.read(nbytes)
+            if not block:
+                break
+            pos += len(blocks[0])
+            blocks = [blocks[1], block]
+        return b''.join(blocks), pos
+    pos = max(start, fh.tell() - nbytes)
+    fh.seek(pos)
+    return fh.read(), pos
+
+def _index_ascii(filename, comment='#'):
+    """ Find the wavelength coverage of an ascii spectrum, parsing
+    only lines at its start and end.
+
+    If the wavelengths of those lines give a consistent linear or
+    log-linear scale, and the lines have a fixed width consistent
+    with the number of pixels that implies, the number of pixels is
+    found from the scale. Otherwise the lines are counted (without
+    parsing them), and the scale is only used if it gives the same
+    number of pixels.
+    """
+    comment = comment.encode('utf-8')
+    fh = _open_ascii(filename)
+    try:
+        # the first data lines, their lengths in bytes and the
+        # position of the first one
+        head = []
+        nbytes = []
+        first = None
+        i = 0
+        pos = fh.tell()
+        row = fh.readline()
+        while row:
+            if _is_data_line(row.lstrip(), i, comment):
+                if first is None:
+                    first = pos
+                head.append(float(row.split()[0]))
+                nbytes.append(len(row))
+                if len(head) == INDEX_NLINE:
+                    break
+            i += 1
+            pos = fh.tell()
+            row = fh.readline()
+        if not head:
+            raise ValueError('No data found in %s' % filename)
+        # the last data lines, and the position of the end of the
+        # last one
+        tail = []
+        last = None
+        if len(head) == INDEX_NLINE:
+            hend = fh.tell()
+            data, pos = _read_tail(fh, INDEX_TAILSIZE)
+            rows = data.split(b'\n')
+            offsets = np.cumsum([pos] + [len(r) + 1 for r in rows])
+            # the first line is incomplete unless it follows the
+            # first data lines
+            kmin = 0 if pos == hend else 1
+            for k in xrange(len(rows) - 1, kmin - 1, -1):
+                if _is_data_line(rows[k].lstrip(), 1, comment):
+                    if last is None:
+                        last = offsets[k + 1]
+                    tail.append(float(rows[k].split()[0]))
+                    nbytes.append(len(rows[k]) + 1)
+                    if len(tail) == INDEX_NLINE:
+                        break
+            tail = tail[::-1]
+    finally:
+        fh.close()
+
+    w0 = head[0]
+    if not tail:
+        # all the data lines are in head
+        wa = np.array(head)
+        kind, dw, dv = _classify_wa(wa)
+        npts = len(wa)
+        if kind == 'irregular':
+            kind = 'unknown'
+            dw = (abs(wa[-1] - w0) / (npts - 1) if npts > 1 else None)
+        return dict(format='ascii', wmin=min(w0, wa[-1]),
+                    wmax=max(w0, wa[-1]), npts=npts, kind=kind, dw=dw,
+                    dv=dv, snr=np.nan, instrument='')
+
+    w1 = tail[-1]
+    kind0, dw0, _ = _classify_wa(np.array(head))
+    kind1, dw1, _ = _classify_wa(np.array(tail))
+    # the number of pixels implied by the wavelength scale
+    nscale = None
+    if kind0 == kind1 and kind0 != 'irregular' and \
+           np.allclose(dw0, dw1, rtol=1e-4, atol=0):
+        if kind0 == 'linear':
+            x0, x1, xh = w0, w1, head[-1]
+        else:
+            x0, x1, xh = np.log10(w0), np.log10(w1), np.log10(head[-1])
+        # pixel width from the first lines, which is more precise
+        # than the difference between neighbouring pixels
+        npix = (x1 - x0) / ((xh - x0) / (len(head) - 1))
+        if abs(npix - round(npix)) < 0.1:
+            nscale = int(round(npix)) + 1
+
+    # The scale could have gaps, so only trust it if the lines have a
+    # fixed width that gives the same number of lines. Otherwise
+    # count them.
+    if nscale is not None and min(nbytes) == max(nbytes) and \
+           last - first == nbytes[0] * nscale:
+        npts = nscale
+    else:
+        npts = _count_data_lines(filename, first, last, comment)
+
+    info = dict(format='ascii', wmin=min(w0, w1), wmax=max(w0, w1),
+                npts=npts, snr=np.nan, instrument='')
+    if npts == nscale:
+        dw = (x1 - x0) / (npts - 1)
+        dv = (c_kms * (1. - 1. / 10. ** dw) if kind0 == 'loglinear'
+              else None)
+        info.update(kind=kind0, dw=dw, dv=dv)
+    else:
+        info.update(kind='unknown', dw=abs(w1 - w0) / (npts - 1), dv=None)
+    return info
+
+def _count_data_lines(filename, start, end, comment):
+    """ Count the lines between byte positions `start` and `end` of
+    an ascii file, without parsing them.
+
+    Empty lines and lines starting with `comment` are not counted
+    (but comments after leading whitespace are).
+    """
+    fh = _open_ascii(filename)
+    try:
+        fh.seek(start)
+        n = 0
+        remaining = end - start
+        prev = b'\n'
+        while remaining > 0:
+            block = fh.read(min(remaining, 2**20))
+            if not block:
+                # no newline at the end of the last line
+                n += 1
+                break
+            remaining -= len(block)
+            n += block.count(b'\n')
+            s = prev + block
+            n -= s.count(b'\n' + comment) + s.count(b'\n\n')
+            prev = block[-1:]
+    finally:
+        fh.close()
+    return n
+
+def make_index(filenames, indexfile=None, comment='#', verbose=False):
+    """ Make an index of spectra giving their wavelength coverage.
+
+    The index is found from fits headers and lines at the start and
+    end of ascii files, so it is much faster than reading every
+    spectrum with `read`.
+
+    Parameters
+    ----------
+    filenames : list of str
+      Spectrum filenames, in any format that `read` accepts.
+    indexfile : str, optional
+      If given, the index is saved to this file (with `numpy.save`).
+      If the file already exists, entries for spectra that have not
+      been modified since they were indexed are reused, so only new
+      or changed spectra are read.
+    comment : str ('#')
+      Comment character used in ascii spectra.
+    verbose : bool (False)
+      Print each spectrum as it is indexed.
+
+    Returns
+    -------
+    index : record array, shape (N,)
+      One row per filename, with fields:
+
+      filename, format ('fits' or 'ascii'), wmin, wmax, npts, kind
+      ('linear', 'loglinear', 'irregular' or 'unknown'), dw (pixel
+      width in Angstroms, or log10(Angstroms) if log-linear), dv
+      (pixel width in km/s), snr, instrument, size, mtime.
+
+      Unknown values are NaN or ''. The S/N is only known if it is
+      given in the header of a fits file. For ascii files the kind
+      of wavelength scale is found from lines at the start and end
+      of the file; if it is not linear or log-linear the kind is
+      'unknown' and dw is the mean pixel width.
+
+    See Also
+    --------
+    read_index, select_index
+
+    Examples
+    --------
+    >>> from glob import glob
+    >>> index = make_index(glob('spectra/*.fits'), 'index.npy')
+    >>> # later, after adding more spectra
+    >>> index = make_index(glob('spectra/*.fits'), 'index.npy')
+    """
+    if isinstance(filenames, basestring):
+        filenames = [filenames]
+    old = {}
+    if indexfile is not None and os.path.lexists(indexfile):
+        for row in read_index(indexfile):
+            old[row['filename']] = row
+
+    nchar = max([len(n) for n in filenames] + [1])
+    dtype = [(n, (t % nchar if n == 'filename' else t))
+             for n,t in INDEX_DTYPE]
+    index = np.empty(len(filenames), dtype=dtype)
+    nnew = 0
+    for i,filename in enumerate(filenames):
+        st = os.stat(filename)
+        row = old.get(filename)
+        if row is not None and row['size'] == st.st_size and \
+               row['mtime'] == st.st_mtime:
+            index[i] = tuple(row)
+            continue
+        if verbose:
+            print('Indexing %s' % filename)
+        if _is_fits(filename):
+            info = _index_fits(filename)
+        else:
+            info = _index_ascii(filename, comment=comment)
+        for key in info:
+            if info[key] is None:
+                info[key] = np.nan
+        info.update(filename=filename, size=st.st_size, mtime=st.st_mtime)
+        index[i] = tuple(info[n] for n,_ in INDEX_DTYPE)
+        nnew += 1
+
+    if verbose:
+        print('%i new spectra indexed, %i unchanged' % (
+            nnew, len(filenames) - nnew))
+
+    if indexfile is not None and (nnew > 0 or len(old) != len(index)):
+        fh = open(indexfile, 'wb')
+        np.save(fh, index)
+        fh.close()
+
+    return index.view(np.recarray)
+
+def read_index(indexfile):
+    """ Read an index of spectra written by `make_index`.
+    """
+    return np.load(indexfile).view(np.recarray)
+
+def select_index(index, wa1, wa2=None):
+    """ Find spectra in an index that cover a wavelength range.
+
+    Parameters
+    ----------
+    index : record array or str
+      Index made by `make_index`, or the name of an index file.
+    wa1, wa2 : float
+      The wavelength range that must be covered. If `wa2` is not
+      given, select spectra that cover the single wavelength `wa1`.
+
+    Returns
+    -------
+    index : record array
+      Rows of the index for spectra covering the wavelength range.
+
+    Examples
+    --------
+    >>> index = read_index('index.npy')
+    >>> civ = select_index(index, 1548.204 * (1 + 2.1))
+    >>> print(civ.filename)
+    """
+    if isinstance(index, basestring):
+        index = read_index(index)
+    if wa2 is None:
+        wa2 = wa1
+    wa1, wa2 = min(wa1, wa2), max(wa1, wa2)
+    return index[(index.wmin <= wa1) & (index.wmax >= wa2)]
+
 def rebin_simple(wa, fl, er, co, n):
     """ Bins up the spectrum by averaging the values of every n
     pixels. Not very accurate, but much faster than rebin().
@@ -673,16 +1397,13 @@ def rebin(wav, fl, er, **kwargs):
     if edges0[i+1] < edges1[0]:
         # Old wa scale extends lower than the rebinned scale. Find the
         # first old pixel that overlaps with rebinned scale.
-        while edges0[i+1] < edges1[0]:
-            i += 1
-        i -= 1
+        i = edges0[1:].searchsorted(edges1[0]) - 1
     elif edges0[0] > edges1[j+1]:
         # New rebinned wa scale extends lower than the old scale. Find
         # the first rebinned pixel that overlaps with the old spectrum
-        while edges0[0] > edges1[j+1]:
-            sp1.fl[j] = np.nan
-            sp1.er[j] = np.nan
-            j += 1
+        j = edges1[1:].searchsorted(edges0[0])
+        sp1.fl[:j] = np.nan
+        sp1.er[:j] = np.nan
         j -= 1
     lo0 = edges0[i]      # low edge of contr. (sub-)pixel in old scale
     while True:
@@ -1296,6 +2017,41 @@ def find_err(fl, co, nchunks=10):
     er = np.interp(np.arange(len(fl)), midpoints, rms)
     return er
 
+# PCA components read by _read_pca_qso()
+_PCA_QSO = {}
+
+# Standard deviations of the PCA weights, from Suzuki et al 2006.
+PCA_QSO_SIGMA = np.array([7.563, 3.604, 2.351, 2.148, 1.586,
+                          1.479, 1.137]) #, 0.778, 0.735, 0.673])
+
+def _read_pca_qso():
+    """ Read the mean qso spectrum and the first 7 principle
+    components from Suzuki et al. 2005. The file is only read once,
+    and the arrays returned are read-only.
+    """
+    if not _PCA_QSO:
+        filename = DATAPATH + '/PCAcont/Suzuki05/tab3.txt'
+        names = 'wa,mu,musig,e1,e2,e3,e4,e5,e6,e7,e8,e9,e10'
+        co = readtxt(filename, skip=23, names=names)
+        # use only the first 7 eigenvetors
+        eig = np.array([co['e%i' % i] for i in range(1,8)])
+        _PCA_QSO.update(wa=np.array(co.wa), mu=np.array(co.mu), eig=eig)
+        for val in _PCA_QSO.values():
+            val.setflags(write=False)
+    return _PCA_QSO['wa'], _PCA_QSO['mu'], _PCA_QSO['eig']
+
+def _pca_qso_weights(nspec, rng):
+    """ Generate PCA weights, shape (nspec, neig), from normal
+    distributions truncated at 3 sigma."""
+    w = rng.standard_normal((nspec, len(PCA_QSO_SIGMA)))
+    # make sure we don't have any very large deviations from the
+    # mean by redrawing them.
+    bad = np.abs(w) >= 3
+    while bad.any():
+        w[bad] = rng.standard_normal(bad.sum())
+        bad = np.abs(w) >= 3
+    return w * PCA_QSO_SIGMA
+
 def pca_qso_cont(nspec, seed=None, return_weights=False):
     """ Make qso continua using the PCA and weights from N. Suzuki et
     al. 2005 and N. Suzuki 2006.
@@ -1304,43 +2060,55 @@ def pca_qso_cont(nspec, seed=None, return_weights=False):
     ----------
     nspec : int
       Number of spectra to create
+    seed : int or numpy.random.Generator, optional
+      Seed for the random number generator.
+    return_weights : bool (False)
+      If True, also return the weights used for each eigenvector.
 
     Returns
     -------
-    wavelength (shape N), array of spectra [shape (nspec, N)]
+    wavelength (shape N), array of spectra [shape (nspec, N)] and
+    optionally the weights [shape (7, nspec)].
 
-    Memory use might be prohibitive for nspec > ~1e4.
+    See Also
+    --------
+    iter_pca_qso_cont
+      Generate continua in chunks, for large `nspec`.
     """
-    # read the principle components
-    filename = DATAPATH + '/PCAcont/Suzuki05/tab3.txt'
-    names = 'wa,mu,musig,e1,e2,e3,e4,e5,e6,e7,e8,e9,e10'
-    co = readtxt(filename, skip=23, names=names)
-    # use only the first 7 eigenvetors
-    eig = [co['e%i' % i] for i in range(1,8)]
-    # from Suzuki et al 2006.
-    csig = np.array([7.563, 3.604, 2.351, 2.148, 1.586,
-                     1.479, 1.137]) #, 0.778, 0.735, 0.673])
-
-    # generate weights for each eigenvector
-    if seed is not None:  np.random.seed(seed)
-    weights = []
-    for sig in csig:
-        temp = np.random.randn(2*nspec)
-        # make sure we don't have any very large deviations from the mean
-        temp = temp[np.abs(temp) < 3][:nspec]
-        assert len(temp) == nspec
-        weights.append(temp * sig)
-
-    # generate nspec continua. loop over pixels
-    sp = []
-    for i in range(len(co.wa)):
-        sp.append(co.mu[i] + np.sum(w*e[i] for w,e in zip(weights, eig)))
-
-    sp = np.transpose(sp)
+    rng = np.random.default_rng(seed)
+    wa, mu, eig = _read_pca_qso()
+    weights = _pca_qso_weights(int(nspec), rng)
+    sp = mu + np.dot(weights, eig)
+    # a copy, so callers can change it without changing the cache
+    wa = wa.copy()
     if return_weights:
-        return co.wa, sp, weights
+        return wa, sp, weights.T
     else:
-        return co.wa, sp
+        return wa, sp
+
+def iter_pca_qso_cont(nspec, chunksize=10000, seed=None,
+                      return_weights=False):
+    """ Generate qso continua in chunks of at most `chunksize` spectra.
+
+    This takes the same arguments as `pca_qso_cont`, and yields the
+    same output for each chunk. Memory use is set by `chunksize`
+    rather than `nspec`.
+
+    Examples
+    --------
+    >>> for wa, sp in iter_pca_qso_cont(10**6, seed=1):
+    ...     process(wa, sp)
+    """
+    rng = np.random.default_rng(seed)
+    wa, mu, eig = _read_pca_qso()
+    nspec = int(nspec)
+    for i in range(0, nspec, chunksize):
+        weights = _pca_qso_weights(min(chunksize, nspec - i), rng)
+        sp = mu + np.dot(weights, eig)
+        if return_weights:
+            yield wa.copy(), sp, weights.T
+        else:
+            yield wa.copy(), sp
 
 def vac2air_Ciddor(vacw):
     """ Convert vacuum wavelengths in Angstroms to air wavelengths.
@@ -19,3 +19,149 @@ def test_s2dec():
     temp = np.array(s2dec('10 24 27.015', '-10 07 47.50'))
     reference = np.array([156.1125625,-10.129861111111111])
     assert np.all(temp - reference < 1.e-10)
+
+def test_match():
+    # near RA = 0 and the pole
+    ra1 = np.array([0.0001, 359.9999, 10., 100., 200.])
+    dec1 = np.array([0., 0., 89.9999, 89.9999, -20.])
+    ra2 = np.array([359.9998, 0.0002, 190., 200.01])
+    dec2 = np.array([0., 0., 89.9999, -20.])
+    m = match(ra1, dec1, ra2, dec2, 2.)
+    assert m.ind.tolist() == [1, 0, 2, 2, -1]
+    assert m.sep[-1] == -1
+    assert np.allclose(m.sep[:2], [0.36, 0.36])
+    assert np.allclose(m.sep[2:4], 3600 * ang_sep(ra1[2:4], dec1[2:4],
+                                                  ra2[2], dec2[2]))
+    m = match(ra1, dec1, ra2, dec2, 2., allmatches=True)
+    assert [sorted(x.ind) for x in m] == [[0, 1], [0, 1], [2], [2], []]
+    assert m[0].sep[0] <= m[0].sep[1]
+
+def test_SkyIndex():
+    import tempfile, shutil
+    rng = np.random.RandomState(1)
+    ra = rng.uniform(0, 360, 2000)
+    dec = np.degrees(np.arcsin(rng.uniform(-1, 1, 2000)))
+    index = SkyIndex(ra, dec, height=0.5)
+    assert len(index) == 2000
+
+    sep = ang_sep(10., 85., ra, dec)
+    assert index.cone(10., 85., 7.).tolist() == np.flatnonzero(sep < 7).tolist()
+    ra1, dec1 = [0., 120., 359.], [0., -89.5, 30.]
+    sep = ang_sep(ra1, dec1, ra, dec)
+    assert index.count_in_radius(ra1, dec1, 5.).tolist() == \
+        (sep < 5).sum(1).tolist()
+
+    i, ind, s = index.match_all(ra1, dec1, 5 * 3600.)
+    assert np.allclose(s, 3600 * sep[i, ind])
+    assert len(i) == (sep < 5).sum()
+    m = index.match(ra1, dec1, 5 * 3600.)
+    assert np.all(m.ind == ind[i.searchsorted([0, 1, 2])])
+
+    # parallel searches give the same results
+    ra2, dec2 = ra[::7], dec[::7]
+    m2 = index.match_all(ra2, dec2, 3 * 3600., workers=2)
+    for a, b in zip(m2, index.match_all(ra2, dec2, 3 * 3600.)):
+        assert np.all(a == b)
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        index.save(tmpdir + '/index')
+        index1 = SkyIndex.load(tmpdir + '/index')
+        assert isinstance(index1.key, np.memmap)
+        assert index1.height == 0.5
+        assert np.all(index1.match(ra1, dec1, 5 * 3600.) == m)
+        del index1
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_ang_sep_blocks():
+    # small separations keep their precision
+    assert np.allclose(ang_sep(10, 10, 10, 10 + 1e-3 / 3600.) * 3600., 1e-3,
+                       rtol=1e-8, atol=0)
+
+    rng = np.random.RandomState(2)
+    ra1, dec1 = rng.uniform(0, 360, 50), rng.uniform(-90, 90, 50)
+    ra2, dec2 = rng.uniform(0, 360, 70), rng.uniform(-90, 90, 70)
+    sep = ang_sep(ra1, dec1, ra2, dec2)
+    sep1 = np.zeros_like(sep)
+    for i, j, s in ang_sep_blocks(ra1, dec1, ra2, dec2, maxsize=100):
+        assert s.size <= 100
+        sep1[i:i+s.shape[0], j:j+s.shape[1]] = s
+    assert np.all(sep1 == sep)
+
+    ind, s = ang_sep_nearest(ra1, dec1, ra2, dec2, maxsize=30)
+    assert np.all(ind == sep.argmin(1))
+    assert np.all(s == sep.min(1))
+
+    i, j, s = ang_sep_within(ra1, dec1, ra2, dec2, 20.)
+    i1, j1 = np.nonzero(sep < 20)
+    assert np.all(i == i1) and np.all(j == j1)
+    assert np.allclose(s, sep[i1, j1])
+
+def test_group_radec():
+    # a chain of points 1.5 arcsec apart, a close pair and a single
+    # point, in a mixed order
+    dec = np.array([0, 10, 1.5, 20, 4.5, 3, 10.5]) / 3600.
+    ra = np.zeros(len(dec))
+    group, first = group_radec(ra, dec, 2.)
+    assert group.tolist() == [0, 1, 0, 2, 0, 0, 1]
+    assert first.tolist() == [0, 1, 3]
+    iunique, iextras = unique_radec(ra, dec, 2.)
+    assert iunique.tolist() == [0, 1, 3]
+    assert [list(i) for i in iextras] == [[0, 2, 4, 5], [1, 6], [3]]
+
+def test_sexigesimal_arrays():
+    ra = ra_dec2s_array([156.1125638, 359.99999999, 15.], sep=':')
+    assert ra.tolist() == ['10:24:27.015', '00:00:00.000', '01:00:00.000']
+    # 59.9999 arcsec rounds up to the next arcmin
+    dec = dec_dec2s_array([-10.12986, 1 / 60. - 1e-8, -0.], prec=1)
+    assert dec.tolist() == ['-10 07 47.5', '+00 01 00.0', '+00 00 00.0']
+    # the scalar versions carry the same way
+    vals = [156.1125638, 359.99999999, 15. * (1 - 1e-9)]
+    assert [ra_dec2s(r) for r in vals] == ra_dec2s_array(vals).tolist()
+    vals = [-10.12986, 1 / 60. - 1e-8, -1 / 60. + 1e-8, 90.]
+    assert [dec_dec2s(d) for d in vals] == dec_dec2s_array(vals).tolist()
+    assert dec2s(359.99999999, 1 / 60. - 1e-8) == ('00 00 00.000',
+                                                   '+00 01 00.00')
+    assert ra_dec2s(359.99999999, '%02.0f:%02.0f:%04.1f') == '00:00:00.0'
+
+    sra = ['10:12:01.25', '10 14 06.13', '02h59m00.56s']
+    sdec = ['+01:01:45.65', '-00 13 47.02', '-80d10m04.3s']
+    ra, dec = s2dec(sra, sdec)
+    for i in range(3):
+        assert (ra[i], dec[i]) == s2dec(sra[i], sdec[i])
+    # fixed width strings
+    assert np.all(ra_s2dec_array(np.array(sra[:1] * 2, 'S')) == ra[0])
+    assert np.all(dec_s2dec_array(['-00:13:47.02', '+01:01:45.65']) ==
+                  [dec[1], dec[0]])
+
+def test_cone_select():
+    rng = np.random.RandomState(3)
+    ra, dec = rng.uniform(0, 360, 500), rng.uniform(-90, 90, 500)
+    xyz = radec_to_xyz(ra, dec)
+    sep = ang_sep(100., 30., ra, dec)
+    assert np.all(cone_select(ra, dec, 100., 30., 40.) == (sep < 40))
+    c = annulus_select(None, None, 100., 30., 20., 40., xyz=xyz)
+    assert np.all(c == ((sep >= 20) & (sep < 40)))
+
+    c = box_select(ra, dec, 350., 10., -20., 20.)
+    assert np.all(c == (((ra >= 350) | (ra <= 10)) & (np.abs(dec) <= 20)))
+
+    ra0, dec0 = [100., 0., 200.], [30., 90., -85.]
+    sep = ang_sep(ra0, dec0, ra, dec)
+    indptr, ind = cone_search(ra, dec, ra0, dec0, [40., 30., 20.],
+                              rmin=[20., 0., 0.])
+    assert np.all(ind[indptr[0]:indptr[1]] ==
+                  np.flatnonzero((sep[0] >= 20) & (sep[0] < 40)))
+    assert np.all(ind[indptr[1]:indptr[2]] == np.flatnonzero(sep[1] < 30))
+    assert np.all(ind[indptr[2]:indptr[3]] == np.flatnonzero(sep[2] < 20))
+    indptr1, ind1 = cone_search(None, None, ra0, dec0, [40., 30., 20.],
+                                rmin=[20., 0., 0.], index=SkyIndex(ra, dec))
+    assert np.all(indptr1 == indptr) and np.all(ind1 == ind)
+
+    # separations of a milliarcsec are still precise
+    dec = 10 + np.array([0.999e-3, 1.001e-3]) / 3600.
+    assert cone_select([10., 10.], dec, 10., 10., 1e-3 / 3600.).tolist() == \
+           [True, False]
+    assert cone_search([10., 10.], dec, 10., 10., 1e-3 / 3600.)[1].tolist() \
+           == [0]
@@ -8,3 +8,17 @@ def basic_tests():
     LMC_Gordon03(wa, EBmV=0.05)
     LMC2_Gordon03(wa, EBmV=0.05)
     SMC_Gordon03(wa, EBmV=0.05)
+
+def test_curve_cache():
+    from .. import extinction
+    clear_curve_cache()
+    wa = np.arange(900, 22000, 5.)
+    ext1 = SMC_Gordon03(wa, EBmV=0.1)
+    ext2 = SMC_Gordon03(wa.copy(), EBmV=0.2)
+    assert ext2.AlamAv is ext1.AlamAv
+    assert np.allclose(ext2.tau, 2 * ext1.tau)
+    assert not ext1.AlamAv.flags.writeable
+    # different Rv gives a different curve
+    assert not np.allclose(MW_Cardelli89(wa, Rv=3.1).AlamAv,
+                           MW_Cardelli89(wa, Rv=5.0).AlamAv)
+    assert len(extinction._CURVE_CACHE) <= extinction.CURVE_CACHE_SIZE
@@ -1 +1,123 @@
 from ..io import *
+import numpy as np
+
+def test_readtxt():
+    rows = ['# a comment\n',
+            '1 2.5 a\n',
+            '\n',
+            '3 4e1 bb  # another comment\n']
+    i, f, s = readtxt(rows)
+    assert i.dtype.kind == 'i' and list(i) == [1, 3]
+    assert f.dtype.kind == 'f' and list(f) == [2.5, 40.]
+    assert list(s) == ['a', 'bb']
+
+    rec = readtxt(rows, names='x,y,z', usecols=(0,1,2))
+    assert rec.dtype.names == ('x', 'y', 'z')
+    assert list(rec.y) == [2.5, 40.]
+
+    f, i = readtxt(rows, usecols=(1,0), converters={0: float})
+    assert i.dtype.kind == 'f' and list(i) == [1., 3.]
+
+    cols = readtxt(['1, 2, x\n', '3, 4.5, y z\n'], sep=',', arrays=False)
+    assert cols == [[1, 3], [2., 4.5], ['x', 'y z']]
+
+def test_readtxt_ragged():
+    # ragged rows are truncated to the shortest row
+    a, b = readtxt(['1 2 3\n', '4 5\n', '6 7 8\n'])
+    assert list(a) == [1, 4, 6] and list(b) == [2, 5, 7]
+
+def test_readtxt_chunks():
+    fh = ['# comment', 'x y s', '1 2.5 a', '', '2 3.5 bb', '3 4 ccc',
+          '4 5.5 d', '5 6 e']
+    full = readtxt(fh, readnames=True)
+    chunks = list(readtxt(fh, readnames=True, chunksize=2,
+                          dtype={2: 'U3'}))
+    assert [len(c) for c in chunks] == [2, 2, 1]
+    for name in full.dtype.names:
+        vals = np.concatenate([c[name] for c in chunks])
+        assert np.all(vals == full[name])
+    assert chunks[-1].x.dtype.kind == 'i'
+    assert chunks[-1].y.dtype.kind == 'f'
+    c0, c1 = next(readtxt(fh, skip=1, usecols=(0, 2), chunksize=10))
+    assert c0.tolist() == [1, 2, 3, 4, 5]
+    # types are fixed by the first chunk
+    it = readtxt(['1 2', '3 4', '5.5 6'], chunksize=2)
+    next(it)
+    try:
+        next(it)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('expected ValueError')
+    # unless they are given explicitly, and every chunk has the same
+    # types, including the width of string columns
+    rows = ['1 a', '2 bb', '3.5 ccc', '4 d']
+    chunks = list(readtxt(rows, chunksize=2, dtype=(float, 'U5')))
+    assert [c.dtype for c in chunks[0]] == [c.dtype for c in chunks[1]]
+    assert chunks[1][0].tolist() == [3.5, 4.] and chunks[1][1][0] == 'ccc'
+    chunks = list(readtxt(rows, chunksize=2, mintype=float,
+                          dtype={1: 'U3'}))
+    assert chunks[1][1].dtype == np.dtype('U3')
+    it = readtxt(['1 a', '2 bbbb'], chunksize=1)
+    assert next(it)[1].dtype == np.dtype('U1')
+    try:
+        next(it)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('expected ValueError')
+    assert readtxt(['1 2', '3 4'], dtype=(float, 'i4'))[1].dtype == 'i4'
+
+def test_DS9reg():
+    import tempfile, os
+    s = np.rec.fromarrays([[10., 20., 30.], [5., 15., 25.], [21., 19., 22.]],
+                          names=str('X_IMAGE,Y_IMAGE,MAG_AUTO'))
+    fd, filename = tempfile.mkstemp(suffix='.reg')
+    os.close(fd)
+    try:
+        sex_to_DS9reg(filename, s, withtext=True, maglim=21.5,
+                      bounds=(0, 25, 0, 30), chunksize=1)
+        lines = open(filename).read().split('\n')
+        assert lines[1] == 'image'
+        assert lines[2:] == [
+            'point(10.0 5.0) # point=circle text={1 21.00} color=green '
+            'tag={all}',
+            'point(20.0 15.0) # point=circle text={2 19.00} color=green '
+            'tag={all}']
+        header, regions = write_DS9reg([1, 2], [3, 4], size=[5, 6], c='red')
+        assert regions[1] == ('point(  2.00000000,  4.00000000) # point=x 6 '
+                              'width=1 text={1} color=red tag={all}\n')
+        out = write_DS9reg([1, 2], [3, 4], filename=filename, size=[5, 6],
+                           c='red')
+        assert out == (header, regions)
+        assert open(filename).readlines() == header + regions
+        assert write_DS9reg([1, 2], [3, 4], filename=filename, size=[5, 6],
+                            c='red', chunksize=1, stream=True) is None
+        assert open(filename).readlines() == header + regions
+    finally:
+        os.remove(filename)
+
+def test_readsex():
+    import tempfile, shutil, os
+    tmpdir = tempfile.mkdtemp()
+    filename = os.path.join(tmpdir, 'test.cat')
+    try:
+        with open(filename, 'w') as fh:
+            fh.write('#   1 NUMBER     Running object number\n'
+                     '#   2 FLUX_APER  Flux vector     [count]\n'
+                     '#   4 MAG_AUTO   Kron magnitude  [mag]\n'
+                     '#   5 FLAGS      Extraction flags\n'
+                     '         1   10.5  11.5  21.2500   0\n'
+                     '         2   20.5  21.5  22.0000   3\n')
+        s = readsex(filename)
+        assert s.dtype.names == ('NUMBER', 'FLUX_APER', 'MAG_AUTO', 'FLAGS')
+        assert s.NUMBER.dtype.kind == 'i' and s.FLAGS.dtype.kind == 'i'
+        assert s.MAG_AUTO.dtype.kind == 'f'
+        assert s.FLUX_APER.tolist() == [10.5, 20.5]
+        assert s.FLAGS.tolist() == [0, 3]
+        s1 = readsex(filename, cache=True)
+        assert os.path.exists(filename + '.npy')
+        s2 = readsex(filename, cache=True)
+        assert np.all(s1 == s) and np.all(s2 == s)
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,85 @@
+from ..pairs import *
+from ..coord import ang_sep, RAD_PER_DEG
+from ..constants import c_kms
+import numpy as np
+from astropy import cosmology
+
+cosmo = cosmology.WMAP7
+
+def test_pair_counts():
+    rng = np.random.RandomState(4)
+    n1, n2 = 40, 3000
+    ra1, dec1 = rng.uniform(10, 11, n1), rng.uniform(-1, 0, n1)
+    ra2, dec2 = rng.uniform(10, 11, n2), rng.uniform(-1, 0, n2)
+    z1, z2 = rng.uniform(0.2, 0.3, n1), rng.uniform(0.2, 0.3, n2)
+    rbins = [0, 0.5, 1, 2]
+    vbins = [-2000, 0, 2000]
+    region = np.arange(n1) % 5
+
+    # brute force
+    sep = ang_sep(ra1, dec1, ra2, dec2) * RAD_PER_DEG
+    rp = sep * cosmo.angular_diameter_distance(z1).value[:, None]
+    dv = c_kms * (z2 - z1[:, None]) / (1 + z1[:, None])
+    expected = np.zeros((5, 3, 2), int)
+    for k in range(5):
+        c = region == k
+        expected[k] = np.histogram2d(rp[c].ravel(), dv[c].ravel(),
+                                     [rbins, vbins])[0]
+
+    counts = pair_counts(ra1, dec1, z1, ra2, dec2, z2, rbins, vbins, cosmo,
+                         region=region, chunksize=7)
+    assert np.all(counts == expected)
+    counts1 = pair_counts(ra1, dec1, z1, ra2, dec2, z2, rbins, vbins, cosmo)
+    assert np.all(counts1 == expected.sum(0))
+
+    # auto pairs are counted in both orders, without self pairs
+    c = pair_counts(ra1, dec1, z1, ra1, dec1, z1, [0, 100], [-1e5, 1e5],
+                    cosmo, exclude_self=True)
+    assert c[0, 0] == n1 * (n1 - 1)
+
+    nj = jackknife(counts)
+    assert np.all(nj[0] == counts[1:].sum(0))
+    assert np.allclose(jackknife_std([1., 2., 3.]), np.sqrt(4 / 3.))
+    nb = bootstrap(counts, nboot=20, seed=1)
+    assert nb.shape == (20, 3, 2)
+    assert np.allclose(nb.mean(0), counts.sum(0), rtol=0.5)
+
+def test_pair_counts_low_z():
+    rng = np.random.RandomState(5)
+    n = 1500
+    ra, dec = rng.uniform(0, 20, n), rng.uniform(-10, 10, n)
+    z = rng.uniform(0.01, 0.05, n)
+    z0 = z.copy()
+    z0[0] = 0
+    try:
+        pair_counts(ra, dec, z0, ra, dec, z, [0, 1], [-500, 500], cosmo)
+    except ValueError:
+        pass
+    else:
+        assert False
+
+    # at low redshift the search radii are large, so chunks are
+    # limited by the number of candidate pairs
+    import barak.pairs
+    maxpairs = barak.pairs.MAXPAIRS
+    barak.pairs.MAXPAIRS = 20000
+    try:
+        chunks = list(iter_pairs(ra, dec, z, ra, dec, z, 5., 1000., cosmo,
+                                 exclude_self=True))
+    finally:
+        barak.pairs.MAXPAIRS = maxpairs
+    assert len(chunks) > 10
+    i = np.concatenate([c[0] for c in chunks])
+    j = np.concatenate([c[1] for c in chunks])
+    # brute force
+    sep = ang_sep(ra, dec, ra, dec) * RAD_PER_DEG
+    rp = sep * cosmo.angular_diameter_distance(z).value[:, None]
+    dv = c_kms * (z - z[:, None]) / (1 + z[:, None])
+    c = (rp < 5) & (np.abs(dv) <= 1000) & ~np.eye(n, dtype=bool)
+    # distances are interpolated, so pairs very close to rmax can
+    # differ
+    found = set(zip(i.tolist(), j.tolist()))
+    expected = set(zip(*[k.tolist() for k in np.nonzero(c)]))
+    assert len(found) == len(i)
+    assert all(abs(rp[k] - 5) < 1e-4 for k in found ^ expected)
+    assert len(found ^ expected) < 5
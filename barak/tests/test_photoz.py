@@ -0,0 +1,48 @@
+from ..photoz import *
+from ..sed import get_bands, get_SEDs, make_mag_table
+import numpy as np
+
+def test_photoz():
+    bands = get_bands('SDSS', 'u,g,r,i,z')
+    seds = get_SEDs('Assef10', ['E.fits', 'Sbc.fits', 'Im.fits'])
+    z = np.arange(0.05, 2, 0.05)
+    table = make_mag_table(seds, bands, z, cache=False)
+    pz = PhotoZ(table)
+    assert pz.models.shape == (3 * len(z), 5)
+
+    # noiseless fluxes at grid points give the input model back
+    ised = np.array([0, 1, 2, 1])
+    iz = np.array([3, 10, 20, 30])
+    flux = 2.5 * table.flux[ised, 0, iz]
+    err = 0.01 * flux
+    res = pz.fit(flux, err, chunksize=3)
+    assert np.all(res.ised == ised)
+    assert np.all(res.iz == iz)
+    assert np.allclose(res.z, z[iz])
+    assert np.allclose(res.norm, 2.5)
+    assert np.allclose(res.chi2, 0, atol=1e-8)
+    assert res.pdf.shape == (4, len(z))
+    assert np.allclose(np.trapz(res.pdf, z), 1)
+
+    # a missing band is ignored, and an object with no bands is flagged
+    flux[1, 0] = np.nan
+    flux[3] = np.nan
+    res1 = pz.fit(flux, err, return_pdf=False)
+    assert 'pdf' not in res1
+    assert res1.ngood.tolist() == [5, 4, 5, 0]
+    assert res1.iz[1] == iz[1]
+    assert np.isnan(res1.z[3]) and res1.ised[3] == -1
+
+    # a single object
+    res2 = pz.fit(flux[0], err[0])
+    assert res2.iz == iz[0]
+
+    # no objects
+    res3 = pz.fit(np.zeros((0, 5)), np.zeros((0, 5)))
+    assert sorted(res3) == sorted(res)
+    assert res3.z.shape == (0,) and res3.pdf.shape == (0, len(z))
+    assert res3.iz.dtype == res.iz.dtype
+
+    f, e = mag_to_flux([20., 22.], [0.1, 0.1])
+    assert np.allclose(f, [1e-8, 10**-8.8])
+    assert np.allclose(e / f, 0.4 * np.log(10) * 0.1)
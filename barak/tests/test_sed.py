@@ -41,3 +41,80 @@ def test_make_constant_dv_wa_scale():
         1200.56371399,  1200.5989549 ,  1200.63419685,  1200.66943984,
         1200.70468386,  1200.73992891,  1200.775175  ,  1200.81042212,
         1200.84567028,  1200.88091947,  1200.9161697 ,  1200.95142096]))
+
+def test_BatchPhotometry():
+    bands = get_bands('SDSS', 'u,g,r')
+    seds = get_SEDs('pickles', 'A2V.fits,G8IV.fits,M3II.fits')
+    phot = BatchPhotometry(bands, seds[0].wa)
+    fl = phot.resample(seds)
+    assert fl.shape == (3, len(seds[0].wa))
+    for system in ('AB', 'Vega'):
+        mags = phot.mags(fl, system=system)
+        assert mags.shape == (3, 3)
+        expected = [[s.calc_mag(b, system=system) for b in bands]
+                    for s in seds]
+        assert np.allclose(mags, expected)
+    assert np.allclose(phot.fluxes(fl[0]), [seds[0].calc_flux(b)
+                                            for b in bands])
+
+def test_make_mag_table():
+    import tempfile
+    bands = get_bands('SDSS', 'g,r,i')
+    seds = get_SEDs('LBG')
+    z = np.arange(0, 3, 0.25)
+    cachedir = tempfile.mkdtemp()
+    table = make_mag_table(seds, bands, z, cachedir=cachedir)
+    assert table.mags.shape == (2, 1, len(z), 3)
+    for k in (0, 5, 9):
+        seds[1].redshift_to(z[k])
+        expected = [seds[1].calc_mag(b) for b in bands]
+        assert np.allclose(table.mags[1, 0, k], expected, atol=2e-3)
+    table2 = make_mag_table(seds, bands, z, cachedir=cachedir)
+    assert np.all(table2.flux == table.flux)
+    assert table2.labels == table.labels
+    assert np.allclose(table.interp_mag(z[3]), table.mags[:, :, 3])
+    assert table.colour(0, 1, z=[1.1, 1.2]).shape == (2, 1, 2)
+
+def test_passband_cache():
+    b1 = Passband('SDSS/g')
+    b2 = Passband('SDSS/g')
+    assert b1.wa is not b2.wa
+    assert np.all(b1.tr == b2.tr) and b1.flux == b2.flux
+    b2.tr *= 2
+    assert np.all(Passband('SDSS/g').tr == b1.tr)
+
+def test_PhotometricNoise():
+    mags = np.array([[22., 23., np.inf], [24., 24.5, 25.]])
+    noise = PhotometricNoise([25., 25., 25.], nsigma=5, seed=42)
+    obs, err = noise.realise(mags, 5000)
+    assert obs.shape == err.shape == (5000, 2, 3)
+    assert np.allclose(np.median(obs[:, 0, :2], axis=0), [22, 23], atol=0.01)
+    flux, sigma = PhotometricNoise([25.] * 3, seed=42).realise_flux(mags, 5000)
+    assert np.allclose(sigma, 10**(-0.4 * 25) / 5)
+    assert np.allclose(flux.std(axis=0) / sigma, 1, atol=0.05)
+    chunks = list(PhotometricNoise([25.] * 3, seed=42).iter_realise(
+        mags, 5000, chunksize=1200))
+    assert len(chunks) == 5
+    assert np.all(np.concatenate([c[0] for c in chunks]) == obs)
+
+def test_reddened_fluxes():
+    sed = get_SEDs('pickles', 'A2V.fits')
+    sed.redshift_to(0.3)
+    EBmV = [0, 0.1, 0.4]
+    fl = sed.reddened_fluxes('SMC', EBmV)
+    assert fl.shape == (3, len(sed.wa))
+    for f, ebmv in zip(fl, EBmV):
+        assert np.allclose(f, sed.apply_extinction('SMC', ebmv).fl)
+    wa = np.linspace(3000, 8000, 100)
+    fl = sed.reddened_fluxes('MW', EBmV, wa=wa)
+    assert np.allclose(fl[2], np.interp(
+        wa, sed.wa, sed.apply_extinction('MW', 0.4).fl))
+
+def test_qso_template():
+    wa = np.linspace(1000, 9000, 500)
+    z = np.array([0., 1.5, 3.2, 5.])
+    fl = qso_template(wa, z)
+    assert fl.shape == (4, 500)
+    for i in range(len(z)):
+        assert np.allclose(fl[i], qso_template(wa, z[i]))
+    assert np.allclose(qso_template_uv(wa, z)[2], qso_template_uv(wa, 3.2))
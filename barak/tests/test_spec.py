@@ -106,3 +106,82 @@ def test_scale_overlap():
     e0 = f0 / 10.
     e1 = f1 / 10.
     assert np.allclose(scale_overlap(w0, f0, e0, w1, f1, e1), (1.25, 80, 31))
+
+def test_make_index():
+    import os, tempfile
+    names = [DATAPATH + 'tests/' + n for n in (
+        'HE0940m1050m.txt.gz', 'spSpec-52017-0516-139.fit.gz',
+        'runA_h1_100.txt.gz', 'Q2000-330a_b_F.fits')]
+    indexfile = os.path.join(tempfile.mkdtemp(), 'index.npy')
+    index = make_index(names, indexfile)
+    assert index.npts.tolist() == [3731, 3852, 1215, 38752]
+    assert index.format.tolist() == ['ascii', 'fits', 'ascii', 'fits']
+    assert np.allclose(index.wmin[[1, 3]], [3799.26861, 3256.25767])
+    assert np.allclose(index.wmax[[0, 2]], [6087.71005, 2446.09420])
+    assert index.kind[3] == 'loglinear'
+    # ascii scales are found from the first and last lines
+    assert index.kind[[0, 2]].tolist() == ['loglinear', 'linear']
+    assert np.allclose(index.dw[2], 0.0243302)
+    # a gap of a whole number of pixels is found from the file size
+    wa = np.concatenate([np.arange(3000, 3010, 0.1),
+                         np.arange(3020, 3030, 0.1)])
+    gapfile = os.path.join(os.path.dirname(indexfile), 'gap.txt')
+    np.savetxt(gapfile, np.transpose([wa, np.ones(len(wa))]), fmt='%.2f')
+    assert make_index(gapfile).npts[0] == len(wa)
+    os.remove(gapfile)
+    index2 = make_index(names[:2], indexfile)
+    assert index2.filename.tolist() == names[:2]
+    assert np.all(index2.wmin == index.wmin[:2])
+    assert read_index(indexfile).filename.tolist() == names[:2]
+    assert select_index(index, 1548.2 * 3.1).filename.tolist() == [names[1]]
+    os.remove(indexfile)
+
+def test_LightSpectrum():
+    wa = make_wa_scale(3.5, 1e-4, 1000, constantdv=True)
+    fl = np.ones(len(wa))
+    sp = LightSpectrum(wa, fl)
+    assert sp.kind == 'loglinear'
+    assert np.allclose(sp.dw, 1e-4)
+    sp1 = sp.slice(wa[10], wa[20])
+    assert len(sp1) == 11
+    assert sp1.fl.base is fl
+    assert np.isnan(sp1.er).all()
+    sp2 = Spectrum(wa=wa, fl=fl, er=fl).slice(wa[10] - 1e-6, wa[20] + 1e-6)
+    assert np.allclose(sp2.wa, sp1.wa)
+    assert np.allclose(sp2.dv, sp.dv)
+
+def test_WaveGrid():
+    for grid in (WaveGrid(4000, 0.3, 1000),
+                 WaveGrid(3.5, 1e-5, 1000, kind='loglinear')):
+        wa = np.asarray(grid)
+        assert np.all(wa == make_wa_scale(grid.start, grid.step, grid.npts,
+                                          constantdv=grid.kind=='loglinear'))
+        vals = np.concatenate([wa[::7], np.linspace(wa[0] - 1, wa[-1] + 1, 99)])
+        for side in ('left', 'right'):
+            assert np.all(grid.searchsorted(vals, side=side) ==
+                          wa.searchsorted(vals, side=side))
+        assert grid[5] == wa[5] and np.all(grid[10:20] == wa[10:20])
+        assert np.allclose(grid.index(wa[17]), 17)
+
+    sp = Spectrum(wstart=4000, dw=1, npts=500)
+    assert sp.grid is not None and sp.grid.npts == 500
+    assert np.allclose(sp.wa[[0, -1]], [4000, 4499])
+    sp2 = Spectrum(grid=sp.grid)
+    assert sp2.grid is sp.grid and sp2.dw == 1
+
+def test_pca_qso_cont():
+    wa, sp, weights = pca_qso_cont(200, seed=1, return_weights=True)
+    assert sp.shape == (200, len(wa))
+    assert weights.shape == (7, 200)
+    assert (np.abs(weights) < 3 * PCA_QSO_SIGMA[:, None]).all()
+    wa1, sp1 = pca_qso_cont(200, seed=1)
+    assert np.all(sp1 == sp)
+    chunks = list(iter_pca_qso_cont(250, chunksize=100, seed=2))
+    assert [len(c[1]) for c in chunks] == [100, 100, 50]
+    # changing the returned wavelengths doesn't affect later calls
+    wa0 = wa.copy()
+    wa *= 3
+    chunks[0][0][:] = 0
+    wa1, sp1 = pca_qso_cont(1, seed=1)
+    assert np.all(wa1 == wa0)
+    assert np.all(next(iter_pca_qso_cont(1))[0] == wa0)
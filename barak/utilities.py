@@ -429,6 +429,25 @@ def get_data_path():
     """
     return os.path.abspath(__file__).rsplit('/', 1)[0] + '/data/'
 
+def get_cache_path():
+    """ Return the path to a directory for cached results, creating
+    it if necessary.
+
+    This is given by the environment variable BARAK_CACHE if it is
+    set, otherwise it is ~/.barak/cache/.
+    """
+    path = os.environ.get('BARAK_CACHE')
+    if not path:
+        path = os.path.join(os.path.expanduser('~'), '.barak', 'cache')
+    if not os.path.isdir(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            # another process may have just made it
+            if not os.path.isdir(path):
+                raise
+    return path.rstrip('/') + '/'
+
 def indices_from_grid(c, ref):
     """ Convert coordinates to indices defined by grid of reference
     values.